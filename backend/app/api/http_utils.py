@@ -0,0 +1,43 @@
+"""
+Request helpers shared by the routes: opaque listing cursors and
+conditional GET (ETag / Last-Modified) checks.
+"""
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+import base64
+
+from fastapi import HTTPException, Request
+
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor resuming a (created_at, file_id) ordered listing after `doc`."""
+    raw = f"{doc['created_at'].isoformat()}|{doc['file_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, file_id) of a cursor from encode_cursor. Raises a 400 if it is malformed."""
+    try:
+        created_at, file_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), file_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Whether the client's cached copy (If-None-Match / If-Modified-Since) is current.
+    Without last_modified only If-None-Match is honoured.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have whole-second precision
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= since
+    return False
@@ -1,244 +1,327 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from pymongo import MongoClient
-from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks, Body, Request, Response, Query
+from typing import List, Optional
+from email.utils import format_datetime
+import hashlib
+import json
 import uuid
 import os
-import tempfile
-from datetime import datetime
-import asyncio
+from datetime import datetime, timezone
 import logging
 
 from app.config import settings
-from app.models.pydantic_models import FileModel, ChunkModel
+from app.api.http_utils import encode_cursor, decode_cursor, not_modified
+from app.models.pydantic_models import FileModel, ArchiveModel
 from app.services.s3_service import s3_service
-from app.services.text_extract import extract_text
-from app.services.chunking import chunker
-from app.services.embedding import embedding_service
 from app.services.faiss_service import faiss_service
+from app.services.page_store import page_store
+from app.services.executors import run_io, submit_s3
+from app.services.ingestion import (
+    ingest_file, update_file, finish_leg, mark_failed, upload_s3_leg, find_indexed_duplicate, register_duplicate,
+    unshared_faiss_ids, delete_files
+)
+from app.services.archive_ingestion import archive_suffix
+from app.services.job_queue import job_queue
+from app.services.change_counter import TrackedCollection, change_counter
+from app.services.db import get_async_db, metrics_snapshot
+from app.services.upload_stream import receive_upload
+from app.services.rag_service import rag_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # MongoDB
-client = MongoClient(settings.MONGO_URL)
-db = client[settings.MONGO_DB]
-files_col = db['files']
+db = get_async_db()
+files_col = TrackedCollection(db['files'])
 chunks_col = db['chunks']
+archives_col = db['archives']
+
+
+def _client_id(request: Request) -> str:
+    """Key for per-client quotas: the X-Client-Id header, else the caller's address."""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "unknown")
+
+
+async def _admit(client_id: str, jobs: int):
+    """Reject with 429 and Retry-After if `jobs` more queued jobs would exceed
+    the cluster-wide or the client's queue limit.
+    """
+    retry_headers = {"Retry-After": str(settings.INGEST_RETRY_AFTER)}
+    if settings.INGEST_MAX_QUEUED > 0:
+        active = sum((await run_io(job_queue.count_active)).values())
+        if active + jobs > settings.INGEST_MAX_QUEUED:
+            raise HTTPException(
+                status_code=429, headers=retry_headers,
+                detail=f"Ingestion queue is full ({active}/{settings.INGEST_MAX_QUEUED} jobs)"
+            )
+    if settings.INGEST_CLIENT_MAX_QUEUED > 0:
+        active = sum((await run_io(job_queue.count_active, client_id)).values())
+        if active + jobs > settings.INGEST_CLIENT_MAX_QUEUED:
+            raise HTTPException(
+                status_code=429, headers=retry_headers,
+                detail=f"Too many queued files for this client ({active}/{settings.INGEST_CLIENT_MAX_QUEUED} jobs)"
+            )
+
+
+async def _register_duplicate(file_id: str, filename: str, file_type: str, received: dict) -> Optional[dict]:
+    """If the upload's bytes match an indexed file, register it as a duplicate
+    sharing that file's chunks, vectors and S3 object. Returns the upload
+    response, or None if the content is new.
+    """
+    source = await run_io(find_indexed_duplicate, received["content_hash"])
+    if not source:
+        return None
+    
+    await run_io(os.unlink, received["temp_path"])
+    duplicate_of = source.get("duplicate_of") or source["file_id"]
+    chunks_count = await run_io(
+        register_duplicate, source, file_id, filename, file_type, received["size"], received["content_hash"]
+    )
+    
+    return {
+        "file_id": file_id,
+        "filename": filename,
+        "status": "indexed",
+        "chunks_count": chunks_count,
+        "deduplicated": True,
+        "duplicate_of": duplicate_of,
+        "message": "Identical content already indexed; reused its chunks and vectors"
+    }
 
 
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
-    """Upload file and process it."""
+    """Upload file and process it.
+    All blocking work runs on the ingestion executors so the event loop keeps
+    serving other requests and WebSockets while this upload is processed.
+    The S3 copy runs in parallel with ingestion and does not delay the response.
+    """
+    legs_started = False
     try:
         # Generate file ID
         file_id = str(uuid.uuid4())
         file_type = file.filename.split('.')[-1].lower()
         
-        # Save to temp file first
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_type}") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_path = temp_file.name
+        # Stream to a temp file
+        received = await receive_upload(file, f".{file_type}")
+        temp_path = received["temp_path"]
         
-        # Upload to S3
-        s3_key = f"uploads/{file_id}/{file.filename}"
-        s3_path = s3_service.upload_local_file(temp_path, s3_key)
+        # Same bytes already indexed: reuse them instead of re-ingesting
+        duplicate = await _register_duplicate(file_id, file.filename, file_type, received)
+        if duplicate:
+            return duplicate
         
         # Save file metadata
+        s3_key = f"uploads/{file_id}/{file.filename}"
         file_model = FileModel(
             file_id=file_id,
             filename=file.filename,
             file_type=file_type,
-            s3_path=s3_path,
-            size=len(content),
+            s3_path=s3_service.path_for(s3_key),
+            size=received["size"],
+            content_hash=received["content_hash"],
             status="uploaded",
+            s3_status="pending",
+            legs_pending=["s3", "index"],
             created_at=datetime.utcnow(),
             total_page=0
         )
-        files_col.insert_one(file_model.dict())
+        await files_col.insert_one(file_model.dict())
         
-        # Update status to processing
-        files_col.update_one(
-            {"file_id": file_id},
-            {"$set": {"status": "processing"}}
-        )
+        # Copy to S3 in the background while the file is ingested
+        submit_s3(upload_s3_leg, file_id, temp_path, s3_key)
+        legs_started = True
         
-        # Extract text
-        pages = extract_text(temp_path, file_type)
-        
-        # Chunk text
-        chunks = chunker.chunk_document(pages)
-        
-        # Generate embeddings
-        chunk_texts = [chunk[0] for chunk in chunks]
-        embeddings = embedding_service.embed_texts(chunk_texts)
-        
-        # Add to FAISS
-        faiss_ids = faiss_service.add_vectors(embeddings)
-        
-        # Save chunks to MongoDB
-        chunk_models = []
-        for i, (content, title, page_start, page_end) in enumerate(chunks):
-            chunk_model = ChunkModel(
-                chunk_id=str(uuid.uuid4()),
-                file_id=file_id,
-                title=title,
-                content=content,
-                page_start=page_start,
-                page_end=page_end,
-                faiss_index_id=faiss_ids[i],
-                embedding_dim=settings.EMBEDDING_DIM,
-                created_at=datetime.utcnow()
-            )
-            chunk_models.append(chunk_model.dict())
-        
-        if chunk_models:
-            chunks_col.insert_many(chunk_models)
-        
-        # Save FAISS index
-        faiss_service.save()
-        
-        # Update status to indexed
-        files_col.update_one(
-            {"file_id": file_id},
-            {"$set": {"status": "indexed","total_page": len(pages)}}
-        )
-        
-        # Clean up temp file
-        os.unlink(temp_path)
+        # Extract, chunk, embed and index off the event loop
+        result = await run_io(ingest_file, file_id, temp_path, file.filename, file_type)
+        await run_io(finish_leg, file_id, "index", temp_path)
         
         return {
             "file_id": file_id,
             "filename": file.filename,
-            "status": "indexed",
-            "chunks_count": len(chunk_models)
+            "status": result["status"],
+            "chunks_count": result["chunks_count"],
+            "s3_status": "pending",
+            "deduplicated": False
         }
         
     except Exception as e:
         # Update status to failed
         if 'file_id' in locals():
-            files_col.update_one(
-                {"file_id": file_id},
-                {"$set": {"status": "failed", "error": str(e)}}
-            )
+            await run_io(mark_failed, file_id, str(e))
+        if legs_started:
+            await run_io(finish_leg, file_id, "index", temp_path)
+        elif 'temp_path' in locals() and os.path.exists(temp_path):
+            os.unlink(temp_path)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+LIST_FILES_MAX_LIMIT = 1000
+
+
 @router.get("/files")
-async def list_files():
-    """List all uploaded files."""
-    cursor = files_col.find().sort("created_at", -1)
-    files = []
-    for doc in cursor:
-        doc.pop('_id', None)
-        files.append(doc)
-    return {"files": files}
+async def list_files(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=LIST_FILES_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """List uploaded files, newest first, a page at a time.
+    - cursor: next_cursor from the previous page (pages on created_at, then file_id)
+    - status: comma-separated statuses to include, e.g. "queued,processing"
+    - fields: comma-separated fields to return (file_id is always included)
+    Responses carry an ETag / Last-Modified from the files change counter;
+    a matching If-None-Match or If-Modified-Since gets 304 without a query.
+    """
+    version, updated_at = await change_counter.get_async("files")
+    etag = f'W/"files-{version}"'
+    headers = {"ETag": etag, "Last-Modified": format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True)}
+    if not_modified(request, etag, updated_at):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    
+    query = {}
+    if status:
+        query["status"] = {"$in": [s.strip() for s in status.split(",") if s.strip()]}
+    if cursor:
+        created_at, file_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "file_id": {"$lt": file_id}}
+        ]
+    
+    projection = {"_id": 0}
+    requested = None
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()} | {"file_id"}
+        # created_at is needed for the next cursor even if not requested
+        projection.update({field: 1 for field in requested | {"created_at"}})
+    
+    # One extra document tells whether another page follows
+    files = await files_col.find(query, projection).sort(
+        [("created_at", -1), ("file_id", -1)]
+    ).limit(limit + 1).to_list(length=None)
+    next_cursor = encode_cursor(files[limit - 1]) if len(files) > limit else None
+    files = files[:limit]
+    if requested is not None and "created_at" not in requested:
+        for doc in files:
+            doc.pop("created_at", None)
+    return {"files": files, "next_cursor": next_cursor}
 
 
 @router.get("/files/{file_id}")
 async def get_file(file_id: str):
     """Get file details."""
-    file_doc = files_col.find_one({"file_id": file_id})
+    file_doc = await files_col.find_one({"file_id": file_id})
     if not file_doc:
         raise HTTPException(status_code=404, detail="File not found")
     
     file_doc.pop('_id', None)
     
     # Get chunk count
-    chunk_count = chunks_col.count_documents({"file_id": file_id})
+    chunk_count = await chunks_col.count_documents({"file_id": file_id})
     file_doc['chunks_count'] = chunk_count
     
+    if file_doc['status'] == "queued":
+        file_doc['queue_position'] = await run_io(job_queue.queue_position, file_id)
+    
     return file_doc
 
 
-def process_file_background(file_id: str, temp_path: str, filename: str, file_type: str, s3_path: str, file_size: int):
-    """Background task to process file."""
+CHUNK_LOOKUP_MAX_IDS = 200
+
+
+@router.get("/chunks")
+async def get_chunks(request: Request, response: Response,
+                     ids: str = Query(..., description="comma-separated chunk ids")):
+    """Look up cited chunks: text, title, pages and filename.
+    Chat messages store only chunk references; clients hydrate citations here.
+    Titles, pages and filenames change when a file is updated or renamed, so
+    clients must revalidate: the ETag hashes the response, and a matching
+    If-None-Match gets 304.
+    """
+    chunk_ids = [chunk_id.strip() for chunk_id in ids.split(",") if chunk_id.strip()]
+    if len(chunk_ids) > CHUNK_LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {CHUNK_LOOKUP_MAX_IDS} chunk ids per request")
+    chunks = await rag_service.get_chunks(chunk_ids)
+    body = {"chunks": chunks, "missing": [chunk_id for chunk_id in chunk_ids if chunk_id not in chunks]}
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    headers = {"ETag": f'W/"chunks-{digest}"', "Cache-Control": "private, no-cache"}
+    if not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return body
+
+
+@router.put("/files/{file_id}")
+async def update_file_version(file_id: str, file: UploadFile = File(...)):
+    """Replace a file with a new version.
+    Only chunks whose content changed are embedded; unchanged chunks keep their
+    vectors and removed ones are dropped from FAISS.
+    """
+    file_doc = await files_col.find_one({"file_id": file_id})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found")
+    if file_doc['status'] in ("queued", "processing") or await run_io(job_queue.has_active_job, file_id):
+        raise HTTPException(status_code=409, detail="File is being processed")
+    
+    file_type = file.filename.split('.')[-1].lower()
+    received = await receive_upload(file, f".{file_type}")
+    temp_path = received["temp_path"]
+    
+    if received["content_hash"] == file_doc.get("content_hash"):
+        await run_io(os.unlink, temp_path)
+        return {"file_id": file_id, "status": file_doc['status'], "unchanged": True}
+    
+    version = file_doc.get("version", 1) + 1
+    s3_key = f"uploads/{file_id}/v{version}/{file.filename}"
+    await files_col.update_one(
+        {"file_id": file_id},
+        {"$set": {
+            "filename": file.filename,
+            "file_type": file_type,
+            "size": received["size"],
+            "content_hash": received["content_hash"],
+            "s3_path": s3_service.path_for(s3_key),
+            "s3_status": "pending",
+            "legs_pending": ["s3", "index"],
+            "version": version,
+            "status": "processing",
+            "processing_at": datetime.utcnow()
+        }, "$unset": {"error": "", "duplicate_of": ""}}
+    )
+    # Page checkpoints belong to the previous version
+    await run_io(page_store.delete_pages, file_id)
+    submit_s3(upload_s3_leg, file_id, temp_path, s3_key, file_doc['s3_path'])
+    
     try:
-        logger.info(f"Processing file {file_id}: {filename}")
-        
-        # Extract text
-        logger.info(f"Extracting text from {filename}")
-        pages = extract_text(temp_path, file_type)
-        logger.info(f"Extracted {len(pages)} pages")
-        
-        # Chunk text
-        logger.info(f"Chunking document {filename}")
-        chunks = chunker.chunk_document(pages)
-        logger.info(f"Created {len(chunks)} chunks")
-        
-        # Generate embeddings
-        logger.info(f"Generating embeddings for {len(chunks)} chunks")
-        chunk_texts = [chunk[0] for chunk in chunks]
-        embeddings = embedding_service.embed_texts(chunk_texts)
-        logger.info(f"Generated {len(embeddings)} embeddings")
-        
-        # Add to FAISS
-        logger.info(f"Adding {len(embeddings)} vectors to FAISS")
-        faiss_ids = faiss_service.add_vectors(embeddings)
-        logger.info(f"Added vectors with IDs: {faiss_ids[:5] if len(faiss_ids) > 0 else []}")
-        
-        # Save chunks to MongoDB
-        chunk_models = []
-        for i, (content, title, page_start, page_end) in enumerate(chunks):
-            chunk_model = ChunkModel(
-                chunk_id=str(uuid.uuid4()),
-                file_id=file_id,
-                title=title,
-                content=content,
-                page_start=page_start,
-                page_end=page_end,
-                faiss_index_id=faiss_ids[i],
-                embedding_dim=settings.EMBEDDING_DIM,
-                created_at=datetime.utcnow()
-            )
-            chunk_models.append(chunk_model.dict())
-        
-        # Save chunks to MongoDB (only if there are chunks)
-        if chunk_models:
-            logger.info(f"Saving {len(chunk_models)} chunks to MongoDB")
-            chunks_col.insert_many(chunk_models)
-            
-            # Save FAISS index
-            logger.info("Saving FAISS index")
-            faiss_service.save()
-            
-            # Update status to indexed
-            files_col.update_one(
-                {"file_id": file_id},
-                {"$set": {"status": "indexed", "chunks_count": len(chunk_models)}}
-            )
-            
-            logger.info(f"File {filename} processed successfully: {len(chunk_models)} chunks")
-        else:
-            # No chunks extracted - mark as failed
-            logger.warning(f"No chunks extracted from {filename}. Marking as failed.")
-            files_col.update_one(
-                {"file_id": file_id},
-                {"$set": {
-                    "status": "failed", 
-                    "error": "No text content extracted. File may be empty or corrupted.",
-                    "chunks_count": 0
-                }}
-            )
-        
-        # Clean up temp file
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
-        
+        result = await run_io(update_file, file_id, temp_path, file.filename, file_type)
     except Exception as e:
-        logger.error(f"Error processing file {filename}: {str(e)}", exc_info=True)
-        # Update status to failed
-        files_col.update_one(
-            {"file_id": file_id},
-            {"$set": {"status": "failed", "error": str(e)}}
-        )
-        if os.path.exists(temp_path):
-            os.unlink(temp_path)
+        logger.error(f"Error updating file {file_id}: {str(e)}", exc_info=True)
+        await run_io(mark_failed, file_id, str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await run_io(finish_leg, file_id, "index", temp_path)
+    
+    return {"file_id": file_id, "filename": file.filename, "version": version, "unchanged": False, **result}
 
 
 @router.post("/upload/batch")
-async def upload_files_batch(files: List[UploadFile] = File(...), background_tasks: BackgroundTasks = None):
-    """Upload multiple files and process them in background."""
+async def upload_files_batch(request: Request, files: List[UploadFile] = File(...)):
+    """Upload multiple files and queue them for the ingestion workers (python -m app.worker).
+    Admission control: at most INGEST_MAX_BATCH_FILES files per request, and
+    the batch is rejected with 429 + Retry-After if it would push the queue
+    past INGEST_MAX_QUEUED jobs, or this client past INGEST_CLIENT_MAX_QUEUED.
+    """
+    if settings.INGEST_MAX_BATCH_FILES > 0 and len(files) > settings.INGEST_MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.INGEST_MAX_BATCH_FILES} files per batch; got {len(files)}"
+        )
+    client_id = _client_id(request)
+    await _admit(client_id, len(files))
+    
     results = []
     
     for file in files:
@@ -247,41 +330,52 @@ async def upload_files_batch(files: List[UploadFile] = File(...), background_tas
             file_id = str(uuid.uuid4())
             file_type = file.filename.split('.')[-1].lower()
             
-            # Save to temp file first
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_type}") as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_path = temp_file.name
+            # Stream to a temp file
+            received = await receive_upload(file, f".{file_type}")
             
-            # Upload to S3
-            s3_key = f"uploads/{file_id}/{file.filename}"
-            s3_path = s3_service.upload_local_file(temp_path, s3_key)
+            # Same bytes already indexed: reuse them instead of re-ingesting
+            duplicate = await _register_duplicate(file_id, file.filename, file_type, received)
+            if duplicate:
+                results.append(duplicate)
+                continue
             
             # Save file metadata
+            s3_key = f"uploads/{file_id}/{file.filename}"
             file_model = FileModel(
                 file_id=file_id,
                 filename=file.filename,
                 file_type=file_type,
-                s3_path=s3_path,
-                size=len(content),
-                status="processing",
+                s3_path=s3_service.path_for(s3_key),
+                size=received["size"],
+                content_hash=received["content_hash"],
+                status="queued",
+                s3_status="pending",
+                legs_pending=["s3", "index"],
                 created_at=datetime.utcnow(),
                 total_page=0  # Will be updated after processing
             )
-            files_col.insert_one(file_model.dict())
+            await files_col.insert_one(file_model.dict())
             
-            # Add background task for processing
-            if background_tasks:
-                background_tasks.add_task(
-                    process_file_background,
-                    file_id, temp_path, file.filename, file_type, s3_path, len(content)
-                )
+            # Copy to S3 in the background; queue ingestion without waiting for it.
+            # A worker on another host waits for the S3 copy instead.
+            submit_s3(upload_s3_leg, file_id, received["temp_path"], s3_key)
+            job_id = await run_io(job_queue.enqueue, "ingest", {
+                "file_id": file_id,
+                "temp_path": received["temp_path"],
+                "filename": file.filename,
+                "file_type": file_type,
+                "s3_path": file_model.s3_path,
+                "size": received["size"]
+            }, file_id, client_id=client_id)
             
             results.append({
                 "file_id": file_id,
                 "filename": file.filename,
-                "status": "processing",
-                "message": "File uploaded, processing in background"
+                "status": "queued",
+                "job_id": job_id,
+                "queue_position": await run_io(job_queue.queue_position, file_id),
+                "deduplicated": False,
+                "message": "File uploaded, queued for processing"
             })
             
         except Exception as e:
@@ -293,7 +387,142 @@ async def upload_files_batch(files: List[UploadFile] = File(...), background_tas
     
     return {
         "total": len(files),
-        "results": results
+        "results": results,
+        "queue": await run_io(job_queue.count_active)
+    }
+
+
+@router.post("/upload/archive")
+async def upload_archive(request: Request, file: UploadFile = File(...)):
+    """Upload a zip or tar archive of documents and queue it as one job.
+    A worker streams its members through the pipeline with shared embedding
+    batches; GET /archives/{archive_id} reports progress and throughput.
+    """
+    suffix = archive_suffix(file.filename)
+    if not suffix:
+        raise HTTPException(status_code=400, detail="Expected a .zip, .tar, .tar.gz, .tgz, .tar.bz2 or .tar.xz archive")
+    client_id = _client_id(request)
+    await _admit(client_id, 1)
+    
+    archive_id = str(uuid.uuid4())
+    received = await receive_upload(file, suffix)
+    
+    s3_key = f"archives/{archive_id}/{file.filename}"
+    archive_model = ArchiveModel(
+        archive_id=archive_id,
+        filename=file.filename,
+        s3_path=s3_service.path_for(s3_key),
+        size=received["size"],
+        status="processing",
+        s3_status="pending",
+        legs_pending=["s3", "index"],
+        created_at=datetime.utcnow()
+    )
+    await archives_col.insert_one(archive_model.dict())
+    
+    submit_s3(upload_s3_leg, archive_id, received["temp_path"], s3_key, None, "archives")
+    job_id = await run_io(job_queue.enqueue, "archive", {
+        "archive_id": archive_id,
+        "temp_path": received["temp_path"],
+        "filename": file.filename,
+        "suffix": suffix,
+        "s3_path": archive_model.s3_path,
+        "size": received["size"]
+    }, archive_id, client_id=client_id)
+    
+    return {
+        "archive_id": archive_id,
+        "job_id": job_id,
+        "filename": file.filename,
+        "size": received["size"],
+        "status": "processing",
+        "message": "Archive uploaded, processing in background"
+    }
+
+
+@router.get("/archives/{archive_id}")
+async def get_archive(archive_id: str):
+    """Get an archive's status, member counts and throughput."""
+    archive_doc = await archives_col.find_one({"archive_id": archive_id}, {"_id": 0})
+    if not archive_doc:
+        raise HTTPException(status_code=404, detail="Archive not found")
+    archive_doc["files_indexed"] = await files_col.count_documents(
+        {"archive_id": archive_id, "status": "indexed"}
+    )
+    return archive_doc
+
+
+@router.post("/files/{file_id}/resume")
+async def resume_file(file_id: str, request: Request):
+    """Resume ingestion of a failed or interrupted file from its last extracted page."""
+    file_doc = await files_col.find_one({"file_id": file_id})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found")
+    if file_doc['status'] == "indexed":
+        raise HTTPException(status_code=409, detail="File is already indexed")
+    if file_doc.get('s3_status', "uploaded") != "uploaded":
+        raise HTTPException(status_code=409, detail=f"S3 copy is {file_doc['s3_status']}; cannot resume from S3")
+    if await run_io(job_queue.has_active_job, file_id):
+        raise HTTPException(status_code=409, detail="File already has a queued or running job")
+    client_id = _client_id(request)
+    await _admit(client_id, 1)
+    
+    await files_col.update_one(
+        {"file_id": file_id},
+        {"$set": {"status": "queued", "queued_at": datetime.utcnow()}, "$unset": {"error": ""}}
+    )
+    # The original temp file is gone; the worker fetches the durable copy from S3
+    await run_io(job_queue.enqueue, "ingest", {
+        "file_id": file_id,
+        "temp_path": None,
+        "filename": file_doc['filename'],
+        "file_type": file_doc['file_type'],
+        "s3_path": file_doc['s3_path'],
+        "size": file_doc['size']
+    }, file_id, client_id=client_id)
+    
+    return {
+        "file_id": file_id,
+        "status": "queued",
+        "queue_position": await run_io(job_queue.queue_position, file_id),
+        "pages_done": await run_io(page_store.count_pages, file_id)
+    }
+
+
+@router.post("/files/{file_id}/rechunk")
+async def rechunk_file(file_id: str, request: Request, chunk_size: Optional[int] = None,
+                       chunk_overlap: Optional[int] = None):
+    """Re-chunk a file from its stored page text, without re-extraction or OCR."""
+    file_doc = await files_col.find_one({"file_id": file_id})
+    if not file_doc:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    page_count = await run_io(page_store.count_pages, file_id)
+    if page_count == 0:
+        raise HTTPException(status_code=409, detail="No stored page text for this file")
+    
+    # Also covers files ingested inline by the API, which have no job
+    if file_doc['status'] in ("queued", "processing") or await run_io(job_queue.has_active_job, file_id):
+        raise HTTPException(status_code=409, detail="File is being processed")
+    client_id = _client_id(request)
+    await _admit(client_id, 1)
+    
+    await files_col.update_one(
+        {"file_id": file_id},
+        {"$set": {"status": "processing", "processing_at": datetime.utcnow()}}
+    )
+    await run_io(job_queue.enqueue, "rechunk", {
+        "file_id": file_id,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap
+    }, file_id, client_id=client_id)
+    
+    return {
+        "file_id": file_id,
+        "status": "processing",
+        "pages": page_count,
+        "chunk_size": chunk_size or settings.CHUNK_SIZE,
+        "chunk_overlap": chunk_overlap or settings.CHUNK_OVERLAP
     }
 
 
@@ -302,34 +531,47 @@ async def delete_file(file_id: str, background_tasks: BackgroundTasks):
     """Delete file and all associated data including FAISS vectors."""
     try:
         # Check if file exists
-        file_doc = files_col.find_one({"file_id": file_id})
+        file_doc = await files_col.find_one({"file_id": file_id})
         if not file_doc:
             raise HTTPException(status_code=404, detail="File not found")
+        # Its ingestion would go on indexing chunks for the deleted file
+        if file_doc['status'] in ("queued", "processing") or await run_io(job_queue.has_active_job, file_id):
+            raise HTTPException(status_code=409, detail="File is being processed")
         
         # Get all chunk IDs and their FAISS index IDs before deleting
-        chunks_cursor = chunks_col.find({"file_id": file_id})
+        chunks_cursor = chunks_col.find({"file_id": file_id}, {"faiss_index_id": 1})
         faiss_ids = []
         chunk_count = 0
-        for chunk in chunks_cursor:
+        async for chunk in chunks_cursor:
             if "faiss_index_id" in chunk:
                 faiss_ids.append(chunk["faiss_index_id"])
             chunk_count += 1
         
-        logger.info(f"Found {chunk_count} chunks with {len(faiss_ids)} FAISS IDs to remove")
+        logger.info(f"Found {chunk_count} chunks with {len(faiss_ids)} FAISS IDs")
         
-        # Delete from S3
-        try:
-            s3_service.delete_file(file_doc['s3_path'])
-            logger.info(f"Deleted S3 file: {file_doc['s3_path']}")
-        except Exception as e:
-            logger.warning(f"Failed to delete S3 file: {str(e)}")
+        # Delete from S3, unless a deduplicated file still shares the object
+        if await files_col.count_documents({"s3_path": file_doc['s3_path'], "file_id": {"$ne": file_id}}, limit=1):
+            logger.info(f"Keeping S3 file {file_doc['s3_path']}: shared with another file")
+        else:
+            try:
+                await run_io(s3_service.delete_file, file_doc['s3_path'])
+                logger.info(f"Deleted S3 file: {file_doc['s3_path']}")
+            except Exception as e:
+                logger.warning(f"Failed to delete S3 file: {str(e)}")
         
         # Delete chunks from MongoDB
-        chunks_result = chunks_col.delete_many({"file_id": file_id})
+        chunks_result = await chunks_col.delete_many({"file_id": file_id})
         logger.info(f"Deleted {chunks_result.deleted_count} chunks from MongoDB")
         
+        # Vectors shared with a deduplicated file stay in FAISS
+        faiss_ids = await run_io(unshared_faiss_ids, faiss_ids)
+        logger.info(f"{len(faiss_ids)} FAISS IDs to remove")
+        
+        # Delete stored page text
+        await run_io(page_store.delete_pages, file_id)
+        
         # Delete file metadata
-        files_col.delete_one({"file_id": file_id})
+        await files_col.delete_one({"file_id": file_id})
         logger.info(f"Deleted file metadata for {file_id}")
         
         # Remove vectors from FAISS in background
@@ -351,6 +593,23 @@ async def delete_file(file_id: str, background_tasks: BackgroundTasks):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/files/delete")
+async def delete_files_batch(file_ids: List[str] = Body(..., embed=True)):
+    """Delete many files at once: their vectors are removed from FAISS in one
+    pass and the index is saved once; S3 objects go in multi-object deletes.
+    Files still being processed are not deleted; they are listed under "busy".
+    """
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="file_ids is empty")
+    try:
+        result = await run_io(delete_files, list(dict.fromkeys(file_ids)))
+    except Exception as e:
+        logger.error(f"Error deleting {len(file_ids)} files: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return {"message": f"Deleted {result['deleted']} files", **result}
+
+
 def _remove_faiss_vectors_background(faiss_ids: List[int], filename: str):
     """Background task to remove FAISS vectors after file deletion."""
     try:
@@ -374,3 +633,11 @@ async def health():
         "faiss": faiss_stats,
         "db": "connected"
     }
+
+
+@router.get("/metrics/db")
+async def db_metrics():
+    """MongoDB pool and query metrics of this API process, per client (sync / async):
+    open and checked-out connections, pool wait time and per-command latency.
+    """
+    return metrics_snapshot()
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from pymongo import MongoClient
+import asyncio
 import json
 import uuid
 from datetime import datetime
@@ -12,12 +12,13 @@ from app.services.faiss_service import faiss_service
 from app.services.llm_service import llm_service
 from app.services.conversation import conversation_service
 from app.services.rag_service import rag_service
+from app.services.progress import progress_hub
+from app.services.db import get_async_db
 
 router = APIRouter()
 
 # MongoDB
-client = MongoClient(settings.MONGO_URL)
-db = client[settings.MONGO_DB]
+db = get_async_db()
 chunks_col = db['chunks']
 files_col = db['files']
 
@@ -40,10 +41,10 @@ async def websocket_chat(websocket: WebSocket, conversation_id: str):
                 continue
             
             # Get conversation history
-            history = conversation_service.get_history(conversation_id, limit=settings.MAX_HISTORY)
+            history = await conversation_service.get_history(conversation_id, limit=settings.MAX_HISTORY)
             
             # Retrieve contexts with scoped retrieval support
-            contexts, sources = rag_service.retrieve_contexts(
+            contexts, sources = await rag_service.retrieve_contexts(
                 question=question,
                 top_k=settings.TOP_K,
                 file_ids=file_ids  # Can be None for all files, or list of file_ids
@@ -71,7 +72,7 @@ async def websocket_chat(websocket: WebSocket, conversation_id: str):
                 content=question,
                 created_at=datetime.utcnow()
             )
-            conversation_service.add_message(conversation_id, user_msg)
+            await conversation_service.add_message(conversation_id, user_msg)
             
             # Stream answer with citations
             full_answer = ""
@@ -85,7 +86,8 @@ async def websocket_chat(websocket: WebSocket, conversation_id: str):
                 else:
                     await websocket.send_json(chunk)
             
-            # Send sources BEFORE done so frontend can render tooltips
+            # Send sources BEFORE done so frontend can render tooltips.
+            # They are chunk references only; clients fetch the text from GET /chunks
             await websocket.send_json({
                 "type": "sources",
                 "content": [s.dict() for s in sources]
@@ -101,10 +103,48 @@ async def websocket_chat(websocket: WebSocket, conversation_id: str):
                 created_at=datetime.utcnow(),
                 sources=sources
             )
-            conversation_service.add_message(conversation_id, assistant_msg)
+            await conversation_service.add_message(conversation_id, assistant_msg)
             
     except WebSocketDisconnect:
         print(f"Client disconnected from conversation {conversation_id}")
     except Exception as e:
         print(f"WebSocket error: {e}")
         await websocket.send_json({"type": "error", "content": str(e)})
+
+
+PROGRESS_PING_SECONDS = 30
+
+
+@router.websocket("/ws/progress")
+async def websocket_progress(websocket: WebSocket, file_ids: Optional[str] = None):
+    """Push ingestion progress events.
+    file_ids: optional comma-separated filter; all files when omitted.
+    Sends a "snapshot" of the files' current status first, then one
+    "progress" message per event (stage, done, total, eta_seconds).
+    """
+    await websocket.accept()
+    ids = [file_id for file_id in (file_ids or "").split(",") if file_id]
+    queue = progress_hub.subscribe(ids or None)
+    
+    try:
+        # Subscribe before reading the snapshot so no transition is missed in between
+        query = {"file_id": {"$in": ids}} if ids else {"status": {"$in": ["uploaded", "queued", "processing"]}}
+        snapshot = await files_col.find(
+            query, {"_id": 0, "file_id": 1, "status": 1, "chunks_count": 1, "error": 1}
+        ).to_list(length=None)
+        await websocket.send_json({"type": "snapshot", "content": snapshot})
+        
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=PROGRESS_PING_SECONDS)
+            except asyncio.TimeoutError:
+                # Also how a closed connection gets noticed when nothing is happening
+                await websocket.send_json({"type": "ping"})
+                continue
+            await websocket.send_json({"type": "progress", "content": event})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Progress WebSocket error: {e}")
+    finally:
+        progress_hub.unsubscribe(queue)
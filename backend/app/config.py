@@ -7,6 +7,17 @@ class Settings:
     # MongoDB
     MONGO_URL: str = os.getenv("MONGO_URL", "")
     MONGO_DB: str = os.getenv("MONGO_DB", "notebooklm_db")
+    # Connection pool of the shared clients (one sync and one async per process)
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+    # How long a request may wait for a free pooled connection (0 = forever)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+    # Create/verify indexes at startup (refusing to start if one is missing, e.g. duplicate
+    # file_id/chunk_id blocking a unique index), and refuse to start if a hot query plan is a COLLSCAN
+    MONGO_ENSURE_INDEXES: bool = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+    MONGO_CHECK_QUERY_PLANS: bool = os.getenv("MONGO_CHECK_QUERY_PLANS", "true").lower() == "true"
     
     # OpenAI
     OPENAI_API_KEY: str = os.getenv("api_key", "")
@@ -23,6 +34,71 @@ class Settings:
     # Poppler
     POPPLER_PATH: str = os.getenv("POPPLER_PATH", "")
     
+    # PDF text layer backend: pypdf2 | pymupdf | pdfminer | pdftotext
+    PDF_TEXT_BACKEND: str = os.getenv("PDF_TEXT_BACKEND", "pypdf2")
+    
+    # Extraction time budgets in seconds (0 = unlimited)
+    EXTRACT_PAGE_TIMEOUT: float = float(os.getenv("EXTRACT_PAGE_TIMEOUT", "60"))
+    EXTRACT_DOC_TIMEOUT: float = float(os.getenv("EXTRACT_DOC_TIMEOUT", "1800"))
+    # Per-page text layer timeout for thread-based backends (pypdf2). Opt-in:
+    # an overrunning page is abandoned, not stopped, and keeps its thread busy.
+    # pdftotext kills overrunning pages and always uses EXTRACT_PAGE_TIMEOUT.
+    EXTRACT_TEXT_LAYER_TIMEOUT: float = float(os.getenv("EXTRACT_TEXT_LAYER_TIMEOUT", "0"))
+    
+    # Streaming uploads
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))  # bytes read per step
+    S3_PART_SIZE: int = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))  # multipart part size (min 5 MiB)
+    S3_MAX_INFLIGHT_PARTS: int = int(os.getenv("S3_MAX_INFLIGHT_PARTS", "4"))
+    S3_UPLOAD_WORKERS: int = int(os.getenv("S3_UPLOAD_WORKERS", "4"))  # concurrent background S3 copies
+    S3_UPLOAD_RETRIES: int = int(os.getenv("S3_UPLOAD_RETRIES", "3"))
+    
+    # Ingestion executors (keep blocking work off the event loop)
+    INGEST_IO_WORKERS: int = int(os.getenv("INGEST_IO_WORKERS", "8"))
+    INGEST_EXTRACT_WORKERS: int = int(os.getenv("INGEST_EXTRACT_WORKERS", "2"))
+    
+    # Durable job queue: mongo | sqlite (single node)
+    JOB_QUEUE_BACKEND: str = os.getenv("JOB_QUEUE_BACKEND", "mongo")
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BASE_DELAY: float = float(os.getenv("JOB_RETRY_BASE_DELAY", "30"))
+    JOB_RETRY_MAX_DELAY: float = float(os.getenv("JOB_RETRY_MAX_DELAY", "900"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+    JOB_STUCK_AFTER: float = float(os.getenv("JOB_STUCK_AFTER", "3600"))  # seconds in processing without a job
+    # Cluster-wide concurrency limits (0 = unlimited)
+    JOB_OCR_CONCURRENCY: int = int(os.getenv("JOB_OCR_CONCURRENCY", "2"))
+    JOB_EMBED_CONCURRENCY: int = int(os.getenv("JOB_EMBED_CONCURRENCY", "4"))
+    JOB_MAX_RUNNING: int = int(os.getenv("JOB_MAX_RUNNING", "0"))  # jobs running at once, all workers
+    
+    # Admission control for queued ingestion (0 = unlimited)
+    INGEST_MAX_BATCH_FILES: int = int(os.getenv("INGEST_MAX_BATCH_FILES", "100"))  # files per /upload/batch
+    INGEST_MAX_QUEUED: int = int(os.getenv("INGEST_MAX_QUEUED", "1000"))  # queued + running jobs, all clients
+    INGEST_CLIENT_MAX_QUEUED: int = int(os.getenv("INGEST_CLIENT_MAX_QUEUED", "100"))  # queued + running jobs per client
+    INGEST_RETRY_AFTER: int = int(os.getenv("INGEST_RETRY_AFTER", "30"))  # seconds, sent with 429 responses
+    
+    # Progress events (capped collection tailed by /ws/progress)
+    PROGRESS_EVENTS_MAX_MB: int = int(os.getenv("PROGRESS_EVENTS_MAX_MB", "16"))
+    PROGRESS_MIN_INTERVAL: float = float(os.getenv("PROGRESS_MIN_INTERVAL", "0.5"))  # seconds between updates per stage
+    
+    # Archive ingestion (POST /upload/archive)
+    ARCHIVE_EMBED_BATCH: int = int(os.getenv("ARCHIVE_EMBED_BATCH", "256"))  # chunks per shared embedding batch
+    ARCHIVE_CHECKPOINT_CHUNKS: int = int(os.getenv("ARCHIVE_CHECKPOINT_CHUNKS", "2000"))  # chunks between FAISS saves
+    # Uncompressed size caps (zip bombs): a larger member is skipped, a larger archive fails
+    ARCHIVE_MAX_MEMBER_MB: int = int(os.getenv("ARCHIVE_MAX_MEMBER_MB", "200"))
+    ARCHIVE_MAX_TOTAL_MB: int = int(os.getenv("ARCHIVE_MAX_TOTAL_MB", "5120"))
+    
+    # OCR
+    OCR_WORKERS: int = int(os.getenv("OCR_WORKERS", "0"))  # per host, split across processes; 0 = one per CPU core
+    OCR_RENDER_BATCH: int = int(os.getenv("OCR_RENDER_BATCH", "8"))  # max pages per poppler call
+    OCR_RENDER_THREADS: int = int(os.getenv("OCR_RENDER_THREADS", "4"))  # poppler threads per call
+    OCR_ADAPTIVE: bool = os.getenv("OCR_ADAPTIVE", "true").lower() == "true"
+    OCR_TARGET_PIXELS: int = int(os.getenv("OCR_TARGET_PIXELS", "3000"))  # long side of rendered page
+    OCR_MIN_DPI: int = int(os.getenv("OCR_MIN_DPI", "150"))
+    OCR_TILE_PIXELS: int = int(os.getenv("OCR_TILE_PIXELS", "4000"))  # max tile height for large images
+    OCR_PREPROCESS: str = os.getenv("OCR_PREPROCESS", "gray")  # none | gray | binary
+    OCR_FALLBACK_DPI: int = int(os.getenv("OCR_FALLBACK_DPI", "150"))  # retry DPI after a timeout
+    OCR_CACHE_ENABLED: bool = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+    OCR_CACHE_MAX_MB: int = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+    
     # FAISS
     # Prefer environment override. If not set, use a path relative to the backend folder.
     # This makes it easier to move the project and keeps the index inside the repo layout.
@@ -33,13 +109,38 @@ class Settings:
         os.path.join(BACKEND_ROOT, "data", "faiss_index", "notebooklm.index")
     )
     FAISS_INDEX_TYPE: str = "IVF_FLAT"
+    # Seconds between checks for a newer index saved by another process
+    FAISS_REFRESH_INTERVAL: float = float(os.getenv("FAISS_REFRESH_INTERVAL", "2"))
+    # S3 key the index is shared through, for workers on other hosts; empty keeps it
+    # local (API and workers must then share the FAISS_INDEX_PATH directory)
+    FAISS_S3_KEY: str = os.getenv("FAISS_S3_KEY", "faiss/notebooklm.index")
+    
+    # OCR result cache (shared by all OCR worker processes)
+    OCR_CACHE_DIR: str = os.getenv(
+        "OCR_CACHE_DIR",
+        os.path.join(BACKEND_ROOT, "data", "ocr_cache")
+    )
+    
+    # SQLite job queue file (JOB_QUEUE_BACKEND=sqlite)
+    JOB_QUEUE_SQLITE_PATH: str = os.getenv(
+        "JOB_QUEUE_SQLITE_PATH",
+        os.path.join(BACKEND_ROOT, "data", "jobs.db")
+    )
     
     # Chunking
+    VIRTUAL_PAGE_CHARS: int = int(os.getenv("VIRTUAL_PAGE_CHARS", "3000"))  # TXT/DOCX page size
     CHUNK_SIZE: int = 300  # tokens (reduced for free API limit)
     CHUNK_OVERLAP: int = 50  # tokens
     
     # RAG
     TOP_K: int = 3  # reduced from 5 to fit 4096 token limit
     MAX_HISTORY: int = 3  # reduced from 5 to fit 4096 token limit
+    # Chunk texts kept in the per-process cache behind GET /chunks (citation hydration)
+    CHUNK_CACHE_SIZE: int = int(os.getenv("CHUNK_CACHE_SIZE", "5000"))
+    
+    # Conversations: recent messages stay in the conversation document; past
+    # CONVERSATION_INLINE_MESSAGES the oldest move out in buckets of CONVERSATION_BUCKET_SIZE
+    CONVERSATION_INLINE_MESSAGES: int = int(os.getenv("CONVERSATION_INLINE_MESSAGES", "200"))
+    CONVERSATION_BUCKET_SIZE: int = int(os.getenv("CONVERSATION_BUCKET_SIZE", "100"))
 
 settings = Settings()
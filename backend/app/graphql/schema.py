@@ -1,16 +1,16 @@
 import strawberry
 from typing import List, Optional
 from datetime import datetime
-from pymongo import MongoClient
 
-from app.config import settings
+from app.models.pydantic_models import ConversationModel
+from app.services.conversation import conversation_service
+from app.services.rag_service import rag_service
+from app.services.db import get_async_db
 
 # MongoDB
-client = MongoClient(settings.MONGO_URL)
-db = client[settings.MONGO_DB]
+db = get_async_db()
 files_col = db['files']
 chunks_col = db['chunks']
-conversations_col = db['conversations']
 
 
 @strawberry.type
@@ -30,7 +30,18 @@ class Source:
     chunk_id: str
     page_start: int
     page_end: int
-    filename: Optional[str] = None
+    score: Optional[float] = None
+
+
+@strawberry.type
+class Chunk:
+    chunk_id: str
+    file_id: str
+    filename: str
+    title: Optional[str]
+    content: str
+    page_start: int
+    page_end: int
 
 
 @strawberry.type
@@ -55,11 +66,11 @@ class Query:
         return "Hello, GraphQL for NotebookLM"
     
     @strawberry.field
-    def files(self) -> List[File]:
+    async def files(self) -> List[File]:
         """Get all files."""
         cursor = files_col.find().sort("created_at", -1)
         files = []
-        for doc in cursor:
+        async for doc in cursor:
             files.append(File(
                 file_id=doc['file_id'],
                 filename=doc['filename'],
@@ -72,9 +83,9 @@ class Query:
         return files
     
     @strawberry.field
-    def file(self, file_id: str) -> Optional[File]:
+    async def file(self, file_id: str) -> Optional[File]:
         """Get specific file."""
-        doc = files_col.find_one({"file_id": file_id})
+        doc = await files_col.find_one({"file_id": file_id})
         if doc:
             return File(
                 file_id=doc['file_id'],
@@ -88,74 +99,53 @@ class Query:
         return None
     
     @strawberry.field
-    def conversation(self, conversation_id: str) -> Optional[Conversation]:
+    async def chunks(self, chunk_ids: List[str]) -> List[Chunk]:
+        """Cited chunks, to hydrate message sources on demand."""
+        found = await rag_service.get_chunks(chunk_ids)
+        return [Chunk(**found[chunk_id]) for chunk_id in dict.fromkeys(chunk_ids) if chunk_id in found]
+    
+    @strawberry.field
+    async def conversation(self, conversation_id: str) -> Optional[Conversation]:
         """Get conversation by ID."""
-        doc = conversations_col.find_one({"conversation_id": conversation_id})
-        if doc:
-            messages = []
-            for msg in doc.get('messages', []):
-                sources = None
-                if msg.get('sources'):
-                    sources = [
-                        Source(
-                            file_id=s['file_id'],
-                            chunk_id=s['chunk_id'],
-                            page_start=s['page_start'],
-                            page_end=s['page_end'],
-                            filename=s.get('filename')
-                        )
-                        for s in msg['sources']
-                    ]
-                
-                messages.append(Message(
-                    role=msg['role'],
-                    content=msg['content'],
-                    created_at=msg['created_at'].isoformat(),
-                    sources=sources
-                ))
-            
-            return Conversation(
-                conversation_id=doc['conversation_id'],
-                messages=messages,
-                created_at=doc['created_at'].isoformat()
-            )
+        conversation = await conversation_service.get_conversation(conversation_id)
+        if conversation:
+            return _to_conversation(conversation)
         return None
     
     @strawberry.field
-    def conversations(self, limit: int = 10) -> List[Conversation]:
-        """List recent conversations."""
-        cursor = conversations_col.find().sort("created_at", -1).limit(limit)
-        conversations = []
-        for doc in cursor:
-            messages = []
-            for msg in doc.get('messages', []):
-                sources = None
-                if msg.get('sources'):
-                    sources = [
-                        Source(
-                            file_id=s['file_id'],
-                            chunk_id=s['chunk_id'],
-                            page_start=s['page_start'],
-                            page_end=s['page_end'],
-                            filename=s.get('filename')
-                        )
-                        for s in msg['sources']
-                    ]
-                
-                messages.append(Message(
-                    role=msg['role'],
-                    content=msg['content'],
-                    created_at=msg['created_at'].isoformat(),
-                    sources=sources
-                ))
-            
-            conversations.append(Conversation(
-                conversation_id=doc['conversation_id'],
-                messages=messages,
-                created_at=doc['created_at'].isoformat()
-            ))
+    async def conversations(self, limit: int = 10) -> List[Conversation]:
+        """List recent conversations, each with its most recent messages."""
+        return [_to_conversation(c) for c in await conversation_service.list_conversations(limit)]
+
+
+def _to_conversation(conversation: ConversationModel) -> Conversation:
+    messages = []
+    for msg in conversation.messages:
+        sources = None
+        if msg.sources:
+            sources = [
+                Source(
+                    file_id=s.file_id,
+                    chunk_id=s.chunk_id,
+                    page_start=s.page_start,
+                    page_end=s.page_end,
+                    score=s.score
+                )
+                for s in msg.sources
+            ]
         
-        return conversations
+        messages.append(Message(
+            role=msg.role,
+            content=msg.content,
+            created_at=msg.created_at.isoformat(),
+            sources=sources
+        ))
+    
+    return Conversation(
+        conversation_id=conversation.conversation_id,
+        messages=messages,
+        created_at=conversation.created_at.isoformat()
+    )
 
 
 schema = strawberry.Schema(query=Query)
@@ -4,6 +4,10 @@ from strawberry.fastapi import GraphQLRouter
 from app.api import routes_upload, routes_ws
 from app.graphql.schema import schema
 from app.config import settings
+from app.services.executors import shutdown_executors
+from app.services.progress import progress_hub
+from app.services.db import close_clients
+from app.services.indexes import require_indexes, check_query_plans
 import os
 
 # Ensure data directories exist
@@ -29,6 +33,21 @@ graphql_app = GraphQLRouter(schema)
 app.include_router(graphql_app, prefix="/graphql", tags=["graphql"])
 
 
+@app.on_event("startup")
+def startup():
+    if settings.MONGO_ENSURE_INDEXES:
+        require_indexes()
+    if settings.MONGO_CHECK_QUERY_PLANS:
+        check_query_plans()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    progress_hub.stop()
+    shutdown_executors()
+    close_clients()
+
+
 @app.get("/")
 async def root():
     return {"message": "NotebookLM-like API", "version": "1.0.0"}
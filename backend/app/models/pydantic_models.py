@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from datetime import datetime
 
 # files collection
@@ -9,7 +9,15 @@ class FileModel(BaseModel):
     file_type: str
     s3_path: str
     size: int
-    status: str  # uploaded | processing | indexed | failed
+    content_hash: Optional[str] = None  # SHA-256 of the uploaded bytes
+    duplicate_of: Optional[str] = None  # file_id whose chunks/vectors/S3 object this file shares
+    version: int = 1  # bumped by each PUT /files/{file_id}
+    status: str  # uploaded | queued | processing | indexed | failed
+    s3_status: Optional[str] = None  # pending | uploaded | failed
+    legs_pending: List[str] = []  # "s3" / "index" legs still using the temp file
+    archive_id: Optional[str] = None  # set for files ingested from an uploaded archive
+    archive_member: Optional[str] = None  # path of the file inside that archive
+    source: Optional[str] = None  # "bulk" for files created by app.tools.bulk_ingest
     created_at: datetime
     total_page: int = 0  # Default to 0, updated after processing
 
@@ -23,17 +31,26 @@ class ChunkModel(BaseModel):
     page_end: int
     faiss_index_id: int
     embedding_dim: int
+    content_hash: Optional[str] = None  # SHA-256 of content, matches chunks across file versions
+    created_at: datetime
+
+# pages collection (per-page extraction checkpoints)
+class PageModel(BaseModel):
+    file_id: str
+    page_num: int
+    text: str
+    meta: Dict[str, Any] = {}  # quality, char_count, ocr, ocr_lang, fallbacks, ...
     created_at: datetime
 
 # conversations collection
+# A citation: a reference to the chunk only. Chunk text, title and filename
+# are fetched on demand from GET /chunks rather than copied into every message.
 class SourceModel(BaseModel):
     file_id: str
     chunk_id: str
     page_start: int
     page_end: int
-    filename: Optional[str] = None
-    title: Optional[str] = None
-    content: Optional[str] = None  # For hover tooltip display
+    score: Optional[float] = None
 
 class MessageModel(BaseModel):
     role: str  # user | assistant
@@ -43,6 +60,17 @@ class MessageModel(BaseModel):
 
 class ConversationModel(BaseModel):
     conversation_id: str
+    messages: List[MessageModel]  # the most recent messages; older ones are in conversation_messages
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    message_count: int = 0
+    inline_count: int = 0  # len(messages), kept by the server-side updates
+    bucket_count: int = 0  # conversation_messages buckets holding the older messages
+
+# conversation_messages collection (older messages of long conversations, oldest bucket first)
+class MessageBucketModel(BaseModel):
+    conversation_id: str
+    bucket: int
     messages: List[MessageModel]
     created_at: datetime
 
@@ -52,5 +80,38 @@ class FaissMetaModel(BaseModel):
     index_type: str
     embedding_dim: int
     total_vectors: int
+    next_id: int = 0  # next unallocated vector ID, shared by every process
+    version: int = 0  # bumped on each save; processes reload when it moves
     faiss_file_path: str
     last_updated: datetime
+
+# jobs collection (durable ingestion queue)
+class JobModel(BaseModel):
+    job_id: str
+    type: str  # ingest | rechunk | archive
+    file_id: Optional[str] = None
+    client_id: Optional[str] = None  # who enqueued it, for per-client quotas
+    payload: Dict[str, Any] = {}
+    status: str  # queued | running | done | failed
+    stage: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int
+    run_at: datetime
+    lease_until: Optional[datetime] = None
+    worker_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+# archives collection (zip/tar uploads ingested as many files)
+class ArchiveModel(BaseModel):
+    archive_id: str
+    filename: str
+    s3_path: str
+    size: int
+    status: str  # processing | indexed | failed
+    s3_status: Optional[str] = None  # pending | uploaded | failed
+    legs_pending: List[str] = []  # "s3" / "index" legs still using the temp file
+    stats: Dict[str, Any] = {}  # member counts, pages, chunks, bytes and throughput of the last run
+    created_at: datetime
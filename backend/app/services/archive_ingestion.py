@@ -0,0 +1,459 @@
+"""
+Archive ingestion: one zip/tar upload becomes many indexed files.
+
+Members are streamed out of the archive one at a time (never extracted
+wholesale), spooled to their own temp file, extracted in the extraction
+process pool a few at a time, and their chunks are embedded in shared
+batches across files so small documents fill embedding requests together.
+The FAISS index is saved every ARCHIVE_CHECKPOINT_CHUNKS chunks rather than
+per file. Runs as an "archive" job in app.worker.
+
+Members count against uncompressed size caps (ARCHIVE_MAX_MEMBER_MB,
+ARCHIVE_MAX_TOTAL_MB), checked on the sizes the archive declares and on
+the bytes actually read. Members with the same content are extracted once.
+"""
+from concurrent.futures import Future
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import tarfile
+import tempfile
+import time
+import uuid
+import zipfile
+
+from app.config import settings
+from app.models.pydantic_models import FileModel
+from app.services.executors import submit_extract, submit_s3
+from app.services.faiss_service import faiss_service
+from app.services.ingestion import (
+    db, files_col, index_chunk_batch, remove_chunks, record_degraded_pages, OCR_FILE_TYPES,
+    find_indexed_duplicate, register_duplicate, upload_s3_leg, finish_leg, mark_failed
+)
+from app.services.job_queue import global_slot
+from app.services.page_extraction import extract_and_chunk
+from app.services.progress import progress_publisher
+from app.services.s3_service import s3_service
+
+logger = logging.getLogger(__name__)
+
+archives_col = db['archives']
+
+ARCHIVE_SUFFIXES = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".zip", ".tar")
+
+# Member types the extractors handle; anything else in the archive is skipped
+MEMBER_FILE_TYPES = {"pdf", "txt", "docx", "doc", "jpg", "jpeg", "png", "bmp", "tif", "tiff"}
+
+
+class SizeLimitExceeded(ValueError):
+    """A member or the archive is larger uncompressed than allowed."""
+
+
+def archive_suffix(filename: str) -> Optional[str]:
+    """The archive suffix of filename (".zip", ".tar.gz", ...), or None."""
+    lower = filename.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix):
+            return suffix
+    return None
+
+
+def _is_document(member_name: str) -> bool:
+    parts = member_name.replace("\\", "/").split("/")
+    if "__MACOSX" in parts or parts[-1].startswith("."):
+        return False
+    return parts[-1].rsplit(".", 1)[-1].lower() in MEMBER_FILE_TYPES
+
+
+def _zip_documents(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    return [info for info in zf.infolist() if not info.is_dir() and _is_document(info.filename)]
+
+
+def count_documents(archive_path: str) -> Optional[int]:
+    """Number of document members, read from a zip's central directory.
+    None for tar archives, which can only be counted by reading them through.
+    """
+    if not zipfile.is_zipfile(archive_path):
+        return None
+    with zipfile.ZipFile(archive_path) as zf:
+        return len(_zip_documents(zf))
+
+
+def declared_document_bytes(archive_path: str) -> Optional[int]:
+    """Uncompressed size of the document members as a zip's central directory
+    declares it (the bytes read may differ). None for tar archives.
+    """
+    if not zipfile.is_zipfile(archive_path):
+        return None
+    with zipfile.ZipFile(archive_path) as zf:
+        return sum(info.file_size for info in _zip_documents(zf))
+
+
+def iter_documents(archive_path: str) -> Iterator[Tuple[str, IO[bytes], int]]:
+    """Yield (member_name, stream, declared_size) for each document member, in
+    archive order. Each stream must be consumed before advancing: tar archives
+    (compressed or not) are read sequentially, with no seeking back.
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in _zip_documents(zf):
+                with zf.open(info) as stream:
+                    yield info.filename, stream, info.file_size
+        return
+
+    with tarfile.open(archive_path, "r|*") as tf:
+        for member in tf:
+            if not member.isfile() or not _is_document(member.name):
+                continue
+            stream = tf.extractfile(member)
+            yield member.name, stream, member.size
+
+
+def _spool(stream: IO[bytes], suffix: str, max_bytes: int) -> Tuple[str, int, str]:
+    """Copy a member stream to a temp file. Returns temp_path, size and SHA-256.
+    Raises SizeLimitExceeded (leaving no temp file) past max_bytes.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        while True:
+            chunk = stream.read(settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            hasher.update(chunk)
+            temp_file.write(chunk)
+    if size > max_bytes:
+        os.unlink(temp_file.name)
+        raise SizeLimitExceeded(f"more than {max_bytes} bytes uncompressed")
+    return temp_file.name, size, hasher.hexdigest()
+
+
+class ArchiveIngestion:
+    """One run over an archive. Keeps up to a few members in extraction and a
+    shared batch of chunks (from any number of files) waiting for embedding.
+    Files are marked indexed only after the FAISS save that covers them.
+    """
+
+    def __init__(self, archive_id: str, archive_path: str):
+        self.archive_id = archive_id
+        self.archive_path = archive_path
+        self.extract_window = max(1, settings.INGEST_EXTRACT_WORKERS * 2)
+        self.s3_window = max(1, settings.S3_UPLOAD_WORKERS * 2)
+
+        self.extracting: deque = deque()  # (file, Future) in archive order
+        self.s3_futures: List[Future] = []
+        self.batch: List[Tuple[str, tuple]] = []  # (file_id, chunk) awaiting embedding
+        self.files: Dict[str, dict] = {}  # file_id -> file state, until marked indexed
+        self.chunks_since_save = 0
+        self.first_by_hash: Dict[str, str] = {}  # content_hash -> file_id extracted in this run
+        self.duplicates: Dict[str, List[dict]] = {}  # file_id -> members waiting for it to be indexed
+        self.max_member_bytes = settings.ARCHIVE_MAX_MEMBER_MB * 1024 * 1024
+        self.max_total_bytes = settings.ARCHIVE_MAX_TOTAL_MB * 1024 * 1024
+
+        self.total = count_documents(archive_path)
+        self.stats = {
+            "members": 0, "indexed": 0, "deduplicated": 0, "skipped": 0, "rejected": 0, "failed": 0,
+            "pages": 0, "chunks": 0, "bytes": 0
+        }
+        self.started = time.monotonic()
+
+    def run(self) -> dict:
+        """Ingest every document member. Raises if the archive itself cannot be read;
+        members that fail are marked failed and the run goes on.
+        Returns the run statistics.
+        """
+        try:
+            declared = declared_document_bytes(self.archive_path)
+            if declared is not None and declared > self.max_total_bytes:
+                raise SizeLimitExceeded(f"Archive declares {declared} bytes of documents uncompressed, "
+                                        f"more than ARCHIVE_MAX_TOTAL_MB ({settings.ARCHIVE_MAX_TOTAL_MB})")
+            for member_name, stream, declared_size in iter_documents(self.archive_path):
+                self.stats["members"] += 1
+                self._add_member(member_name, stream, declared_size)
+                while len(self.extracting) >= self.extract_window:
+                    self._collect(*self.extracting.popleft())
+            while self.extracting:
+                self._collect(*self.extracting.popleft())
+
+            self._flush()
+            self._checkpoint()
+        except Exception:
+            self._release_in_flight()
+            raise
+        for future in self.s3_futures:
+            future.result()
+        self._register_duplicates()
+        return self._finish()
+
+    def _add_member(self, member_name: str, stream: IO[bytes], declared_size: int):
+        filename = os.path.basename(member_name)
+        file_type = filename.rsplit(".", 1)[-1].lower()
+        existing = files_col.find_one({"archive_id": self.archive_id, "archive_member": member_name})
+        if existing and existing["status"] == "indexed":
+            # Done by an earlier attempt of this job
+            self.stats["skipped"] += 1
+            self._file_done()
+            return
+
+        if declared_size > self.max_member_bytes:
+            self._reject(member_name, f"declares {declared_size} bytes uncompressed")
+            return
+        # Declared sizes can lie: the bytes actually read count too
+        total_left = self.max_total_bytes - self.stats["bytes"]
+        try:
+            temp_path, size, content_hash = _spool(stream, f".{file_type}", min(self.max_member_bytes, total_left))
+        except SizeLimitExceeded as e:
+            if total_left <= self.max_member_bytes:
+                raise SizeLimitExceeded(f"Archive holds more than ARCHIVE_MAX_TOTAL_MB "
+                                        f"({settings.ARCHIVE_MAX_TOTAL_MB}) of documents uncompressed")
+            self._reject(member_name, str(e))
+            return
+        self.stats["bytes"] += size
+        members = {"archive_id": self.archive_id, "archive_member": member_name}
+
+        source = find_indexed_duplicate(content_hash)
+        if source and not existing:
+            os.unlink(temp_path)
+            file_id = str(uuid.uuid4())
+            register_duplicate(source, file_id, filename, file_type, size, content_hash, **members)
+            self.stats["deduplicated"] += 1
+            self._file_done()
+            return
+
+        if content_hash in self.first_by_hash and not existing:
+            # Same bytes as an earlier member: clone it once that one is indexed and in S3
+            os.unlink(temp_path)
+            self.duplicates.setdefault(self.first_by_hash[content_hash], []).append(dict(
+                filename=filename, file_type=file_type, size=size, content_hash=content_hash, **members
+            ))
+            return
+
+        if existing:
+            # Left partially indexed by an earlier attempt: start its chunks over
+            file_id = existing["file_id"]
+            remove_chunks(file_id)
+            s3_path = existing["s3_path"]
+            s3_uploaded = existing.get("s3_status") == "uploaded"
+            files_col.update_one(
+                {"file_id": file_id},
+                {"$set": {
+                    "status": "processing",
+                    "processing_at": datetime.utcnow(),
+                    "legs_pending": ["index"] if s3_uploaded else ["s3", "index"]
+                }, "$unset": {"error": ""}}
+            )
+        else:
+            file_id = str(uuid.uuid4())
+            s3_path = s3_service.path_for(f"uploads/{file_id}/{filename}")
+            s3_uploaded = False
+            file_model = FileModel(
+                file_id=file_id,
+                filename=filename,
+                file_type=file_type,
+                s3_path=s3_path,
+                size=size,
+                content_hash=content_hash,
+                status="processing",
+                s3_status="pending",
+                legs_pending=["s3", "index"],
+                created_at=datetime.utcnow(),
+                total_page=0,
+                **members
+            )
+            files_col.insert_one(file_model.dict())
+
+        if not s3_uploaded:
+            self._submit_s3(file_id, temp_path, s3_service.key_from_path(s3_path))
+
+        self.first_by_hash.setdefault(content_hash, file_id)
+        file = {"file_id": file_id, "filename": filename, "temp_path": temp_path, "pending_chunks": 0}
+        if file_type in OCR_FILE_TYPES:
+            file["ocr_slot"] = self._take_ocr_slot()
+        self.extracting.append((file, submit_extract(extract_and_chunk, file_id, temp_path, file_type)))
+
+    def _take_ocr_slot(self) -> ExitStack:
+        """Hold an "ocr" slot while one member is extracted, so other jobs get
+        theirs between members. Waits for a free slot only while this run
+        holds none; otherwise it collects its oldest member instead, since
+        members in flight here must finish to release their slots.
+        """
+        while True:
+            slot = ExitStack()
+            blocking = not any(file.get("ocr_slot") for file, _ in self.extracting)
+            if slot.enter_context(global_slot("ocr", settings.JOB_OCR_CONCURRENCY, blocking=blocking)):
+                return slot
+            slot.close()
+            self._collect(*self.extracting.popleft())
+
+    def _release_ocr_slot(self, file: dict):
+        slot = file.pop("ocr_slot", None)
+        if slot is not None:
+            slot.close()
+
+    def _submit_s3(self, file_id: str, temp_path: str, s3_key: str):
+        # Member temp files live until their S3 copy is done; keep that bounded
+        self.s3_futures = [future for future in self.s3_futures if not future.done()]
+        while len(self.s3_futures) >= self.s3_window:
+            self.s3_futures.pop(0).result()
+        self.s3_futures.append(submit_s3(upload_s3_leg, file_id, temp_path, s3_key))
+
+    def _collect(self, file: dict, future: Future):
+        file_id = file["file_id"]
+        try:
+            extracted = future.result()
+            record_degraded_pages(file_id)
+            chunks = extracted["chunks"]
+        except Exception as e:
+            logger.error(f"Archive {self.archive_id}: extracting {file['filename']} failed: {e}")
+            self._fail_file(file, str(e))
+            return
+        finally:
+            self._release_ocr_slot(file)
+
+        if not chunks:
+            self._fail_file(file, "No text content extracted. File may be empty or corrupted.")
+            return
+
+        file.update(pages=extracted["pages"], chunks=len(chunks), pending_chunks=len(chunks))
+        self.files[file_id] = file
+        self.stats["pages"] += extracted["pages"]
+        for chunk in chunks:
+            self.batch.append((file_id, chunk))
+            if len(self.batch) >= settings.ARCHIVE_EMBED_BATCH:
+                self._flush()
+        if self.chunks_since_save >= settings.ARCHIVE_CHECKPOINT_CHUNKS:
+            self._checkpoint()
+
+    def _flush(self):
+        """Embed and index the shared batch."""
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        index_chunk_batch(batch)
+        for file_id, _ in batch:
+            self.files[file_id]["pending_chunks"] -= 1
+        self.chunks_since_save += len(batch)
+        self.stats["chunks"] += len(batch)
+
+    def _checkpoint(self):
+        """Save FAISS, then mark the files whose chunks are all in it as indexed."""
+        ready = [file for file in self.files.values() if file["pending_chunks"] == 0]
+        if not ready:
+            return
+        faiss_service.save()
+        self.chunks_since_save = 0
+        for file in ready:
+            del self.files[file["file_id"]]
+            files_col.update_one(
+                {"file_id": file["file_id"]},
+                {"$set": {"status": "indexed", "chunks_count": file["chunks"], "total_page": file["pages"]}}
+            )
+            progress_publisher.finish(file["file_id"], "indexed", chunks_count=file["chunks"])
+            finish_leg(file["file_id"], "index", file["temp_path"])
+            self.stats["indexed"] += 1
+            self._file_done()
+        logger.info(f"Archive {self.archive_id}: checkpoint, {self.stats['indexed']} files indexed")
+
+    def _release_in_flight(self):
+        """Drop the index leg of files left unfinished by a failed run. They stay
+        in processing; a retry of the job picks them up again from their pages.
+        """
+        for file, future in self.extracting:
+            future.cancel()
+            self._release_ocr_slot(file)
+            self.files.setdefault(file["file_id"], file)
+        self.extracting.clear()
+        for file in self.files.values():
+            finish_leg(file["file_id"], "index", file["temp_path"])
+
+    def _fail_file(self, file: dict, error: str):
+        mark_failed(file["file_id"], error)
+        finish_leg(file["file_id"], "index", file["temp_path"])
+        self.stats["failed"] += 1
+        self._file_done()
+        for duplicate in self.duplicates.pop(file["file_id"], []):
+            logger.warning(f"Archive {self.archive_id}: {duplicate['archive_member']} has the same content "
+                           f"as {file['filename']}, which failed")
+            self.stats["failed"] += 1
+            self._file_done()
+
+    def _register_duplicates(self):
+        """Clone the members of this archive that have the same content as an
+        earlier one, once that one is indexed and its S3 copy is done.
+        """
+        for file_id, waiting in self.duplicates.items():
+            source = files_col.find_one({"file_id": file_id})
+            usable = (source and source["status"] == "indexed"
+                      and source.get("s3_status", "uploaded") == "uploaded")
+            for duplicate in waiting:
+                if usable:
+                    register_duplicate(source, str(uuid.uuid4()), **duplicate)
+                    self.stats["deduplicated"] += 1
+                else:
+                    logger.warning(f"Archive {self.archive_id}: {duplicate['archive_member']} has the same "
+                                   f"content as {file_id}, which has no indexed S3 copy")
+                    self.stats["failed"] += 1
+                self._file_done()
+        self.duplicates.clear()
+
+    def _reject(self, member_name: str, reason: str):
+        logger.warning(f"Archive {self.archive_id}: skipping {member_name}, larger than "
+                       f"ARCHIVE_MAX_MEMBER_MB ({settings.ARCHIVE_MAX_MEMBER_MB}): {reason}")
+        self.stats["rejected"] += 1
+        self._file_done()
+
+    def _file_done(self):
+        done = (self.stats["indexed"] + self.stats["deduplicated"] + self.stats["skipped"]
+                + self.stats["rejected"] + self.stats["failed"])
+        progress_publisher.publish(self.archive_id, "files", done, self.total)
+
+    def _finish(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        stats = dict(
+            self.stats,
+            elapsed_seconds=round(elapsed, 1),
+            files_per_second=round((self.stats["indexed"] + self.stats["deduplicated"]) / elapsed, 2),
+            pages_per_second=round(self.stats["pages"] / elapsed, 2),
+            chunks_per_second=round(self.stats["chunks"] / elapsed, 2),
+            mb_per_second=round(self.stats["bytes"] / (1024 * 1024) / elapsed, 2)
+        )
+        logger.info(
+            f"Archive {self.archive_id}: {stats['members']} members in {stats['elapsed_seconds']}s "
+            f"({stats['indexed']} indexed, {stats['deduplicated']} deduplicated, {stats['skipped']} skipped, "
+            f"{stats['rejected']} too large, {stats['failed']} failed); {stats['files_per_second']} files/s, "
+            f"{stats['pages_per_second']} pages/s, {stats['chunks_per_second']} chunks/s, {stats['mb_per_second']} MB/s"
+        )
+        return stats
+
+
+def ingest_archive(archive_id: str, archive_path: str) -> dict:
+    """Ingest every document in an uploaded archive and record the run's
+    throughput on the archive document. Raises on failure.
+    Returns the run statistics.
+    """
+    archives_col.update_one(
+        {"archive_id": archive_id},
+        {"$set": {"status": "processing", "processing_at": datetime.utcnow()}, "$unset": {"error": ""}}
+    )
+    stats = ArchiveIngestion(archive_id, archive_path).run()
+    archives_col.update_one(
+        {"archive_id": archive_id},
+        {"$set": {"status": "indexed", "stats": stats}}
+    )
+    progress_publisher.finish(archive_id, "indexed", **stats)
+    return stats
+
+
+def mark_archive_failed(archive_id: str, error: str):
+    archives_col.update_one(
+        {"archive_id": archive_id},
+        {"$set": {"status": "failed", "error": error}}
+    )
+    progress_publisher.finish(archive_id, "failed", error=error)
@@ -0,0 +1,109 @@
+"""
+Change counters for collections whose listings clients cache.
+
+Every write to a tracked collection bumps a per-collection version in the
+`change_counters` collection, so an unchanged listing can be answered with
+304 from its ETag (the version) or Last-Modified (time of the last bump)
+without reading the collection itself.
+"""
+from pymongo import ReturnDocument
+from datetime import datetime
+from typing import Tuple
+import functools
+import inspect
+import logging
+
+from app.services.db import get_db, get_async_db
+
+logger = logging.getLogger(__name__)
+
+# pymongo Collection methods that modify documents
+WRITE_METHODS = {
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "delete_one", "delete_many", "bulk_write",
+    "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+}
+
+
+class ChangeCounter:
+    COLLECTION = 'change_counters'
+
+    @staticmethod
+    def _bump_args(name: str) -> tuple:
+        return {"_id": name}, {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}}
+
+    @staticmethod
+    def _get_args(name: str) -> tuple:
+        return {"_id": name}, {"$setOnInsert": {"version": 0, "updated_at": datetime.utcnow()}}
+
+    def bump(self, name: str):
+        try:
+            get_db()[self.COLLECTION].update_one(*self._bump_args(name), upsert=True)
+        except Exception as e:
+            # A missed bump only means a stale cached listing; never fail the write for it
+            logger.warning(f"Failed to bump change counter {name}: {e}")
+
+    async def bump_async(self, name: str):
+        try:
+            await get_async_db()[self.COLLECTION].update_one(*self._bump_args(name), upsert=True)
+        except Exception as e:
+            logger.warning(f"Failed to bump change counter {name}: {e}")
+
+    def get(self, name: str) -> Tuple[int, datetime]:
+        """(version, updated_at) of name. A plain read; the counter is only
+        written (created) the first time it is read.
+        """
+        collection = get_db()[self.COLLECTION]
+        doc = collection.find_one({"_id": name})
+        if doc is None:
+            doc = collection.find_one_and_update(
+                *self._get_args(name), upsert=True, return_document=ReturnDocument.AFTER
+            )
+        return doc["version"], doc["updated_at"]
+
+    async def get_async(self, name: str) -> Tuple[int, datetime]:
+        collection = get_async_db()[self.COLLECTION]
+        doc = await collection.find_one({"_id": name})
+        if doc is None:
+            doc = await collection.find_one_and_update(
+                *self._get_args(name), upsert=True, return_document=ReturnDocument.AFTER
+            )
+        return doc["version"], doc["updated_at"]
+
+
+change_counter = ChangeCounter()
+
+
+class TrackedCollection:
+    """Wraps a pymongo or motor collection so every write bumps its change
+    counter. Reads and everything else are passed through unchanged.
+    """
+
+    def __init__(self, collection, name: str = None):
+        self._collection = collection
+        self._name = name or collection.name
+
+    def __getattr__(self, attr: str):
+        value = getattr(self._collection, attr)
+        if attr not in WRITE_METHODS:
+            return value
+
+        @functools.wraps(value)
+        def write(*args, **kwargs):
+            try:
+                result = value(*args, **kwargs)
+            except Exception:
+                change_counter.bump(self._name)
+                raise
+            if not inspect.isawaitable(result):
+                change_counter.bump(self._name)
+                return result
+            return self._bump_after(result)
+        return write
+
+    async def _bump_after(self, pending):
+        # motor: bump once the write has actually run
+        try:
+            return await pending
+        finally:
+            await change_counter.bump_async(self._name)
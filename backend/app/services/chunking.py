@@ -1,5 +1,5 @@
 import re
-from typing import List, Tuple, Optional
+from typing import Iterable, List, Tuple, Optional
 from app.config import settings
 import logging
 from langchain_text_splitters import RecursiveCharacterTextSplitter
@@ -63,10 +63,10 @@ class TextChunker:
         logger.info(f"Page {page_num}: Created {len(chunks)} chunks from {len(text)} chars")
         return chunks
     
-    def chunk_document(self, pages: List[Tuple[int, str]]) -> List[Tuple[str, Optional[str], int, int]]:
+    def chunk_document(self, pages: Iterable[Tuple[int, str]]) -> List[Tuple[str, Optional[str], int, int]]:
         """
         Chunk entire document.
-        Args: pages - List of (page_num, text) tuples
+        Args: pages - (page_num, text) tuples; an iterator is consumed page by page
         Returns: List of (content, title, page_start, page_end) tuples
         """
         all_chunks = []
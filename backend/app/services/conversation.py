@@ -1,67 +1,142 @@
-from pymongo import MongoClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from typing import List, Optional
 from datetime import datetime
 from app.config import settings
-from app.models.pydantic_models import ConversationModel, MessageModel
+from app.services.db import get_async_db
+from app.models.pydantic_models import ConversationModel, MessageModel, MessageBucketModel
 
 
 class ConversationService:
+    """Conversations keep their most recent messages inline, so a chat turn
+    reads and writes one bounded document. Once a conversation holds more
+    than CONVERSATION_INLINE_MESSAGES inline, the oldest
+    CONVERSATION_BUCKET_SIZE move to a `conversation_messages` bucket.
+    """
+
     def __init__(self):
-        self.client = MongoClient(settings.MONGO_URL)
-        self.db = self.client[settings.MONGO_DB]
+        self.db = get_async_db()
         self.conversations = self.db['conversations']
-    
-    def create_conversation(self, conversation_id: str) -> ConversationModel:
+        self.buckets = self.db['conversation_messages']
+
+    async def create_conversation(self, conversation_id: str) -> ConversationModel:
         """Create new conversation."""
         conversation = ConversationModel(
             conversation_id=conversation_id,
             messages=[],
             created_at=datetime.utcnow()
         )
-        self.conversations.insert_one(conversation.dict())
+        await self.conversations.insert_one(conversation.dict())
         return conversation
-    
-    def add_message(self, conversation_id: str, message: MessageModel):
-        """Add message to conversation."""
-        # Check if conversation exists
-        existing = self.get_conversation(conversation_id)
-        
-        if not existing:
-            # Create new conversation first
-            self.create_conversation(conversation_id)
-        
-        # Then add message
-        self.conversations.update_one(
+
+    async def add_message(self, conversation_id: str, message: MessageModel):
+        """Add message to conversation, creating the conversation on first use."""
+        now = datetime.utcnow()
+        doc = await self.conversations.find_one_and_update(
             {"conversation_id": conversation_id},
             {
                 "$push": {"messages": message.dict()},
-                "$set": {"updated_at": datetime.utcnow()}
-            }
+                "$inc": {"message_count": 1, "inline_count": 1},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {"created_at": now, "bucket_count": 0}
+            },
+            projection={"_id": 0, "inline_count": 1, "bucket_count": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if "bucket_count" not in doc:
+            doc = await self._backfill_counts(conversation_id)
+        if doc.get("inline_count", 0) > settings.CONVERSATION_INLINE_MESSAGES:
+            await self._spill(conversation_id, doc.get("bucket_count", 0))
+
+    async def _backfill_counts(self, conversation_id: str) -> dict:
+        """Conversations created before inline/bucket counts were kept have
+        none; $inc just started inline_count at 1. Count their messages once.
+        """
+        await self.conversations.update_one(
+            {"conversation_id": conversation_id, "bucket_count": {"$exists": False}},
+            [{"$set": {
+                "inline_count": {"$size": {"$ifNull": ["$messages", []]}},
+                "message_count": {"$size": {"$ifNull": ["$messages", []]}},
+                "bucket_count": 0
+            }}]
+        )
+        return await self.conversations.find_one(
+            {"conversation_id": conversation_id}, {"_id": 0, "inline_count": 1, "bucket_count": 1}
+        ) or {}
+
+    async def _spill(self, conversation_id: str, bucket: int):
+        """Move the oldest inline messages into bucket number `bucket`.
+        Both steps are guarded by bucket_count, so concurrent spills of the
+        same bucket move the messages once.
+        """
+        size = settings.CONVERSATION_BUCKET_SIZE
+        # None also matches a conversation that has no bucket_count yet
+        guard = {"conversation_id": conversation_id, "bucket_count": bucket if bucket else {"$in": [0, None]}}
+        doc = await self.conversations.find_one(
+            guard,
+            {"_id": 0, "messages": {"$slice": size}}
+        )
+        if not doc:
+            return  # already spilled by another writer
+        try:
+            await self.buckets.insert_one(MessageBucketModel(
+                conversation_id=conversation_id,
+                bucket=bucket,
+                messages=doc["messages"],
+                created_at=datetime.utcnow()
+            ).dict())
+        except DuplicateKeyError:
+            # Left by a spill interrupted before the trim; it holds these same messages
+            pass
+        await self.conversations.update_one(
+            guard,
+            [
+                {"$set": {"messages": {"$slice": ["$messages", size, {"$max": [1, {"$size": "$messages"}]}]}}},
+                {"$set": {"inline_count": {"$size": "$messages"}, "bucket_count": bucket + 1}}
+            ]
         )
-    
-    def get_conversation(self, conversation_id: str) -> Optional[ConversationModel]:
-        """Get conversation by ID."""
-        data = self.conversations.find_one({"conversation_id": conversation_id})
+
+    async def _bucketed_messages(self, conversation_id: str, limit: Optional[int] = None) -> List[dict]:
+        """The last `limit` bucketed messages (all when None), oldest first."""
+        projection = {"_id": 0, "messages": {"$slice": -limit} if limit else 1}
+        cursor = self.buckets.find({"conversation_id": conversation_id}, projection).sort("bucket", -1)
+        messages = []
+        async for bucket in cursor:
+            messages = bucket["messages"] + messages
+            if limit and len(messages) >= limit:
+                break
+        return messages[-limit:] if limit else messages
+
+    async def get_conversation(self, conversation_id: str) -> Optional[ConversationModel]:
+        """Get conversation by ID, with all of its messages."""
+        data = await self.conversations.find_one({"conversation_id": conversation_id})
         if data:
             data.pop('_id', None)
+            if data.get("bucket_count"):
+                data["messages"] = await self._bucketed_messages(conversation_id) + data["messages"]
             return ConversationModel(**data)
         return None
-    
-    def get_history(self, conversation_id: str, limit: int = None) -> List[MessageModel]:
-        """Get conversation history."""
-        conversation = self.get_conversation(conversation_id)
-        if conversation:
-            messages = conversation.messages
-            if limit:
-                return messages[-limit:]
-            return messages
-        return []
-    
-    def list_conversations(self, limit: int = 10) -> List[ConversationModel]:
-        """List recent conversations."""
+
+    async def get_history(self, conversation_id: str, limit: int = None) -> List[MessageModel]:
+        """Get conversation history: the last `limit` messages, oldest first.
+        Only those messages are read, via a $slice projection.
+        """
+        projection = {"_id": 0, "messages": {"$slice": -limit} if limit else 1, "bucket_count": 1}
+        data = await self.conversations.find_one({"conversation_id": conversation_id}, projection)
+        if not data:
+            return []
+        messages = data.get("messages", [])
+        if data.get("bucket_count") and (not limit or len(messages) < limit):
+            older = await self._bucketed_messages(conversation_id, limit - len(messages) if limit else None)
+            messages = older + messages
+        return [MessageModel(**message) for message in messages]
+
+    async def list_conversations(self, limit: int = 10) -> List[ConversationModel]:
+        """List recent conversations, each with its inline (most recent) messages."""
         cursor = self.conversations.find().sort("created_at", -1).limit(limit)
         conversations = []
-        for data in cursor:
+        async for data in cursor:
             data.pop('_id', None)
             conversations.append(ConversationModel(**data))
         return conversations
@@ -0,0 +1,178 @@
+"""
+Shared MongoDB clients.
+
+One pool-tuned client per process for each side of the code:
+- get_async_db(): motor client for async handlers, so database waits do
+  not block the event loop
+- get_db(): pymongo client for blocking code (the ingestion pipeline,
+  workers, executor threads, tools)
+
+Both clients report pool and command events to `db_metrics`, exposed by
+GET /metrics/db.
+"""
+from pymongo import MongoClient, monitoring
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo.database import Database
+from typing import Dict, Optional
+import logging
+import os
+import threading
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DBMetrics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """Connection counts, pool wait times and per-command latency for one client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Checkout waits are timed per thread: a checkout starts and ends on the same thread
+        self._checkout_started = threading.local()
+        self.connections = {"open": 0, "checked_out": 0, "created": 0, "closed": 0}
+        self.pool_wait = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0, "failures": 0}
+        self.commands: Dict[str, dict] = {}
+
+    # Pool events
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections["open"] += 1
+            self.connections["created"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections["open"] -= 1
+            self.connections["closed"] += 1
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.at = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.pool_wait["timeouts"] += 1
+            else:
+                self.pool_wait["failures"] += 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self._checkout_started, "at", None)
+        waited_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+        with self._lock:
+            self.connections["checked_out"] += 1
+            self.pool_wait["count"] += 1
+            self.pool_wait["total_ms"] += waited_ms
+            self.pool_wait["max_ms"] = max(self.pool_wait["max_ms"], waited_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.connections["checked_out"] -= 1
+
+    # Command events
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event.command_name, event.duration_micros, failed=False)
+
+    def failed(self, event):
+        self._record(event.command_name, event.duration_micros, failed=True)
+
+    def _record(self, command_name: str, duration_micros: int, failed: bool):
+        ms = duration_micros / 1000
+        with self._lock:
+            stats = self.commands.setdefault(
+                command_name, {"count": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["count"] += 1
+            stats["failures"] += int(failed)
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            wait = dict(self.pool_wait)
+            wait["avg_ms"] = round(wait["total_ms"] / wait["count"], 3) if wait["count"] else 0.0
+            commands = {
+                name: dict(stats, avg_ms=round(stats["total_ms"] / stats["count"], 3) if stats["count"] else 0.0)
+                for name, stats in self.commands.items()
+            }
+            return {"connections": dict(self.connections), "pool_wait": wait, "commands": commands}
+
+
+db_metrics = {"sync": DBMetrics(), "async": DBMetrics()}
+
+_lock = threading.Lock()
+_sync_client: Optional[MongoClient] = None
+_sync_pid: Optional[int] = None
+_async_client: Optional[AsyncIOMotorClient] = None
+
+
+def _client_options(metrics: DBMetrics) -> dict:
+    return {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "event_listeners": [metrics],
+    }
+
+
+def get_client() -> MongoClient:
+    """This process's blocking client (a forked child gets its own)."""
+    global _sync_client, _sync_pid
+    with _lock:
+        if _sync_client is None or _sync_pid != os.getpid():
+            _sync_client = MongoClient(settings.MONGO_URL, **_client_options(db_metrics["sync"]))
+            _sync_pid = os.getpid()
+        return _sync_client
+
+
+def get_db() -> Database:
+    return get_client()[settings.MONGO_DB]
+
+
+def get_async_client() -> AsyncIOMotorClient:
+    """This process's motor client; use it only from the API's event loop."""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncIOMotorClient(settings.MONGO_URL, **_client_options(db_metrics["async"]))
+        return _async_client
+
+
+def get_async_db() -> AsyncIOMotorDatabase:
+    return get_async_client()[settings.MONGO_DB]
+
+
+def close_clients():
+    """Close both clients; called on application shutdown."""
+    global _sync_client, _async_client
+    with _lock:
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
+def metrics_snapshot() -> dict:
+    return {name: metrics.snapshot() for name, metrics in db_metrics.items()}
@@ -1,5 +1,5 @@
 from openai import OpenAI
-from typing import List
+from typing import Callable, List, Optional
 import numpy as np
 from app.config import settings
 import logging
@@ -16,8 +16,11 @@ class EmbeddingService:
         self.model = settings.EMBEDDING_MODEL
         self.dim = settings.EMBEDDING_DIM
     
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for list of texts."""
+    def embed_texts(self, texts: List[str],
+                    on_batch: Optional[Callable[[int, int], None]] = None) -> List[List[float]]:
+        """Generate embeddings for list of texts.
+        on_batch(done, total) is called after each batch.
+        """
         # Validate and filter inputs
         if not texts:
             return []
@@ -40,6 +43,8 @@ class EmbeddingService:
                 # Response data may be a sequence of objects with .embedding
                 for item in response.data:
                     embeddings.append(item.embedding)
+                if on_batch:
+                    on_batch(len(embeddings), len(cleaned_texts))
             except Exception as e:
                 logger.error(f"Embedding API error for batch starting at {i}: {e}", exc_info=True)
                 raise
@@ -0,0 +1,146 @@
+"""
+Bounded executors for blocking ingestion work.
+
+Async handlers must not call pymongo, boto3, OpenAI, FAISS or the
+extractors directly: one upload would stall every WebSocket on the worker.
+They await run_io (threads, for I/O-bound calls) instead, and CPU-heavy
+extraction runs in the extraction process pool so it does not compete with
+the event loop for the GIL. OCR has its own pool in each process shared by
+all extractions in that process; OCR_WORKERS is a per-host total that those
+pools split between them (see ocr_workers).
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+io_executor = ThreadPoolExecutor(
+    max_workers=settings.INGEST_IO_WORKERS,
+    thread_name_prefix="ingest-io"
+)
+
+# Background S3 copies of new uploads; kept apart so long transfers never starve run_io
+s3_executor = ThreadPoolExecutor(
+    max_workers=settings.S3_UPLOAD_WORKERS,
+    thread_name_prefix="s3-upload"
+)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# How many processes on this host hold an OCR pool of their own. Set for
+# child processes by whatever starts several of them (pools, worker launchers)
+OCR_POOL_SHARE_ENV = "OCR_POOL_SHARE"
+
+
+def ocr_pool_share() -> int:
+    return max(1, int(os.environ.get(OCR_POOL_SHARE_ENV, "1")))
+
+
+def ocr_workers() -> int:
+    """This process's OCR pool size: its share of the host's OCR_WORKERS
+    (default one per CPU core), so nested extraction and worker processes
+    do not each start a pool the size of the machine.
+    """
+    host_workers = settings.OCR_WORKERS or os.cpu_count() or 1
+    return max(1, host_workers // ocr_pool_share())
+
+
+def init_worker_process(ocr_share: int):
+    """Initializer of every ingestion process pool. Tesseract runs one
+    OpenMP thread per page, since the pools already run one page per core;
+    ocr_share is how many processes split the host's OCR workers.
+    """
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    os.environ[OCR_POOL_SHARE_ENV] = str(ocr_share)
+
+
+def _get_process_pool(name: str, max_workers: int, start_method: str = None,
+                      ocr_share: int = None) -> ProcessPoolExecutor:
+    """Create a named process pool on first use (processes themselves start lazily).
+    ocr_share is passed to init_worker_process (default: this process's share).
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            mp_context = multiprocessing.get_context(start_method) if start_method else None
+            pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                       initializer=init_worker_process,
+                                       initargs=(ocr_share or ocr_pool_share(),))
+            _pools[name] = pool
+            logger.info(f"Started '{name}' process pool with {max_workers} worker(s)")
+        return pool
+
+
+def _reset_process_pool(name: str, broken: ProcessPoolExecutor):
+    """Drop a pool after one of its workers died so the next submit gets a fresh one."""
+    with _pools_lock:
+        if _pools.get(name) is broken:
+            del _pools[name]
+    broken.shutdown(wait=False, cancel_futures=True)
+    logger.warning(f"'{name}' process pool was broken and has been reset")
+
+
+def get_ocr_pool() -> ProcessPoolExecutor:
+    """Process pool for page rendering/OCR, shared by all extractions in this process."""
+    return _get_process_pool("ocr", ocr_workers())
+
+
+def submit_ocr(fn: Callable, *args) -> Future:
+    return _submit("ocr", get_ocr_pool, fn, *args)
+
+
+def submit_extract(fn: Callable, *args) -> Future:
+    """Run a CPU-heavy extraction function in the extraction process pool.
+    Workers are spawned rather than forked so they do not inherit the API
+    process's Mongo connections or FAISS index. Each worker gets its own OCR
+    pool, so they split this process's share of the OCR workers.
+    """
+    workers = settings.INGEST_EXTRACT_WORKERS
+    pool_factory = lambda: _get_process_pool("extract", workers, "spawn", ocr_pool_share() * workers)
+    return _submit("extract", pool_factory, fn, *args)
+
+
+def _submit(name: str, pool_factory: Callable[[], ProcessPoolExecutor], fn: Callable, *args) -> Future:
+    pool = pool_factory()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _reset_process_pool(name, pool)
+        return pool_factory().submit(fn, *args)
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    """Await a blocking I/O-bound call on the ingestion thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+
+def submit_s3(fn: Callable, *args) -> Future:
+    """Run fn on the S3 upload pool without waiting for it; failures are logged."""
+    future = s3_executor.submit(fn, *args)
+    future.add_done_callback(
+        lambda f: f.exception() and logger.error(f"Background S3 task failed: {f.exception()}")
+    )
+    return future
+
+
+def shutdown_executors():
+    """Stop all pools; called on application shutdown."""
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    # Let S3 copies in progress finish so their temp files are not orphaned
+    s3_executor.shutdown(wait=True)
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
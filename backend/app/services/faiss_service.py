@@ -2,15 +2,22 @@ import faiss
 import numpy as np
 import os
 import threading
+import time
+import uuid
+from pymongo import ReturnDocument
 from typing import List, Tuple
 from app.config import settings
-from pymongo import MongoClient
+from app.services.db import get_db
+from app.services.job_queue import global_slot
+from app.services.s3_service import s3_service
 from datetime import datetime
 import platform
 import logging
 
 logger = logging.getLogger(__name__)
 
+META_FILTER = {"index_name": "notebooklm_index"}
+
 
 def _to_short_path(path: str) -> str:
     """Return a short (8.3) path on Windows, otherwise return original path."""
@@ -41,11 +48,29 @@ def _to_short_path(path: str) -> str:
 
 
 class FAISSService:
+    """One index file is shared by the API and every worker process.
+
+    Vector IDs come from the `next_id` counter in faiss_meta, so no two
+    processes hand out the same ID. Each process holds the index in memory
+    and remembers the IDs it added or removed since it last synced. save()
+    merges those changes into the latest file under the cluster-wide "faiss"
+    slot and bumps faiss_meta.version; other processes reload the file when
+    they see the bump (search() checks every FAISS_REFRESH_INTERVAL seconds).
+
+    Each save is also uploaded to S3 (FAISS_S3_KEY), and a process whose
+    local file is older than faiss_meta.version downloads it first, so
+    workers on other hosts share the index. `<index>.version` records the
+    version of the local file, so processes on one host download it once.
+    """
+
     def __init__(self):
         self.index_path = settings.FAISS_INDEX_PATH
         self.dimension = settings.EMBEDDING_DIM
         self.index = None
-        self.current_id = 0
+        self.version = 0  # faiss_meta version of the file this copy is based on
+        self._added = set()  # IDs added here and not saved yet
+        self._removed = set()  # IDs removed here and not saved yet
+        self._last_refresh = 0.0
         self.lock = threading.Lock()
         
         # Check CUDA availability
@@ -64,8 +89,7 @@ class FAISSService:
             print(f"⚠️ CUDA check failed: {e} - FAISS will run on CPU")
 
         # MongoDB for metadata
-        self.mongo_client = MongoClient(settings.MONGO_URL)
-        self.db = self.mongo_client[settings.MONGO_DB]
+        self.db = get_db()
         self.faiss_meta_col = self.db["faiss_meta"]
 
         self._load_or_create_index()
@@ -74,19 +98,19 @@ class FAISSService:
         """Load existing index or create new one."""
         os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
 
+        # Read the version before the file: a save in between only causes an extra reload
+        meta = self.faiss_meta_col.find_one(META_FILTER) or {}
+        try:
+            self._fetch_shared(meta.get("version", 0))
+        except Exception as e:
+            logger.warning(f"Could not download FAISS index version {meta.get('version')}: {e}; "
+                           f"using the local file")
         if os.path.exists(self.index_path):
             try:
                 print(f"Loading FAISS index from {self.index_path}")
                 read_path = _to_short_path(self.index_path)
                 self.index = faiss.read_index(read_path)
-
-                meta = self.faiss_meta_col.find_one(
-                    {"index_name": "notebooklm_index"}
-                )
-                if meta:
-                    self.current_id = meta.get("total_vectors", 0)
-                else:
-                    self.current_id = self.index.ntotal
+                self.version = meta.get("version", 0)
             except Exception as e:
                 print(f"Error loading index: {e}. Creating new index...")
                 self._create_new_index()
@@ -94,15 +118,66 @@ class FAISSService:
             print("Creating new FAISS index")
             self._create_new_index()
 
+        # Indexes saved before IDs were allocated here only recorded the old
+        # per-process counter as total_vectors; start the shared one past it
+        seed = max(meta.get("total_vectors", 0), self._max_id() + 1)
+        self.faiss_meta_col.update_one(META_FILTER, {"$max": {"next_id": seed}}, upsert=True)
+
     def _create_new_index(self):
         """Create a new FAISS index with ID mapping support."""
         base_index = faiss.IndexFlatIP(self.dimension)
         self.index = faiss.IndexIDMap2(base_index)
-        self.current_id = 0
         print(
             f"Created new FAISS IndexIDMap2(IndexFlatIP) with dimension {self.dimension}"
         )
 
+    def _local_version(self) -> int:
+        """faiss_meta version of the local index file, 0 when unknown."""
+        try:
+            with open(self.index_path + ".version") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_local_version(self, version: int):
+        temp_path = f"{self.index_path}.version.{uuid.uuid4().hex}"
+        with open(temp_path, "w") as f:
+            f.write(str(version))
+        os.replace(temp_path, self.index_path + ".version")
+
+    def _fetch_shared(self, version: int):
+        """Bring the local index file up to `version` from S3 when a process
+        elsewhere saved it. Raises if the download fails.
+        """
+        if not settings.FAISS_S3_KEY or version <= 0 or self._local_version() >= version:
+            return
+        temp_path = f"{self.index_path}.{uuid.uuid4().hex}.download"
+        try:
+            s3_service.download_file(settings.FAISS_S3_KEY, temp_path)
+            os.replace(temp_path, self.index_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        # The object may be newer than `version`: that only causes an extra reload
+        self._write_local_version(version)
+        logger.info(f"Downloaded FAISS index version {version} from S3")
+
+    def _max_id(self) -> int:
+        """Largest ID in the loaded index, -1 when empty."""
+        ids = faiss.vector_to_array(self.index.id_map)
+        return int(ids.max()) if len(ids) else -1
+
+    def _allocate_ids(self, count: int) -> int:
+        """Reserve `count` consecutive IDs; returns the first."""
+        meta = self.faiss_meta_col.find_one_and_update(
+            META_FILTER,
+            {"$inc": {"next_id": count}},
+            projection={"_id": 0, "next_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return meta["next_id"] - count
+
     def add_vectors(self, vectors: List[List[float]]) -> List[int]:
         """Add vectors with explicit IDs. Returns list of FAISS IDs."""
         if not vectors:
@@ -111,19 +186,60 @@ class FAISSService:
         vectors_np = np.array(vectors, dtype="float32")
         faiss.normalize_L2(vectors_np)
 
+        start_id = self._allocate_ids(len(vectors))
+        ids = np.arange(
+            start_id, start_id + len(vectors), dtype="int64"
+        )
         with self.lock:
-            start_id = self.current_id
-            ids = np.arange(
-                start_id, start_id + len(vectors), dtype="int64"
-            )
             self.index.add_with_ids(vectors_np, ids)
-            self.current_id += len(vectors)
-            logger.info(
-                f"Added {len(vectors)} vectors with IDs {start_id} to {self.current_id - 1}"
-            )
+            self._added.update(ids.tolist())
+        logger.info(
+            f"Added {len(vectors)} vectors with IDs {start_id} to {start_id + len(vectors) - 1}"
+        )
 
         return ids.tolist()
 
+    def refresh(self):
+        """Reload the index if another process saved a newer one. Checks
+        faiss_meta at most once every FAISS_REFRESH_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if now - self._last_refresh < settings.FAISS_REFRESH_INTERVAL:
+            return
+        self._last_refresh = now
+        meta = self.faiss_meta_col.find_one(META_FILTER, {"_id": 0, "version": 1}) or {}
+        version = meta.get("version", 0)
+        if version > self.version:
+            try:
+                # Download outside the lock, so searches go on meanwhile
+                self._fetch_shared(version)
+            except Exception as e:
+                logger.warning(f"Could not download FAISS index version {version}: {e}")
+                return
+            with self.lock:
+                self._merge_from_disk(version)
+
+    def _merge_from_disk(self, version: int):
+        """Replace the in-memory index with the saved file (at `version`),
+        re-applying this process's unsaved adds and removes. Caller holds
+        self.lock.
+        """
+        if version <= self.version:
+            return
+        self._fetch_shared(version)
+        if not os.path.exists(self.index_path):
+            return
+        index = faiss.read_index(_to_short_path(self.index_path))
+        if self._added:
+            ids = np.array(sorted(self._added), dtype="int64")
+            index.add_with_ids(self.index.reconstruct_batch(ids), ids)
+        if self._removed:
+            index.remove_ids(np.array(sorted(self._removed), dtype="int64"))
+        self.index = index
+        self.version = version
+        logger.info(f"Reloaded FAISS index version {version} ({index.ntotal} vectors, "
+                    f"{len(self._added)} unsaved here)")
+
     def search(
         self, query_vector: List[float], k: int = 5, file_ids: List[str] = None
     ) -> Tuple[List[int], List[float]]:
@@ -140,6 +256,7 @@ class FAISSService:
         query_np = np.array([query_vector], dtype="float32")
         faiss.normalize_L2(query_np)
 
+        self.refresh()
         with self.lock:
             # If file filtering requested, search more and filter in Python
             # (FAISS doesn't support metadata filtering natively with IndexIDMap2)
@@ -165,6 +282,8 @@ class FAISSService:
             with self.lock:
                 ids_array = np.array(ids, dtype="int64")
                 n_removed = self.index.remove_ids(ids_array)
+                self._removed.update(ids_array.tolist())
+                self._added.difference_update(ids_array.tolist())
                 logger.info(f"Removed {n_removed} vectors from FAISS")
                 return int(n_removed)
         except Exception as e:
@@ -176,45 +295,67 @@ class FAISSService:
         self.save_index()
 
     def save_index(self):
-        with self.lock:
-            try:
-                index_dir = os.path.dirname(self.index_path)
-                os.makedirs(index_dir, exist_ok=True)
+        """Merge this process's changes into the shared index file.
 
-                logger.info(f"Saving FAISS index to: {self.index_path}")
-                print(f"Saving FAISS index to: {self.index_path}")
-                print(f"Directory exists: {os.path.exists(index_dir)}")
-
-                write_path = _to_short_path(self.index_path)
-                print(f"Using write path: {write_path}")
-
-                faiss.write_index(self.index, write_path)
-
-                logger.info("FAISS index saved successfully")
-                print("FAISS index saved successfully")
-
-            except Exception as e:
-                logger.error(f"Error saving FAISS index: {e}")
-                print(f"Error saving FAISS index: {e}")
-                raise
-
-        self.faiss_meta_col.update_one(
-            {"index_name": "notebooklm_index"},
-            {
-                "$set": {
-                    "index_name": "notebooklm_index",
-                    "index_type": "IndexIDMap2",
-                    "embedding_dim": self.dimension,
-                    "total_vectors": self.current_id,
-                    "faiss_file_path": self.index_path,
-                    "last_updated": datetime.utcnow(),
-                }
-            },
-            upsert=True,
-        )
+        Only one process saves at a time. If another one saved since this
+        copy was loaded, its file is reloaded first so its vectors are kept.
+        The file is replaced atomically and uploaded to S3, then the version
+        is bumped.
+        """
+        with global_slot("faiss", 1):
+            meta = self.faiss_meta_col.find_one(META_FILTER, {"_id": 0, "version": 1}) or {}
+            with self.lock:
+                try:
+                    self._merge_from_disk(meta.get("version", 0))
+
+                    index_dir = os.path.dirname(self.index_path)
+                    os.makedirs(index_dir, exist_ok=True)
+
+                    logger.info(f"Saving FAISS index to: {self.index_path}")
+                    print(f"Saving FAISS index to: {self.index_path}")
+
+                    # Readers reload on the version bump, so never let them see a half-written file
+                    write_path = _to_short_path(self.index_path)
+                    temp_path = os.path.join(_to_short_path(index_dir), os.path.basename(self.index_path) + ".tmp")
+                    faiss.write_index(self.index, temp_path)
+                    os.replace(temp_path, write_path)
+                    version = meta.get("version", 0) + 1
+                    if settings.FAISS_S3_KEY:
+                        s3_service.upload_local_file(write_path, settings.FAISS_S3_KEY)
+                    self._write_local_version(version)
+
+                    self._added.clear()
+                    self._removed.clear()
+                    self.version = version
+                    total_vectors = self.index.ntotal
+
+                    logger.info("FAISS index saved successfully")
+                    print("FAISS index saved successfully")
+
+                except Exception as e:
+                    logger.error(f"Error saving FAISS index: {e}")
+                    print(f"Error saving FAISS index: {e}")
+                    raise
+
+            self.faiss_meta_col.update_one(
+                META_FILTER,
+                {
+                    "$set": {
+                        "index_name": "notebooklm_index",
+                        "index_type": "IndexIDMap2",
+                        "embedding_dim": self.dimension,
+                        "total_vectors": total_vectors,
+                        "version": self.version,
+                        "faiss_file_path": self.index_path,
+                        "last_updated": datetime.utcnow(),
+                    }
+                },
+                upsert=True,
+            )
 
     def get_stats(self) -> dict:
         """Get index statistics."""
+        self.refresh()
         return {
             "total_vectors": self.index.ntotal if self.index else 0,
             "dimension": self.dimension,
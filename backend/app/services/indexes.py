@@ -0,0 +1,194 @@
+"""
+MongoDB indexes for the hot query paths.
+
+INDEXES declares every index the services rely on; ensure_indexes() creates
+missing ones and verifies the declared keys, and require_indexes() fails
+startup (API and workers) if any is missing or wrong.
+HOT_QUERIES are representative shapes of the per-request queries;
+check_query_plans() explains each one and raises if any plan is a COLLSCAN,
+so a missing or unusable index fails startup instead of slowing down with
+the corpus.
+"""
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+
+from app.config import settings
+from app.services.db import get_db
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "files": [
+        IndexModel([("file_id", ASCENDING)], name="file_id", unique=True),
+        # GET /files pages newest first; the status filter narrows the same sort
+        IndexModel([("created_at", DESCENDING), ("file_id", DESCENDING)], name="created_at_file_id"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("file_id", DESCENDING)],
+                   name="status_created_at_file_id"),
+        # Deduplication: oldest indexed file with the same bytes
+        IndexModel([("content_hash", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)],
+                   name="content_hash_status_created_at"),
+        IndexModel([("s3_path", ASCENDING)], name="s3_path"),
+        IndexModel([("archive_id", ASCENDING), ("archive_member", ASCENDING)], name="archive_id_member",
+                   partialFilterExpression={"archive_id": {"$exists": True}}),
+    ],
+    "chunks": [
+        IndexModel([("chunk_id", ASCENDING)], name="chunk_id", unique=True),
+        IndexModel([("faiss_index_id", ASCENDING)], name="faiss_index_id"),
+        IndexModel([("file_id", ASCENDING)], name="file_id"),
+    ],
+    "pages": [
+        IndexModel([("file_id", ASCENDING), ("page_num", ASCENDING)], name="file_id_page_num", unique=True),
+    ],
+    "conversations": [
+        IndexModel([("conversation_id", ASCENDING)], name="conversation_id", unique=True),
+        IndexModel([("created_at", DESCENDING)], name="created_at"),
+    ],
+    "conversation_messages": [
+        IndexModel([("conversation_id", ASCENDING), ("bucket", ASCENDING)], name="conversation_id_bucket", unique=True),
+    ],
+    "archives": [
+        IndexModel([("archive_id", ASCENDING)], name="archive_id", unique=True),
+    ],
+    "faiss_meta": [
+        IndexModel([("index_name", ASCENDING)], name="index_name"),
+    ],
+}
+
+# Only when the queue lives in MongoDB
+JOB_INDEXES: List[IndexModel] = [
+    IndexModel([("job_id", ASCENDING)], name="job_id", unique=True),
+    # claim() and queue_position() scan queued jobs in run_at order
+    IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+    IndexModel([("file_id", ASCENDING), ("status", ASCENDING)], name="file_id_status"),
+    IndexModel([("client_id", ASCENDING), ("status", ASCENDING)], name="client_id_status",
+               partialFilterExpression={"client_id": {"$type": "string"}}),
+]
+
+# (collection, filter, sort) of the queries that run per request or per chat turn
+HOT_QUERIES = [
+    ("chunks", {"faiss_index_id": {"$in": [0, 1]}}, None),
+    ("chunks", {"file_id": ""}, None),
+    ("chunks", {"chunk_id": {"$in": [""]}}, None),
+    ("files", {"file_id": ""}, None),
+    ("files", {"file_id": {"$in": [""]}}, None),
+    ("files", {}, [("created_at", -1), ("file_id", -1)]),
+    ("files", {"status": {"$in": ["queued", "processing"]}}, [("created_at", -1), ("file_id", -1)]),
+    ("files", {"content_hash": "", "status": "indexed"}, [("created_at", 1)]),
+    ("pages", {"file_id": ""}, [("page_num", 1)]),
+    ("conversations", {"conversation_id": ""}, None),
+    ("conversation_messages", {"conversation_id": ""}, [("bucket", -1)]),
+]
+
+JOB_HOT_QUERIES = [
+    ("jobs", {"status": "queued", "run_at": {"$lte": datetime(2000, 1, 1)}}, [("run_at", 1)]),
+    ("jobs", {"file_id": "", "status": {"$in": ["queued", "running"]}}, None),
+]
+
+
+def _declared() -> Dict[str, List[IndexModel]]:
+    declared = dict(INDEXES)
+    if settings.JOB_QUEUE_BACKEND == "mongo":
+        declared["jobs"] = JOB_INDEXES
+    return declared
+
+
+def _duplicate_keys(db: Database, collection: str, keys: dict, limit: int = 5) -> List[dict]:
+    """Up to `limit` key values held by more than one document: what blocks a unique index."""
+    pipeline = [
+        {"$group": {"_id": {field: f"${field}" for field in keys}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit},
+    ]
+    return [dict(doc["_id"], count=doc["count"])
+            for doc in db[collection].aggregate(pipeline, allowDiskUse=True)]
+
+
+def ensure_indexes(db: Optional[Database] = None, create: bool = True) -> List[str]:
+    """Create missing indexes (unless create is False) and verify every
+    declared one exists with the declared keys and uniqueness.
+    Returns the problems found (empty when all is well).
+    """
+    db = db if db is not None else get_db()
+    problems = []
+    for collection, indexes in _declared().items():
+        if create:
+            try:
+                db[collection].create_indexes(indexes)
+            except OperationFailure as e:
+                # e.g. duplicates blocking a unique index, or an index of the same name with other keys
+                problems.append(f"{collection}: creating indexes failed: {e}")
+        existing = db[collection].index_information()
+        for index in indexes:
+            spec = index.document
+            found = existing.get(spec["name"])
+            if found is None:
+                problem = f"{collection}.{spec['name']}: missing"
+                if spec.get("unique"):
+                    duplicates = _duplicate_keys(db, collection, spec["key"])
+                    if duplicates:
+                        problem += f"; duplicate keys block it: {duplicates}"
+                problems.append(problem)
+            elif list(found["key"]) != list(spec["key"].items()):
+                problems.append(f"{collection}.{spec['name']}: keys {found['key']}, expected {list(spec['key'].items())}")
+            elif spec.get("unique") and not found.get("unique"):
+                problems.append(f"{collection}.{spec['name']}: not unique")
+    for problem in problems:
+        logger.error(f"Index check: {problem}")
+    if not problems:
+        logger.info(f"Indexes verified on {len(_declared())} collections")
+    return problems
+
+
+def require_indexes(db: Optional[Database] = None):
+    """ensure_indexes(), raising RuntimeError if any index is missing or wrong:
+    the services rely on the unique ones to keep file_id/chunk_id unique.
+    """
+    problems = ensure_indexes(db)
+    if problems:
+        raise RuntimeError(f"{len(problems)} index problem(s): {'; '.join(problems)}")
+
+
+def _stages(plan) -> List[str]:
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    for value in plan.values():
+        if isinstance(value, (dict, list)):
+            stages.extend(_stages(value))
+    return stages
+
+
+def explain_hot_queries(db: Optional[Database] = None) -> List[dict]:
+    """Winning plan stages of each hot query."""
+    db = db if db is not None else get_db()
+    queries = HOT_QUERIES + (JOB_HOT_QUERIES if settings.JOB_QUEUE_BACKEND == "mongo" else [])
+    results = []
+    for collection, query, sort in queries:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = _stages(winning)
+        results.append({
+            "collection": collection,
+            "query": query,
+            "sort": sort,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return results
+
+
+def check_query_plans(db: Optional[Database] = None):
+    """Raise RuntimeError if any hot query would scan its whole collection."""
+    scans = [result for result in explain_hot_queries(db) if result["collscan"]]
+    if scans:
+        details = "; ".join(f"{r['collection']} {r['query']} sort={r['sort']}" for r in scans)
+        raise RuntimeError(f"COLLSCAN in {len(scans)} hot query plan(s): {details}")
+    logger.info("Hot query plans use indexes")
@@ -0,0 +1,516 @@
+"""
+Synchronous ingestion pipeline: extract -> chunk -> embed -> index.
+
+These functions block; API handlers run them through app.services.executors,
+ingestion workers (app.worker) run them from the job queue, and extraction
+itself is handed to the extraction process pool.
+"""
+from pymongo import ReturnDocument, UpdateOne
+from typing import Callable, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+import uuid
+import hashlib
+import os
+import time
+import logging
+
+from app.config import settings
+from app.models.pydantic_models import ChunkModel, FileModel
+from app.services.chunking import TextChunker
+from app.services.embedding import embedding_service
+from app.services.faiss_service import faiss_service
+from app.services.page_store import page_store
+from app.services.s3_service import s3_service
+from app.services.page_extraction import extract_and_chunk
+from app.services.executors import submit_extract
+from app.services.job_queue import global_slot, job_queue, keepalive
+from app.services.progress import progress_publisher
+from app.services.change_counter import TrackedCollection
+from app.services.db import get_db
+
+logger = logging.getLogger(__name__)
+
+# File types whose extraction may OCR; they count against the cluster-wide OCR limit
+OCR_FILE_TYPES = {"pdf", "png", "jpg", "jpeg", "tif", "tiff"}
+
+# MongoDB
+db = get_db()
+files_col = TrackedCollection(db['files'])
+chunks_col = db['chunks']
+
+# Collections whose documents track S3/index legs of a temp file, and their id field
+LEG_KEYS = {"files": "file_id", "archives": "archive_id"}
+LEG_COLLECTIONS = {"files": files_col, "archives": db['archives']}
+
+
+def mark_failed(file_id: str, error: str):
+    """Record a failed ingestion on the file and publish it to progress subscribers."""
+    files_col.update_one(
+        {"file_id": file_id},
+        {"$set": {"status": "failed", "error": error}}
+    )
+    progress_publisher.finish(file_id, "failed", error=error)
+
+
+def record_degraded_pages(file_id: str) -> int:
+    """Copy pages that hit an extraction time budget onto the file document."""
+    degraded = page_store.get_degraded(file_id)
+    files_col.update_one(
+        {"file_id": file_id},
+        {"$set": {"degraded_pages": degraded}}
+    )
+    if degraded:
+        logger.warning(f"File {file_id}: {len(degraded)} pages degraded during extraction")
+    return len(degraded)
+
+
+def chunk_content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def index_chunks(file_id: str, chunks: List[Tuple[str, Optional[str], int, int]]) -> List[dict]:
+    """Embed chunks, add them to FAISS and save them to MongoDB.
+    Does not persist the FAISS index. Returns the saved chunk documents.
+    """
+    return index_chunk_batch([(file_id, chunk) for chunk in chunks], progress_id=file_id)
+
+
+def index_chunk_batch(items: List[Tuple[str, Tuple[str, Optional[str], int, int]]],
+                      progress_id: Optional[str] = None) -> List[dict]:
+    """Embed (file_id, chunk) pairs, possibly from several files, in shared
+    embedding requests; add them to FAISS and save them to MongoDB.
+    Progress is published under progress_id. Does not persist the FAISS index.
+    Returns the saved chunk documents.
+    """
+    # Generate embeddings
+    chunk_texts = [chunk[0] for _, chunk in items]
+    on_batch = None
+    if progress_id:
+        on_batch = lambda done, total: progress_publisher.publish(progress_id, "embed", done, total)
+    with global_slot("embedding", settings.JOB_EMBED_CONCURRENCY):
+        embeddings = embedding_service.embed_texts(chunk_texts, on_batch=on_batch)
+    
+    # Add to FAISS
+    faiss_ids = faiss_service.add_vectors(embeddings)
+    if progress_id:
+        progress_publisher.publish(progress_id, "index", len(faiss_ids), len(items))
+    
+    # Save chunks to MongoDB
+    chunk_models = []
+    for i, (file_id, (content, title, page_start, page_end)) in enumerate(items):
+        chunk_model = ChunkModel(
+            chunk_id=str(uuid.uuid4()),
+            file_id=file_id,
+            title=title,
+            content=content,
+            page_start=page_start,
+            page_end=page_end,
+            faiss_index_id=faiss_ids[i],
+            embedding_dim=settings.EMBEDDING_DIM,
+            content_hash=chunk_content_hash(content),
+            created_at=datetime.utcnow()
+        )
+        chunk_models.append(chunk_model.dict())
+    
+    if chunk_models:
+        chunks_col.insert_many(chunk_models)
+    return chunk_models
+
+
+def remove_chunks(file_id: str, chunk_ids: Optional[List[str]] = None) -> int:
+    """Delete a file's chunks (or only chunk_ids) and their FAISS vectors.
+    Does not persist the FAISS index. Returns number of chunks deleted.
+    """
+    query = {"file_id": file_id}
+    if chunk_ids is not None:
+        query["chunk_id"] = {"$in": chunk_ids}
+    
+    faiss_ids = [
+        doc["faiss_index_id"]
+        for doc in chunks_col.find(query, {"faiss_index_id": 1})
+        if "faiss_index_id" in doc
+    ]
+    result = chunks_col.delete_many(query)
+    faiss_ids = unshared_faiss_ids(faiss_ids)
+    if faiss_ids:
+        faiss_service.remove_ids(faiss_ids)
+    return result.deleted_count
+
+
+def unshared_faiss_ids(faiss_ids: List[int]) -> List[int]:
+    """FAISS ids no longer referenced by any chunk (deduplicated files share vectors).
+    Call after deleting the chunk documents.
+    """
+    if not faiss_ids:
+        return []
+    still_used = set(chunks_col.distinct("faiss_index_id", {"faiss_index_id": {"$in": faiss_ids}}))
+    return [faiss_id for faiss_id in faiss_ids if faiss_id not in still_used]
+
+
+def delete_files(file_ids: List[str]) -> dict:
+    """Delete many files with one pass over each store: one query and delete
+    per collection, one FAISS remove_ids plus a single save, and S3
+    multi-object deletes. Vectors and S3 objects still used by other
+    (deduplicated) files are kept. Files being ingested (queued, processing
+    or with an active job) are left alone: their ingestion would go on to
+    index chunks for a file that no longer exists.
+    Returns counts, plus file_ids not found, file_ids left alone as busy and
+    S3 objects that failed to delete.
+    """
+    file_docs = list(files_col.find(
+        {"file_id": {"$in": file_ids}}, {"_id": 0, "file_id": 1, "s3_path": 1, "status": 1}
+    ))
+    found_set = {doc["file_id"] for doc in file_docs}
+    busy = {doc["file_id"] for doc in file_docs if doc.get("status") in ("queued", "processing")}
+    busy |= job_queue.files_with_active_jobs(sorted(found_set - busy))
+    file_docs = [doc for doc in file_docs if doc["file_id"] not in busy]
+    found = [doc["file_id"] for doc in file_docs]
+    not_found = [file_id for file_id in file_ids if file_id not in found_set]
+    if not found:
+        return {"deleted": 0, "chunks_deleted": 0, "vectors_removed": 0, "s3_deleted": 0,
+                "not_found": not_found, "busy": sorted(busy), "s3_failed": []}
+    
+    faiss_ids = [
+        doc["faiss_index_id"]
+        for doc in chunks_col.find({"file_id": {"$in": found}}, {"faiss_index_id": 1})
+        if "faiss_index_id" in doc
+    ]
+    chunks_deleted = chunks_col.delete_many({"file_id": {"$in": found}}).deleted_count
+    page_store.delete_pages_of(found)
+    files_col.delete_many({"file_id": {"$in": found}})
+    
+    # Only now can objects shared among the deleted files themselves be dropped
+    s3_paths = {doc["s3_path"] for doc in file_docs if doc.get("s3_path")}
+    still_used = set(files_col.distinct("s3_path", {"s3_path": {"$in": list(s3_paths)}}))
+    s3_paths = sorted(s3_paths - still_used)
+    s3_failed = s3_service.delete_files(s3_paths) if s3_paths else []
+    
+    faiss_ids = unshared_faiss_ids(faiss_ids)
+    vectors_removed = faiss_service.remove_ids(faiss_ids) if faiss_ids else 0
+    if vectors_removed:
+        faiss_service.save()
+    
+    logger.info(f"Deleted {len(found)} files: {chunks_deleted} chunks, {vectors_removed} vectors, "
+                f"{len(s3_paths) - len(s3_failed)} S3 objects")
+    return {
+        "deleted": len(found),
+        "chunks_deleted": chunks_deleted,
+        "vectors_removed": vectors_removed,
+        "s3_deleted": len(s3_paths) - len(s3_failed),
+        "not_found": not_found,
+        "busy": sorted(busy),
+        "s3_failed": s3_failed
+    }
+
+
+def find_indexed_duplicate(content_hash: str) -> Optional[dict]:
+    """Oldest indexed file with the same content hash whose S3 copy is done,
+    if any. A duplicate shares that object, so it must exist. (Files from
+    before s3_status was tracked have none; theirs were uploaded first.)
+    """
+    return files_col.find_one(
+        {"content_hash": content_hash, "status": "indexed", "s3_status": {"$in": ["uploaded", None]}},
+        sort=[("created_at", 1)]
+    )
+
+
+def register_duplicate(source: dict, file_id: str, filename: str, file_type: str,
+                       size: int, content_hash: str, **fields) -> int:
+    """Create file_id as a duplicate of the indexed source file, sharing its
+    chunks, vectors and S3 object; the source's S3 copy must be done (see
+    find_indexed_duplicate). Extra fields go onto the file document.
+    Returns number of chunks cloned.
+    """
+    file_model = FileModel(
+        file_id=file_id,
+        filename=filename,
+        file_type=file_type,
+        s3_path=source["s3_path"],
+        size=size,
+        content_hash=content_hash,
+        duplicate_of=source.get("duplicate_of") or source["file_id"],
+        status="processing",
+        s3_status="uploaded",
+        created_at=datetime.utcnow(),
+        total_page=0,
+        **fields
+    )
+    files_col.insert_one(file_model.dict())
+    return clone_indexed_file(source, file_id)
+
+
+def clone_indexed_file(source: dict, file_id: str) -> int:
+    """Give file_id its own chunk documents pointing at the source file's FAISS
+    vectors, plus a copy of its page text. No extraction or embedding calls.
+    Returns number of chunks cloned.
+    """
+    now = datetime.utcnow()
+    chunk_docs = [
+        {**chunk, "chunk_id": str(uuid.uuid4()), "file_id": file_id, "created_at": now}
+        for chunk in chunks_col.find({"file_id": source["file_id"]}, {"_id": 0})
+    ]
+    if chunk_docs:
+        chunks_col.insert_many(chunk_docs)
+    page_store.copy_pages(source["file_id"], file_id)
+    
+    files_col.update_one(
+        {"file_id": file_id},
+        {"$set": {
+            "status": "indexed",
+            "chunks_count": len(chunk_docs),
+            "total_page": source.get("total_page", 0),
+            "degraded_pages": source.get("degraded_pages", [])
+        }}
+    )
+    logger.info(f"File {file_id} deduplicated against {source['file_id']}: {len(chunk_docs)} chunks shared")
+    progress_publisher.finish(file_id, "indexed", chunks_count=len(chunk_docs), deduplicated=True)
+    return len(chunk_docs)
+
+
+def finish_leg(file_id: str, leg: str, temp_path: Optional[str] = None, collection: str = "files"):
+    """Mark one leg ("s3" or "index") of a new upload as done.
+    Whichever leg finishes last removes the local temp file.
+    collection/file_id may also name an archive ("archives", archive_id).
+    """
+    file_doc = LEG_COLLECTIONS[collection].find_one_and_update(
+        {LEG_KEYS[collection]: file_id},
+        {"$pull": {"legs_pending": leg}},
+        projection={"legs_pending": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    # A deleted file has no legs left either
+    if file_doc is None or not file_doc.get("legs_pending"):
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+            logger.info(f"Removed temp file of {file_id}")
+
+
+def _delete_replaced_s3_object(s3_path: str):
+    """Delete a previous version's S3 object unless a file still references it."""
+    if files_col.count_documents({"s3_path": s3_path}, limit=1):
+        return
+    try:
+        s3_service.delete_file(s3_path)
+        logger.info(f"Deleted previous S3 version {s3_path}")
+    except Exception as e:
+        logger.warning(f"Failed to delete previous S3 version {s3_path}: {e}")
+
+
+def copy_to_s3(file_id: str, path: str, s3_key: str, collection: str = "files") -> bool:
+    """Copy a local file to S3, retrying up to S3_UPLOAD_RETRIES times, and
+    record the outcome in s3_status. Returns True once the copy succeeded.
+    """
+    col = LEG_COLLECTIONS[collection]
+    key = LEG_KEYS[collection]
+    for attempt in range(1, settings.S3_UPLOAD_RETRIES + 1):
+        try:
+            with open(path, "rb") as f:
+                s3_service.open_multipart(s3_key).write_from(f, settings.UPLOAD_CHUNK_SIZE)
+            col.update_one(
+                {key: file_id},
+                {"$set": {"s3_status": "uploaded"}, "$unset": {"s3_error": ""}}
+            )
+            logger.info(f"Uploaded {file_id} to S3 (attempt {attempt})")
+            return True
+        except Exception as e:
+            logger.warning(f"S3 upload of {file_id} failed (attempt {attempt}/{settings.S3_UPLOAD_RETRIES}): {e}")
+            if attempt == settings.S3_UPLOAD_RETRIES:
+                col.update_one(
+                    {key: file_id},
+                    {"$set": {"s3_status": "failed", "s3_error": str(e)}}
+                )
+            else:
+                time.sleep(min(2 ** attempt, 30))
+    return False
+
+
+def upload_s3_leg(file_id: str, temp_path: str, s3_key: str, replaces_s3_path: Optional[str] = None,
+                  collection: str = "files"):
+    """Copy a new upload's temp file to S3, in parallel with its ingestion.
+    replaces_s3_path (previous version's object) is deleted once the copy
+    succeeds, unless another file still uses it.
+    """
+    if copy_to_s3(file_id, temp_path, s3_key, collection) and replaces_s3_path:
+        _delete_replaced_s3_object(replaces_s3_path)
+    finish_leg(file_id, "s3", temp_path, collection)
+
+
+@contextmanager
+def processing_heartbeat(file_id: str):
+    """Refresh the file's processing_at while the block runs, so
+    app.worker.recover_stuck_files does not take a long ingestion running
+    inline in the API (with no job) for an abandoned one.
+    """
+    def touch():
+        # Not through files_col: a heartbeat is no change to the file listing
+        db['files'].update_one(
+            {"file_id": file_id, "status": "processing"},
+            {"$set": {"processing_at": datetime.utcnow()}}
+        )
+
+    with keepalive(touch, max(1.0, settings.JOB_STUCK_AFTER / 4)):
+        yield
+
+
+def extract_file(file_id: str, temp_path: str, filename: str, file_type: str) -> dict:
+    """Extract (checkpointed per page) and chunk text in the extraction process
+    pool. Returns extract_and_chunk's result: the page count and the chunks.
+    """
+    logger.info(f"Extracting text from {filename}")
+    ocr_limit = settings.JOB_OCR_CONCURRENCY if file_type in OCR_FILE_TYPES else 0
+    with global_slot("ocr", ocr_limit):
+        extracted = submit_extract(extract_and_chunk, file_id, temp_path, file_type).result()
+    logger.info(f"Extracted {extracted['pages']} pages into {len(extracted['chunks'])} chunks")
+    record_degraded_pages(file_id)
+    return extracted
+
+
+def ingest_file(file_id: str, temp_path: str, filename: str, file_type: str,
+                on_stage: Optional[Callable[[str], None]] = None) -> dict:
+    """Run the full pipeline for an uploaded file and update its status.
+    Raises on failure; the caller decides how to record it.
+    on_stage is called with "extract" and "index" as the pipeline advances.
+    Returns: dict with status, chunks_count and total_page
+    """
+    files_col.update_one(
+        {"file_id": file_id},
+        {"$set": {"status": "processing", "processing_at": datetime.utcnow()}}
+    )
+    
+    with processing_heartbeat(file_id):
+        if on_stage:
+            on_stage("extract")
+        extracted = extract_file(file_id, temp_path, filename, file_type)
+        chunks = extracted["chunks"]
+        
+        # Drop chunks left over from an interrupted run before indexing again
+        stale = remove_chunks(file_id)
+        if stale:
+            logger.info(f"Removed {stale} chunks from a previous run of {filename}")
+        
+        # Embed, add to FAISS and save chunks
+        if on_stage:
+            on_stage("index")
+        logger.info(f"Indexing {len(chunks)} chunks")
+        chunk_models = index_chunks(file_id, chunks)
+        
+        # Save chunks to MongoDB (only if there are chunks)
+        if chunk_models:
+            logger.info(f"Saved {len(chunk_models)} chunks to MongoDB")
+            
+            # Save FAISS index
+            logger.info("Saving FAISS index")
+            faiss_service.save()
+            
+            # Update status to indexed
+            files_col.update_one(
+                {"file_id": file_id},
+                {"$set": {"status": "indexed", "chunks_count": len(chunk_models), "total_page": extracted["pages"]}}
+            )
+            
+            logger.info(f"File {filename} processed successfully: {len(chunk_models)} chunks")
+            progress_publisher.finish(file_id, "indexed", chunks_count=len(chunk_models))
+            return {"status": "indexed", "chunks_count": len(chunk_models), "total_page": extracted["pages"]}
+        
+        # No chunks extracted - mark as failed
+        logger.warning(f"No chunks extracted from {filename}. Marking as failed.")
+        files_col.update_one(
+            {"file_id": file_id},
+            {"$set": {
+                "status": "failed", 
+                "error": "No text content extracted. File may be empty or corrupted.",
+                "chunks_count": 0
+            }}
+        )
+        progress_publisher.finish(file_id, "failed", error="No text content extracted")
+        return {"status": "failed", "chunks_count": 0, "total_page": extracted["pages"]}
+
+
+def update_file(file_id: str, temp_path: str, filename: str, file_type: str) -> dict:
+    """Re-ingest a new version of a file, embedding only chunks whose content
+    is not already indexed for it. Chunks are matched to the previous version
+    by content hash: matches keep their FAISS vector (page/title metadata is
+    refreshed), new content is embedded, and chunks that disappeared are
+    removed. Old chunks stay searchable until the new version is indexed.
+    Raises on failure.
+    Returns: dict with status, chunks_count, total_page, embedded, reused, removed
+    """
+    with processing_heartbeat(file_id):
+        extracted = extract_file(file_id, temp_path, filename, file_type)
+        chunks = extracted["chunks"]
+        if not chunks:
+            raise ValueError("No text content extracted. File may be empty or corrupted.")
+        
+        # Previous version's chunks by content hash (older chunks have no stored hash)
+        old_by_hash = {}
+        for doc in chunks_col.find({"file_id": file_id}, {"_id": 0, "chunk_id": 1, "content": 1, "content_hash": 1}):
+            content_hash = doc.get("content_hash") or chunk_content_hash(doc["content"])
+            old_by_hash.setdefault(content_hash, []).append(doc["chunk_id"])
+        
+        new_chunks = []
+        refresh = []
+        for content, title, page_start, page_end in chunks:
+            matches = old_by_hash.get(chunk_content_hash(content))
+            if matches:
+                refresh.append(UpdateOne(
+                    {"chunk_id": matches.pop()},
+                    {"$set": {"title": title, "page_start": page_start, "page_end": page_end}}
+                ))
+            else:
+                new_chunks.append((content, title, page_start, page_end))
+        stale_ids = [chunk_id for chunk_ids in old_by_hash.values() for chunk_id in chunk_ids]
+        
+        logger.info(f"Updating {file_id}: {len(refresh)} chunks unchanged, {len(new_chunks)} to embed, {len(stale_ids)} to remove")
+        if refresh:
+            chunks_col.bulk_write(refresh, ordered=False)
+        embedded = index_chunks(file_id, new_chunks) if new_chunks else []
+        removed = remove_chunks(file_id, stale_ids) if stale_ids else 0
+        faiss_service.save()
+        
+        files_col.update_one(
+            {"file_id": file_id},
+            {"$set": {
+                "status": "indexed",
+                "chunks_count": len(chunks),
+                "total_page": extracted["pages"],
+                "last_update": {"embedded": len(embedded), "reused": len(refresh), "removed": removed}
+            }}
+        )
+        progress_publisher.finish(file_id, "indexed", chunks_count=len(chunks))
+        return {
+            "status": "indexed",
+            "chunks_count": len(chunks),
+            "total_page": extracted["pages"],
+            "embedded": len(embedded),
+            "reused": len(refresh),
+            "removed": removed
+        }
+
+
+def rechunk_file(file_id: str, chunk_size: Optional[int], chunk_overlap: Optional[int]):
+    """Re-chunk and re-index a file from its stored page text. Raises on failure."""
+    with processing_heartbeat(file_id):
+        pages = page_store.get_pages(file_id)
+        chunks = TextChunker(chunk_size, chunk_overlap).chunk_document(pages)
+        logger.info(f"Re-chunking {file_id}: {len(pages)} stored pages -> {len(chunks)} chunks")
+        
+        old_chunk_ids = [doc["chunk_id"] for doc in chunks_col.find({"file_id": file_id}, {"chunk_id": 1})]
+        
+        # Index the new chunks before dropping the old ones so the file stays searchable
+        chunk_models = index_chunks(file_id, chunks)
+        removed = remove_chunks(file_id, old_chunk_ids)
+        faiss_service.save()
+        
+        files_col.update_one(
+            {"file_id": file_id},
+            {"$set": {
+                "status": "indexed",
+                "chunks_count": len(chunk_models),
+                "chunk_size": chunk_size or settings.CHUNK_SIZE,
+                "chunk_overlap": chunk_overlap or settings.CHUNK_OVERLAP
+            }}
+        )
+        logger.info(f"Re-chunked {file_id}: {removed} old chunks replaced by {len(chunk_models)}")
+        progress_publisher.finish(file_id, "indexed", chunks_count=len(chunk_models))
+
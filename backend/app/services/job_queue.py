@@ -0,0 +1,541 @@
+from abc import ABC, abstractmethod
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.config import settings
+from app.models.pydantic_models import JobModel
+from app.services.db import get_db
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Error recorded on a job whose lease ran out during its last allowed attempt
+LEASE_EXHAUSTED_ERROR = "Lease expired on the final attempt (worker died or hung)"
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Delay before retrying a job that has failed `attempts` times."""
+    delay = settings.JOB_RETRY_BASE_DELAY * (2 ** max(0, attempts - 1))
+    return min(delay, settings.JOB_RETRY_MAX_DELAY)
+
+
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobQueue(ABC):
+    """Durable job queue shared by the API and the worker processes.
+
+    Workers claim a job with a lease and must keep extending it while they run;
+    a job whose lease runs out (worker crashed or was killed) is claimed again
+    by another worker. Failed jobs are retried with exponential backoff until
+    max_attempts, then marked failed. A job whose lease runs out on its last
+    attempt is marked failed by the next claim() instead of being leased again.
+
+    The queue also provides cluster-wide counting semaphores (slots) used to
+    cap concurrent OCR and embedding work across all workers.
+    """
+
+    @abstractmethod
+    def enqueue(self, job_type: str, payload: Dict[str, Any], file_id: Optional[str] = None,
+                max_attempts: Optional[int] = None, client_id: Optional[str] = None) -> str:
+        ...
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Claim the next runnable job (or one whose lease expired).
+        A job returned with status "failed" ran out of attempts: it was only
+        marked failed, and the caller records the failure on its document."""
+
+    @abstractmethod
+    def extend_lease(self, job_id: str, worker_id: str) -> bool:
+        """Push a running job's lease forward. False if the lease was lost."""
+
+    @abstractmethod
+    def set_stage(self, job_id: str, stage: str):
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str):
+        ...
+
+    @abstractmethod
+    def fail(self, job: Dict[str, Any], worker_id: str, error: str) -> bool:
+        """Record a failed attempt. Returns True if the job will be retried."""
+
+    @abstractmethod
+    def has_active_job(self, file_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def files_with_active_jobs(self, file_ids: List[str]) -> Set[str]:
+        """Those of file_ids that have a queued or running job."""
+
+    @abstractmethod
+    def count_active(self, client_id: Optional[str] = None) -> Dict[str, int]:
+        """Number of queued and running jobs ({"queued": n, "running": m}),
+        only those enqueued for client_id if given."""
+
+    @abstractmethod
+    def queue_position(self, file_id: str) -> Optional[int]:
+        """1-based position of file_id's queued job in claim order, or None
+        if the file has no queued job."""
+
+    @abstractmethod
+    def acquire_slot(self, name: str, limit: int, holder: str, ttl: float) -> Optional[str]:
+        """Take one of `limit` slots named `name`. Returns the slot id or None if all are held."""
+
+    @abstractmethod
+    def renew_slot(self, slot_id: str, holder: str, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    def release_slot(self, slot_id: str, holder: str):
+        ...
+
+
+class MongoJobQueue(JobQueue):
+    """Job queue stored in the `jobs` collection of the application database."""
+
+    def __init__(self):
+        self.db = get_db()
+        self.jobs = self.db['jobs']
+        self.slots = self.db['job_slots']
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any], file_id: Optional[str] = None,
+                max_attempts: Optional[int] = None, client_id: Optional[str] = None) -> str:
+        now = datetime.utcnow()
+        job = JobModel(
+            job_id=str(uuid.uuid4()),
+            type=job_type,
+            file_id=file_id,
+            client_id=client_id,
+            payload=payload,
+            status="queued",
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+            run_at=now,
+            created_at=now,
+            updated_at=now
+        )
+        self.jobs.insert_one(job.dict())
+        logger.info(f"Enqueued {job_type} job {job.job_id} for file {file_id}")
+        return job.job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        exhausted = self.jobs.find_one_and_update(
+            {"status": "running", "lease_until": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"status": "failed", "error": LEASE_EXHAUSTED_ERROR, "lease_until": None,
+                      "worker_id": worker_id, "updated_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if exhausted:
+            exhausted.pop('_id', None)
+            return exhausted
+        
+        job = self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": worker_id,
+                    "lease_until": now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            job.pop('_id', None)
+        return job
+
+    def extend_lease(self, job_id: str, worker_id: str) -> bool:
+        now = datetime.utcnow()
+        result = self.jobs.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"lease_until": now + timedelta(seconds=settings.JOB_LEASE_SECONDS), "updated_at": now}}
+        )
+        return result.modified_count == 1
+
+    def set_stage(self, job_id: str, stage: str):
+        self.jobs.update_one(
+            {"job_id": job_id},
+            {"$set": {"stage": stage, "updated_at": datetime.utcnow()}}
+        )
+
+    def complete(self, job_id: str, worker_id: str):
+        self.jobs.update_one(
+            {"job_id": job_id, "worker_id": worker_id},
+            {"$set": {"status": "done", "lease_until": None, "updated_at": datetime.utcnow()}}
+        )
+
+    def fail(self, job: Dict[str, Any], worker_id: str, error: str) -> bool:
+        now = datetime.utcnow()
+        retry = job["attempts"] < job["max_attempts"]
+        update = {"status": "queued" if retry else "failed", "error": error,
+                  "lease_until": None, "updated_at": now}
+        if retry:
+            update["run_at"] = now + timedelta(seconds=backoff_seconds(job["attempts"]))
+        self.jobs.update_one({"job_id": job["job_id"], "worker_id": worker_id}, {"$set": update})
+        return retry
+
+    def has_active_job(self, file_id: str) -> bool:
+        return self.jobs.count_documents(
+            {"file_id": file_id, "status": {"$in": list(ACTIVE_STATUSES)}}, limit=1
+        ) > 0
+
+    def files_with_active_jobs(self, file_ids: List[str]) -> Set[str]:
+        return set(self.jobs.distinct(
+            "file_id", {"file_id": {"$in": file_ids}, "status": {"$in": list(ACTIVE_STATUSES)}}
+        ))
+
+    def count_active(self, client_id: Optional[str] = None) -> Dict[str, int]:
+        query = {"status": {"$in": list(ACTIVE_STATUSES)}}
+        if client_id is not None:
+            query["client_id"] = client_id
+        counts = {status: 0 for status in ACTIVE_STATUSES}
+        for row in self.jobs.aggregate([{"$match": query}, {"$group": {"_id": "$status", "n": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["n"]
+        return counts
+
+    def queue_position(self, file_id: str) -> Optional[int]:
+        job = self.jobs.find_one({"file_id": file_id, "status": "queued"}, {"run_at": 1})
+        if job is None:
+            return None
+        return self.jobs.count_documents({"status": "queued", "run_at": {"$lt": job["run_at"]}}) + 1
+
+    def acquire_slot(self, name: str, limit: int, holder: str, ttl: float) -> Optional[str]:
+        now = datetime.utcnow()
+        for i in range(limit):
+            slot_id = f"{name}:{i}"
+            try:
+                # Matches a free or expired slot; upserts a slot that does not exist yet.
+                # A held slot makes the upsert collide on _id.
+                self.slots.update_one(
+                    {"_id": slot_id, "$or": [{"holder": None}, {"expires_at": {"$lt": now}}]},
+                    {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=ttl)}},
+                    upsert=True
+                )
+                return slot_id
+            except DuplicateKeyError:
+                continue
+        return None
+
+    def renew_slot(self, slot_id: str, holder: str, ttl: float) -> bool:
+        result = self.slots.update_one(
+            {"_id": slot_id, "holder": holder},
+            {"$set": {"expires_at": datetime.utcnow() + timedelta(seconds=ttl)}}
+        )
+        return result.modified_count == 1
+
+    def release_slot(self, slot_id: str, holder: str):
+        self.slots.update_one({"_id": slot_id, "holder": holder}, {"$set": {"holder": None}})
+
+
+class SQLiteJobQueue(JobQueue):
+    """Job queue in a local SQLite file, for single-node setups.
+
+    All API and worker processes on the node must point at the same file.
+    Timestamps are stored as epoch seconds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    file_id TEXT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    run_at REAL NOT NULL,
+                    lease_until REAL,
+                    worker_id TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_run_at ON jobs (status, run_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_file_id ON jobs (file_id)")
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "client_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN client_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_client_id_status ON jobs (client_id, status)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_slots (
+                    slot_id TEXT PRIMARY KEY,
+                    holder TEXT,
+                    expires_at REAL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any], file_id: Optional[str] = None,
+                max_attempts: Optional[int] = None, client_id: Optional[str] = None) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, type, file_id, client_id, payload, status, attempts, max_attempts, "
+                "run_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?)",
+                (job_id, job_type, file_id, client_id, json.dumps(payload),
+                 max_attempts or settings.JOB_MAX_ATTEMPTS, now, now, now)
+            )
+        logger.info(f"Enqueued {job_type} job {job_id} for file {file_id}")
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._transaction() as conn:
+            exhausted = conn.execute(
+                "SELECT job_id FROM jobs "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts LIMIT 1",
+                (now,)
+            ).fetchone()
+            if exhausted is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, lease_until = NULL, worker_id = ?, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (LEASE_EXHAUSTED_ERROR, worker_id, now, exhausted["job_id"])
+                )
+                job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (exhausted["job_id"],)).fetchone()
+                return self._row_to_job(job)
+            
+            row = conn.execute(
+                "SELECT job_id FROM jobs "
+                "WHERE (status = 'queued' AND run_at <= ?) "
+                "OR (status = 'running' AND lease_until < ? AND attempts < max_attempts) "
+                "ORDER BY run_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, updated_at = ?, "
+                "attempts = attempts + 1 WHERE job_id = ?",
+                (worker_id, now + settings.JOB_LEASE_SECONDS, now, row["job_id"])
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        return self._row_to_job(job)
+
+    def extend_lease(self, job_id: str, worker_id: str) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? "
+                "WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                (now + settings.JOB_LEASE_SECONDS, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def set_stage(self, job_id: str, stage: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET stage = ?, updated_at = ? WHERE job_id = ?",
+                         (stage, time.time(), job_id))
+
+    def complete(self, job_id: str, worker_id: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, updated_at = ? "
+                "WHERE job_id = ? AND worker_id = ?",
+                (time.time(), job_id, worker_id)
+            )
+
+    def fail(self, job: Dict[str, Any], worker_id: str, error: str) -> bool:
+        now = time.time()
+        retry = job["attempts"] < job["max_attempts"]
+        run_at = now + backoff_seconds(job["attempts"]) if retry else job["run_at"]
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, run_at = ?, lease_until = NULL, updated_at = ? "
+                "WHERE job_id = ? AND worker_id = ?",
+                ("queued" if retry else "failed", error, run_at, now, job["job_id"], worker_id)
+            )
+        return retry
+
+    def has_active_job(self, file_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE file_id = ? AND status IN ('queued', 'running') LIMIT 1",
+                (file_id,)
+            ).fetchone()
+        return row is not None
+
+    def files_with_active_jobs(self, file_ids: List[str]) -> Set[str]:
+        active = set()
+        with self._connect() as conn:
+            # Stay under SQLite's limit on bound parameters
+            for i in range(0, len(file_ids), 500):
+                batch = file_ids[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT DISTINCT file_id FROM jobs WHERE status IN ('queued', 'running') "
+                    f"AND file_id IN ({', '.join('?' * len(batch))})",
+                    batch
+                )
+                active.update(row["file_id"] for row in rows)
+        return active
+
+    def count_active(self, client_id: Optional[str] = None) -> Dict[str, int]:
+        sql = "SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running')"
+        params = ()
+        if client_id is not None:
+            sql += " AND client_id = ?"
+            params = (client_id,)
+        counts = {status: 0 for status in ACTIVE_STATUSES}
+        with self._connect() as conn:
+            for row in conn.execute(sql + " GROUP BY status", params):
+                counts[row["status"]] = row["n"]
+        return counts
+
+    def queue_position(self, file_id: str) -> Optional[int]:
+        with self._connect() as conn:
+            job = conn.execute(
+                "SELECT run_at FROM jobs WHERE file_id = ? AND status = 'queued' LIMIT 1", (file_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            row = conn.execute(
+                "SELECT COUNT(*) AS n FROM jobs WHERE status = 'queued' AND run_at < ?", (job["run_at"],)
+            ).fetchone()
+        return row["n"] + 1
+
+    def acquire_slot(self, name: str, limit: int, holder: str, ttl: float) -> Optional[str]:
+        now = time.time()
+        with self._transaction() as conn:
+            for i in range(limit):
+                slot_id = f"{name}:{i}"
+                row = conn.execute("SELECT holder, expires_at FROM job_slots WHERE slot_id = ?",
+                                   (slot_id,)).fetchone()
+                if row is None or row["holder"] is None or row["expires_at"] < now:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO job_slots (slot_id, holder, expires_at) VALUES (?, ?, ?)",
+                        (slot_id, holder, now + ttl)
+                    )
+                    return slot_id
+        return None
+
+    def renew_slot(self, slot_id: str, holder: str, ttl: float) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE job_slots SET expires_at = ? WHERE slot_id = ? AND holder = ?",
+                (time.time() + ttl, slot_id, holder)
+            )
+            return cursor.rowcount == 1
+
+    def release_slot(self, slot_id: str, holder: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE job_slots SET holder = NULL WHERE slot_id = ? AND holder = ?",
+                         (slot_id, holder))
+
+
+@contextmanager
+def keepalive(fn: Callable[[], Any], interval: float):
+    """Call fn every `interval` seconds in a background thread while the block runs."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                fn()
+            except Exception as e:
+                logger.warning(f"Keepalive call failed: {e}")
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+@contextmanager
+def global_slot(name: str, limit: int, blocking: bool = True):
+    """Hold one of `limit` cluster-wide slots for `name` while the block runs.
+    Blocks until a slot is free. A limit of 0 or less means unlimited.
+    Yields whether a slot is held: with blocking=False it does not wait, and
+    yields False (holding nothing) if all slots are taken.
+    """
+    if limit <= 0:
+        yield True
+        return
+
+    holder = make_worker_id()
+    ttl = settings.JOB_LEASE_SECONDS
+    waited = 0.0
+    while True:
+        slot_id = job_queue.acquire_slot(name, limit, holder, ttl)
+        if slot_id:
+            break
+        if not blocking:
+            yield False
+            return
+        if waited == 0:
+            logger.info(f"Waiting for a free '{name}' slot (limit {limit})")
+        time.sleep(settings.JOB_POLL_INTERVAL)
+        waited += settings.JOB_POLL_INTERVAL
+
+    try:
+        with keepalive(lambda: job_queue.renew_slot(slot_id, holder, ttl), ttl / 3):
+            yield True
+    finally:
+        job_queue.release_slot(slot_id, holder)
+
+
+def _create_job_queue() -> JobQueue:
+    if settings.JOB_QUEUE_BACKEND == "sqlite":
+        return SQLiteJobQueue(settings.JOB_QUEUE_SQLITE_PATH)
+    return MongoJobQueue()
+
+
+job_queue = _create_job_queue()
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import logging
+from typing import Optional
+
+from PIL import Image
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OCRCache:
+    """Persistent on-disk cache of OCR results.
+
+    Entries are keyed by a hash of the rendered page pixels plus the OCR
+    language/config, so the same scanned page is only OCR'd once no matter
+    which document it comes from. The directory is shared by all OCR worker
+    processes; least recently used entries are evicted once it grows past
+    the configured size.
+    """
+
+    EVICT_EVERY = 50  # writes between size checks
+    EVICT_TARGET = 0.9  # shrink to this fraction of max size when evicting
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or settings.OCR_CACHE_DIR
+        self.max_bytes = max_bytes or settings.OCR_CACHE_MAX_MB * 1024 * 1024
+        self.enabled = settings.OCR_CACHE_ENABLED
+        self._writes = 0
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, image: Image.Image, lang: str, config: str) -> str:
+        """Hash page pixels together with the OCR settings that produced the text."""
+        h = hashlib.sha256()
+        h.update(f"{lang}|{config}|{image.mode}|{image.size[0]}x{image.size[1]}|".encode("utf-8"))
+        h.update(image.tobytes())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached text, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            # Refresh mtime so eviction is least-recently-used
+            os.utime(path, None)
+            return text
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"OCR cache read failed for {key[:12]}: {e}")
+            return None
+
+    def set(self, key: str, text: str):
+        """Store OCR text. Writes are atomic so concurrent workers never see partial entries."""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"OCR cache write failed for {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits its size bound.
+        Returns number of entries removed.
+        """
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".txt"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        target = int(self.max_bytes * self.EVICT_TARGET)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+
+        logger.info(f"OCR cache evicted {removed} entries, {total} bytes remain")
+        return removed
+
+
+ocr_cache = OCRCache()
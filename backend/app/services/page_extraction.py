@@ -0,0 +1,71 @@
+"""
+Checkpointed page extraction.
+
+Runs inside the extraction process pool, so it only depends on the
+extractors, the chunker, the page store and the progress publisher (no
+FAISS index or API clients get loaded into extraction workers).
+"""
+from typing import Iterator, Optional, Tuple
+import logging
+import time
+
+from app.services.chunking import TextChunker
+from app.services.text_extract import extract_text, count_pages
+from app.services.page_store import page_store
+from app.services.progress import progress_publisher
+
+logger = logging.getLogger(__name__)
+
+
+def iter_pages(file_id: str, file_path: str, file_type: str) -> Iterator[Tuple[int, str]]:
+    """Extract a file's pages, resuming from pages checkpointed by an earlier run
+    and persisting each new page as it completes. TXT and DOCX pages stream:
+    each is extracted and checkpointed as the iterator is consumed.
+    """
+    completed = page_store.get_completed(file_id)
+    if completed:
+        logger.info(f"Resuming {file_id}: {len(completed)} pages already extracted")
+
+    total = count_pages(file_path, file_type)
+    extracted = len(completed)
+    ocr_done = 0
+
+    def on_page(page_num: int, text: str, meta: dict):
+        nonlocal extracted, ocr_done
+        page_store.save_page(file_id, page_num, text, meta)
+        extracted += 1
+        progress_publisher.publish(file_id, "extract", extracted, total)
+        if meta.get("ocr"):
+            ocr_done += 1
+            progress_publisher.publish(file_id, "ocr", ocr_done)
+
+    try:
+        yield from extract_text(file_path, file_type, completed_pages=completed, on_page=on_page)
+    finally:
+        # Send the last update of each stage; ocr has no total to tell when it ends
+        progress_publisher.end_stage(file_id, "extract")
+        progress_publisher.end_stage(file_id, "ocr")
+
+
+def extract_and_chunk(file_id: str, file_path: str, file_type: str,
+                      chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> dict:
+    """Extract and chunk a file in the same worker process, page by page, so
+    only its chunks (not its page text) are held and sent back.
+    Returns the page count, chunks and the seconds spent in each step.
+    """
+    chunker = TextChunker(chunk_size, chunk_overlap)
+    start = time.perf_counter()
+    page_count = 0
+    chunks = []
+    chunk_seconds = 0.0
+    for page_num, text in iter_pages(file_id, file_path, file_type):
+        page_count += 1
+        chunk_start = time.perf_counter()
+        chunks.extend(chunker.chunk_text(text, page_num))
+        chunk_seconds += time.perf_counter() - chunk_start
+    return {
+        "pages": page_count,
+        "chunks": chunks,
+        "extract_seconds": time.perf_counter() - start - chunk_seconds,
+        "chunk_seconds": chunk_seconds
+    }
@@ -0,0 +1,91 @@
+from pymongo import ASCENDING
+from typing import Dict, List, Tuple
+from datetime import datetime
+import logging
+
+from app.services.db import get_db
+from app.models.pydantic_models import PageModel
+
+logger = logging.getLogger(__name__)
+
+
+class PageStore:
+    """Per-page extracted text, persisted as each page completes.
+
+    Lets an interrupted ingestion resume from the pages already extracted
+    (including OCR), and lets a file be re-chunked without re-extraction.
+    """
+
+    def __init__(self):
+        self.db = get_db()
+        self.pages = self.db['pages']
+
+    def save_page(self, file_id: str, page_num: int, text: str, meta: dict = None):
+        """Upsert one page's text and extraction metadata."""
+        page = PageModel(
+            file_id=file_id,
+            page_num=page_num,
+            text=text,
+            meta=meta or {},
+            created_at=datetime.utcnow()
+        )
+        self.pages.update_one(
+            {"file_id": file_id, "page_num": page_num},
+            {"$set": page.dict()},
+            upsert=True
+        )
+
+    def get_completed(self, file_id: str) -> Dict[int, str]:
+        """Return {page_num: text} for pages already extracted."""
+        cursor = self.pages.find(
+            {"file_id": file_id},
+            {"_id": 0, "page_num": 1, "text": 1}
+        )
+        return {doc['page_num']: doc['text'] for doc in cursor}
+
+    def get_pages(self, file_id: str) -> List[Tuple[int, str]]:
+        """Return stored pages as (page_num, text) in page order."""
+        cursor = self.pages.find(
+            {"file_id": file_id},
+            {"_id": 0, "page_num": 1, "text": 1}
+        ).sort("page_num", ASCENDING)
+        return [(doc['page_num'], doc['text']) for doc in cursor]
+
+    def copy_pages(self, source_file_id: str, file_id: str) -> int:
+        """Copy stored pages of one file to another (for deduplicated uploads)."""
+        pages = [
+            {**doc, "file_id": file_id, "created_at": datetime.utcnow()}
+            for doc in self.pages.find({"file_id": source_file_id}, {"_id": 0})
+        ]
+        if pages:
+            self.pages.insert_many(pages)
+        return len(pages)
+
+    def get_degraded(self, file_id: str) -> List[dict]:
+        """Pages that fell back to a cheaper extraction path, in page order."""
+        cursor = self.pages.find(
+            {"file_id": file_id, "meta.fallbacks": {"$exists": True, "$ne": []}},
+            {"_id": 0, "page_num": 1, "meta.fallbacks": 1, "meta.fallback_reason": 1}
+        ).sort("page_num", ASCENDING)
+        return [
+            {
+                "page_num": doc['page_num'],
+                "fallbacks": doc['meta']['fallbacks'],
+                "reason": doc['meta'].get('fallback_reason')
+            }
+            for doc in cursor
+        ]
+
+    def count_pages(self, file_id: str) -> int:
+        return self.pages.count_documents({"file_id": file_id})
+
+    def delete_pages(self, file_id: str) -> int:
+        result = self.pages.delete_many({"file_id": file_id})
+        return result.deleted_count
+
+    def delete_pages_of(self, file_ids: List[str]) -> int:
+        result = self.pages.delete_many({"file_id": {"$in": file_ids}})
+        return result.deleted_count
+
+
+page_store = PageStore()
@@ -0,0 +1,194 @@
+"""
+Ingestion progress events.
+
+The pipeline (API, workers and extraction processes) publishes stage-level
+events to the capped `progress_events` collection. Each API process tails
+that collection once and fans events out to its /ws/progress subscribers,
+so clients get pushed updates instead of polling GET /files.
+"""
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+import asyncio
+import logging
+import threading
+import time
+
+from app.config import settings
+from app.services.db import get_db
+
+logger = logging.getLogger(__name__)
+
+# Stages in pipeline order; "done" and "failed" are terminal
+STAGES = ("extract", "ocr", "embed", "index")
+TERMINAL_STAGES = ("done", "failed")
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def serialize_event(doc: dict) -> dict:
+    event = {k: v for k, v in doc.items() if k != '_id'}
+    if isinstance(event.get("ts"), datetime):
+        event["ts"] = event["ts"].isoformat()
+    return event
+
+
+class ProgressPublisher:
+    """Publishes progress events, throttled per file and stage.
+
+    Publishing never raises: progress is best effort and must not fail ingestion.
+    """
+
+    def __init__(self):
+        self.db = get_db()
+        self.events = self.db['progress_events']
+        # Per (file_id, stage) until the stage ends: start time, last send, held-back update
+        self._stage_starts: Dict[tuple, float] = {}
+        self._last_sent: Dict[tuple, float] = {}
+        self._pending: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+        self._collection_ready = False
+
+    def _ensure_collection(self):
+        if self._collection_ready:
+            return
+        try:
+            self.db.create_collection(
+                "progress_events", capped=True,
+                size=settings.PROGRESS_EVENTS_MAX_MB * 1024 * 1024
+            )
+        except CollectionInvalid:
+            pass  # already exists
+        self._collection_ready = True
+
+    def publish(self, file_id: str, stage: str, done: Optional[int] = None,
+                total: Optional[int] = None, **extra):
+        """Publish `done` of `total` units for a stage, with an ETA from the
+        stage's rate so far. Intermediate updates closer together than
+        PROGRESS_MIN_INTERVAL are held back, and only the newest is kept.
+        The stage ends when done reaches total, or at end_stage()/finish()
+        for stages without a total. Its last update always goes out then.
+        """
+        key = (file_id, stage)
+        now = time.monotonic()
+        with self._lock:
+            started = self._stage_starts.setdefault(key, now)
+            eta = None
+            if done and total and done < total:
+                eta = round((now - started) / done * (total - done), 1)
+            event = {
+                "file_id": file_id,
+                "stage": stage,
+                "done": done,
+                "total": total,
+                "eta_seconds": eta,
+                "ts": datetime.utcnow(),
+                **extra
+            }
+            if done is not None and total is not None and done >= total:
+                self._forget(key)
+            elif now - self._last_sent.get(key, 0.0) < settings.PROGRESS_MIN_INTERVAL:
+                self._pending[key] = event
+                return
+            else:
+                self._last_sent[key] = now
+                self._pending.pop(key, None)
+        self._insert(event)
+
+    def end_stage(self, file_id: str, stage: str):
+        """Mark a stage finished: send its held-back last update, if any."""
+        with self._lock:
+            event = self._forget((file_id, stage))
+        if event:
+            self._insert(event)
+
+    def _forget(self, key: tuple) -> Optional[dict]:
+        """Drop a stage's state (caller holds the lock); returns its held-back update."""
+        self._stage_starts.pop(key, None)
+        self._last_sent.pop(key, None)
+        return self._pending.pop(key, None)
+
+    def finish(self, file_id: str, status: str, **extra):
+        """Publish the terminal event for a file ("done" when indexed, else "failed"),
+        after the held-back updates of its stages still open in this process.
+        """
+        with self._lock:
+            held = [self._forget(key) for key in list(self._stage_starts) if key[0] == file_id]
+        for event in held:
+            if event:
+                self._insert(event)
+        stage = "done" if status == "indexed" else "failed"
+        self._insert({"file_id": file_id, "stage": stage, "status": status, "ts": datetime.utcnow(), **extra})
+
+    def _insert(self, event: dict):
+        try:
+            self._ensure_collection()
+            self.events.insert_one(event)
+        except Exception as e:
+            logger.warning(f"Failed to publish progress for {event.get('file_id')}: {e}")
+
+
+class ProgressHub:
+    """Single tailable cursor on progress_events per process, fanned out to
+    asyncio subscriber queues (one per WebSocket).
+    """
+
+    def __init__(self):
+        self.events = get_db()['progress_events']
+        self._subscribers: Dict[asyncio.Queue, Optional[set]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def subscribe(self, file_ids: Optional[Iterable[str]] = None) -> asyncio.Queue:
+        """Queue receiving events for file_ids (all files if None)."""
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread = threading.Thread(target=self._tail, name="progress-tail", daemon=True)
+            self._thread.start()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[queue] = set(file_ids) if file_ids else None
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.pop(queue, None)
+
+    def stop(self):
+        self._stop.set()
+
+    def _tail(self):
+        last_id = None
+        positioned = False
+        while not self._stop.is_set():
+            try:
+                if not positioned:
+                    # Start after the newest existing event: subscribers only want live updates.
+                    # If there is none, every event is new: tail from the start ($natural order)
+                    newest = list(self.events.find({}, {"_id": 1}).sort("$natural", -1).limit(1))
+                    last_id = newest[0]["_id"] if newest else None
+                    positioned = True
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                cursor = self.events.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive and not self._stop.is_set():
+                    for doc in cursor:
+                        last_id = doc["_id"]
+                        self._loop.call_soon_threadsafe(self._fan_out, serialize_event(doc))
+                    if last_id is None:
+                        break  # empty collection: tailable cursors die at once
+            except Exception as e:
+                logger.warning(f"Progress tail interrupted: {e}")
+            self._stop.wait(1)
+
+    def _fan_out(self, event: dict):
+        for queue, file_ids in list(self._subscribers.items()):
+            if file_ids is not None and event.get("file_id") not in file_ids:
+                continue
+            if queue.full():
+                # Slow client: drop its oldest event rather than block everyone
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+progress_publisher = ProgressPublisher()
+progress_hub = ProgressHub()
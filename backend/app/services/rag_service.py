@@ -1,11 +1,14 @@
 """
 RAG Service with scoped retrieval and source citation support.
 """
+from collections import OrderedDict
 from typing import List, Optional, Tuple, Dict
-from pymongo import MongoClient
 import logging
 
 from app.config import settings
+
+from app.services.db import get_async_db
+from app.services.executors import run_io
 from app.services.embedding import embedding_service
 from app.services.faiss_service import faiss_service
 from app.models.pydantic_models import SourceModel
@@ -15,12 +18,14 @@ logger = logging.getLogger(__name__)
 
 class RAGService:
     def __init__(self):
-        self.client = MongoClient(settings.MONGO_URL)
-        self.db = self.client[settings.MONGO_DB]
+        self.db = get_async_db()
         self.chunks_col = self.db['chunks']
         self.files_col = self.db['files']
+        # chunk_id -> chunk text, the only field that never changes under a
+        # chunk_id (a new file version refreshes titles and pages in place)
+        self._chunk_cache: "OrderedDict[str, str]" = OrderedDict()
     
-    def retrieve_contexts(
+    async def retrieve_contexts(
         self, 
         question: str, 
         top_k: int = 5,
@@ -37,24 +42,34 @@ class RAGService:
         Returns:
             Tuple of (contexts, sources) where:
             - contexts: List of dicts with content, title, page info, filename
-            - sources: List of SourceModel for citation tracking
+            - sources: List of SourceModel (chunk references) for citation tracking
         """
-        # Generate query embedding
-        query_embedding = embedding_service.embed_texts([question])[0]
+        # Generate query embedding (blocking HTTP call, off the event loop)
+        query_embedding = (await run_io(embedding_service.embed_texts, [question]))[0]
         
         # Search FAISS (if scoped, search more to allow filtering)
         search_k = top_k * 10 if file_ids else top_k
-        faiss_indices, scores = faiss_service.search(query_embedding, k=search_k)
+        faiss_indices, scores = await run_io(faiss_service.search, query_embedding, search_k)
         
         # Get chunks from MongoDB
         chunks_cursor = self.chunks_col.find({
             "faiss_index_id": {"$in": faiss_indices}
         })
         
-        # Build lookup dict
+        # Build lookup dict. Deduplicated files share vectors, so one FAISS id
+        # can map to chunks of several files; each vector yields one context.
         chunks_by_faiss_id = {}
-        for chunk in chunks_cursor:
-            chunks_by_faiss_id[chunk['faiss_index_id']] = chunk
+        async for chunk in chunks_cursor:
+            chunks_by_faiss_id.setdefault(chunk['faiss_index_id'], []).append(chunk)
+        
+        # Filenames of every candidate file in one query
+        candidate_file_ids = {c['file_id'] for chunks in chunks_by_faiss_id.values() for c in chunks}
+        filenames = {
+            doc['file_id']: doc['filename']
+            async for doc in self.files_col.find(
+                {"file_id": {"$in": list(candidate_file_ids)}}, {"_id": 0, "file_id": 1, "filename": 1}
+            )
+        }
         
         # Build contexts in relevance order
         contexts = []
@@ -64,15 +79,15 @@ class RAGService:
             if faiss_id not in chunks_by_faiss_id:
                 continue
             
-            chunk = chunks_by_faiss_id[faiss_id]
-            
             # Apply file filter if specified (scoped retrieval)
-            if file_ids and chunk['file_id'] not in file_ids:
-                continue
+            candidates = chunks_by_faiss_id[faiss_id]
+            if file_ids:
+                candidates = [c for c in candidates if c['file_id'] in file_ids]
+                if not candidates:
+                    continue
+            chunk = candidates[0]
             
-            # Get filename
-            file_doc = self.files_col.find_one({"file_id": chunk['file_id']})
-            filename = file_doc['filename'] if file_doc else "Unknown"
+            filename = filenames.get(chunk['file_id'], "Unknown")
             
             # Build context
             context = {
@@ -91,9 +106,7 @@ class RAGService:
                 chunk_id=chunk['chunk_id'],
                 page_start=chunk['page_start'],
                 page_end=chunk['page_end'],
-                filename=filename,
-                title=chunk.get('title'),
-                content=chunk.get('content')  # For hover tooltip
+                score=float(score)
             )
             sources.append(source)
             
@@ -104,6 +117,48 @@ class RAGService:
         logger.info(f"Retrieved {len(contexts)} contexts (scoped: {file_ids is not None})")
         return contexts, sources
     
+    async def get_chunks(self, chunk_ids: List[str]) -> Dict[str, dict]:
+        """Text, title, pages and filename of cited chunks, keyed by chunk_id.
+        Titles, pages and filenames are read on every call, since updating
+        or renaming a file changes them; only the text comes from an LRU
+        cache of CHUNK_CACHE_SIZE chunks. Unknown ids are left out.
+        """
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        projection = {"_id": 0, "chunk_id": 1, "file_id": 1, "title": 1, "page_start": 1, "page_end": 1}
+        chunks = await self.chunks_col.find({"chunk_id": {"$in": chunk_ids}}, projection).to_list(length=None)
+        
+        found = {chunk['chunk_id']: chunk for chunk in chunks}
+        contents = {}
+        for chunk_id in chunk_ids:
+            if chunk_id not in found:
+                self._chunk_cache.pop(chunk_id, None)  # deleted with its file
+            elif chunk_id in self._chunk_cache:
+                self._chunk_cache.move_to_end(chunk_id)
+                contents[chunk_id] = self._chunk_cache[chunk_id]
+        
+        missing = [chunk_id for chunk_id in found if chunk_id not in contents]
+        if missing:
+            async for doc in self.chunks_col.find({"chunk_id": {"$in": missing}}, {"_id": 0, "chunk_id": 1, "content": 1}):
+                contents[doc['chunk_id']] = self._chunk_cache[doc['chunk_id']] = doc['content']
+            while len(self._chunk_cache) > settings.CHUNK_CACHE_SIZE:
+                self._chunk_cache.popitem(last=False)
+        
+        filenames = {
+            doc['file_id']: doc['filename']
+            async for doc in self.files_col.find(
+                {"file_id": {"$in": list({c['file_id'] for c in chunks})}}, {"_id": 0, "file_id": 1, "filename": 1}
+            )
+        }
+        result = {}
+        for chunk_id in chunk_ids:
+            # A chunk deleted between the two reads has no content
+            if chunk_id in found and chunk_id in contents:
+                chunk = found[chunk_id]
+                chunk['content'] = contents[chunk_id]
+                chunk['filename'] = filenames.get(chunk['file_id'], "Unknown")
+                result[chunk_id] = chunk
+        return result
+    
     def format_contexts_with_citations(self, contexts: List[Dict]) -> Tuple[List[Dict], str]:
         """
         Format contexts with citation numbers [1], [2], etc.
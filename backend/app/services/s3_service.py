@@ -1,8 +1,112 @@
 import boto3
 import os
-from typing import BinaryIO
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, List
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+# Keys per DeleteObjects request (S3 maximum)
+S3_DELETE_BATCH = 1000
+
+
+class S3MultipartWriter:
+    """Streams an object to S3 as a multipart upload while it is being written.
+
+    Full parts are uploaded concurrently by a small thread pool. write() blocks
+    once max_inflight parts are pending, so memory stays around
+    (max_inflight + 1) * part_size whatever the object size. Objects smaller
+    than one part are sent with a single put_object on close().
+    """
+
+    def __init__(self, client, bucket: str, s3_key: str, part_size: int, max_inflight: int):
+        self.client = client
+        self.bucket = bucket
+        self.s3_key = s3_key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="s3-part")
+
+    def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit_part(part)
+
+    def _submit_part(self, body: bytes):
+        # Fail fast instead of streaming the rest of a doomed upload
+        for future in self._futures:
+            if future.done() and future.exception():
+                raise future.exception()
+        
+        if self._upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.s3_key)
+            self._upload_id = response["UploadId"]
+        
+        self._slots.acquire()
+        future = self._pool.submit(self._upload_part, len(self._futures) + 1, body)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number: int, body: bytes) -> dict:
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.s3_key, UploadId=self._upload_id,
+            PartNumber=part_number, Body=body
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self) -> str:
+        """Flush the last part, complete the upload and return the S3 path."""
+        try:
+            if self._upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.s3_key, Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._submit_part(bytes(self._buffer))
+                parts = [future.result() for future in self._futures]
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.s3_key, UploadId=self._upload_id,
+                    MultipartUpload={"Parts": parts}
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._pool.shutdown(wait=False)
+        return f"s3://{self.bucket}/{self.s3_key}"
+
+    def write_from(self, file_obj: BinaryIO, chunk_size: int) -> str:
+        """Stream file_obj into the upload and complete it."""
+        try:
+            while True:
+                chunk = file_obj.read(chunk_size)
+                if not chunk:
+                    break
+                self.write(chunk)
+        except Exception:
+            self.abort()
+            raise
+        return self.close()
+
+    def abort(self):
+        """Drop the upload and any parts already stored."""
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if self._upload_id is not None:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.s3_key, UploadId=self._upload_id)
+            except Exception as e:
+                logger.warning(f"Failed to abort multipart upload of {self.s3_key}: {e}")
+            self._upload_id = None
+
 
 class S3Service:
     def __init__(self):
@@ -14,28 +118,57 @@ class S3Service:
         )
         self.bucket = settings.AWS_S3_BUCKET
 
+    def path_for(self, s3_key: str) -> str:
+        """s3://bucket/key path for s3_key."""
+        return f"s3://{self.bucket}/{s3_key}"
+
     def upload_file(self, file_obj: BinaryIO, s3_key: str) -> str:
         """Upload file to S3 and return S3 path."""
         self.client.upload_fileobj(file_obj, self.bucket, s3_key)
-        return f"s3://{self.bucket}/{s3_key}"
+        return self.path_for(s3_key)
 
     def upload_local_file(self, local_path: str, s3_key: str) -> str:
         """Upload local file to S3."""
         self.client.upload_file(local_path, self.bucket, s3_key)
-        return f"s3://{self.bucket}/{s3_key}"
+        return self.path_for(s3_key)
+
+    def open_multipart(self, s3_key: str) -> S3MultipartWriter:
+        """Start a streaming multipart upload to s3_key."""
+        return S3MultipartWriter(self.client, self.bucket, s3_key,
+                                 settings.S3_PART_SIZE, settings.S3_MAX_INFLIGHT_PARTS)
 
     def download_file(self, s3_key: str, local_path: str):
         """Download file from S3 to local path."""
         self.client.download_file(self.bucket, s3_key, local_path)
 
+    def key_from_path(self, s3_path: str) -> str:
+        """Extract s3_key from s3://bucket/key format."""
+        if s3_path.startswith("s3://"):
+            return s3_path.split(f"{self.bucket}/", 1)[1]
+        return s3_path
+
     def delete_file(self, s3_path: str):
         """Delete file from S3."""
-        # Extract s3_key from s3://bucket/key format
-        if s3_path.startswith("s3://"):
-            s3_key = s3_path.split(f"{self.bucket}/", 1)[1]
-        else:
-            s3_key = s3_path
-        self.client.delete_object(Bucket=self.bucket, Key=s3_key)
+        self.client.delete_object(Bucket=self.bucket, Key=self.key_from_path(s3_path))
+
+    def delete_files(self, s3_paths: List[str]) -> List[str]:
+        """Delete many objects with multi-object deletes (up to 1000 keys per
+        request). Returns the paths that could not be deleted.
+        """
+        failed = []
+        keys = [self.key_from_path(path) for path in s3_paths]
+        for i in range(0, len(keys), S3_DELETE_BATCH):
+            batch = keys[i:i + S3_DELETE_BATCH]
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+                )
+                failed.extend(self.path_for(error["Key"]) for error in response.get("Errors", []))
+            except Exception as e:
+                logger.warning(f"S3 batch delete of {len(batch)} objects failed: {e}")
+                failed.extend(self.path_for(key) for key in batch)
+        return failed
 
     def get_file_url(self, s3_key: str) -> str:
         """Get public URL for S3 file."""
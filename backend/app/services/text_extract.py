@@ -1,15 +1,45 @@
 import PyPDF2
 import docx
+from docx.oxml.ns import qn
 import pytesseract
 from pdf2image import convert_from_path
-from PIL import Image
+from pdf2image.exceptions import PDFPopplerTimeoutError
+from PIL import Image, ImageSequence
 import os
+import queue
+import tempfile
 import logging
-from typing import List, Tuple, Optional
+import statistics
+import unicodedata
+import importlib.util
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import List, Tuple, Optional, Iterable, Iterator, Dict, Callable
 from pathlib import Path
 
+from app.config import settings
+from app.services.ocr_cache import ocr_cache
+from app.services import executors
+
 logger = logging.getLogger(__name__)
 
+# Configure tesseract for better results
+OCR_LANG = 'vie+eng'
+OCR_PSM = 6
+OCR_CONFIG = r'--oem 3 --psm 6'
+OCR_DPI = 300
+
+# on_page(page_num, text, meta) checkpoint callback used by extract_text
+PageCallback = Callable[[int, str, dict], None]
+
+# Combining marks / letters that only Vietnamese uses among our OCR languages
+# (hook above, dot below, horn) plus đ, which does not decompose
+_VIETNAMESE_MARKS = {'\u0309', '\u0323', '\u031b'}
+_VIETNAMESE_LETTERS = {'đ', 'Đ'}
+
 
 def assess_text_quality(text: str) -> dict:
     """Assess quality of extracted text to determine if OCR is needed.
@@ -48,144 +78,1043 @@ def assess_text_quality(text: str) -> dict:
     }
 
 
-def ocr_page_image(image: Image.Image, page_num: int) -> str:
+class OCRTimeoutError(Exception):
+    """Tesseract exceeded the per-page time budget."""
+
+
+def ocr_page_image(image: Image.Image, page_num: int, lang: str = OCR_LANG, config: str = OCR_CONFIG,
+                   timeout: float = 0) -> str:
     """Perform OCR on a single page image.
+    Results are cached on disk by page content, so repeated pages skip Tesseract.
+    Raises OCRTimeoutError if Tesseract runs longer than timeout seconds (0 = no limit).
     Returns: extracted text
     """
     try:
-        # Configure tesseract for better results
-        custom_config = r'--oem 3 --psm 6'
-        text = pytesseract.image_to_string(image, lang='vie+eng', config=custom_config)
+        cache_key = ocr_cache.make_key(image, lang, config)
+        cached = ocr_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"OCR cache hit for page {page_num} ({len(cached)} chars)")
+            return cached
+        
+        text = pytesseract.image_to_string(image, lang=lang, config=config, timeout=timeout)
         logger.info(f"OCR extracted {len(text)} chars from page {page_num}")
+        ocr_cache.set(cache_key, text)
         return text
+    except RuntimeError as e:
+        # pytesseract kills Tesseract and raises RuntimeError('Tesseract process timeout')
+        if "timeout" in str(e).lower():
+            raise OCRTimeoutError(f"OCR exceeded {timeout}s on page {page_num}")
+        logger.error(f"OCR failed for page {page_num}: {e}")
+        return ""
     except Exception as e:
         logger.error(f"OCR failed for page {page_num}: {e}")
         return ""
 
 
-def extract_text_from_pdf(file_path: str, use_ocr: bool = True) -> List[Tuple[int, str]]:
+class _TimeoutWorker:
+    """A daemon thread that runs calls one at a time, each with a timeout.
+    A call that overruns cannot be stopped: call() then retires the worker
+    (its thread finishes the call in the background and exits) and the
+    caller must start a new one and not share state with the old call.
+    """
+    
+    def __init__(self):
+        self._calls = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def _run(self):
+        while True:
+            fn, done, result = self._calls.get()
+            if fn is None:
+                return
+            try:
+                result["value"] = fn()
+            except Exception as e:
+                result["error"] = e
+            done.set()
+    
+    def call(self, fn: Callable, timeout: float) -> Tuple[bool, object]:
+        """Run fn() on the worker thread. Returns (finished, result)."""
+        done, result = threading.Event(), {}
+        self._calls.put((fn, done, result))
+        if not done.wait(timeout):
+            self.stop()
+            return False, None
+        if "error" in result:
+            raise result["error"]
+        return True, result.get("value")
+    
+    def stop(self):
+        self._calls.put((None, None, None))
+
+
+def _time_left(deadline: Optional[float]) -> Optional[float]:
+    """Seconds until a time.monotonic() deadline, or None if there is none."""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _is_vietnamese_char(c: str) -> bool:
+    if c in _VIETNAMESE_LETTERS:
+        return True
+    return any(m in _VIETNAMESE_MARKS for m in unicodedata.normalize('NFD', c))
+
+
+def detect_ocr_lang(text: str, special_ratio: float = 0.0) -> str:
+    """Pick Tesseract language packs from a quick script check of the text layer.
+    Falls back to OCR_LANG when the text layer is too short or too garbled to trust.
+    """
+    letters = [c for c in text if c.isalpha()]
+    if len(letters) < 50 or special_ratio > 0.15:
+        return OCR_LANG
+    
+    vi_ratio = sum(1 for c in letters if _is_vietnamese_char(c)) / len(letters)
+    if vi_ratio == 0:
+        return 'eng'
+    if vi_ratio >= 0.1:
+        return 'vie'
+    return OCR_LANG
+
+
+def choose_ocr_psm(text: str) -> int:
+    """Use sparse-text segmentation for table/form-like pages (many short lines)."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) >= 8 and statistics.median(len(line) for line in lines) < 20:
+        return 11
+    return OCR_PSM
+
+
+def choose_render_dpi(width_pt: float, height_pt: float) -> int:
+    """Pick a render DPI so the long side lands near OCR_TARGET_PIXELS.
+    Large-format pages render at lower DPI, small pages stay at OCR_DPI.
+    """
+    long_side_in = max(width_pt, height_pt) / 72.0
+    if long_side_in <= 0:
+        return OCR_DPI
+    dpi = int(settings.OCR_TARGET_PIXELS / long_side_in)
+    return max(settings.OCR_MIN_DPI, min(OCR_DPI, dpi))
+
+
+def plan_page_ocr(text: str, quality: dict, page_size: Optional[Tuple[float, float]] = None,
+                  adaptive: bool = None) -> dict:
+    """Decide render DPI, language packs and Tesseract config for one PDF page.
+    
+    Args:
+        text: Text layer extracted from the page
+        quality: Result of assess_text_quality(text)
+        page_size: (width, height) in PDF points, if the backend knows it
+        adaptive: Override settings.OCR_ADAPTIVE
+    
+    Returns: dict with dpi, lang, config
+    """
+    if adaptive is None:
+        adaptive = settings.OCR_ADAPTIVE
+    if not adaptive:
+        return {"dpi": OCR_DPI, "lang": OCR_LANG, "config": OCR_CONFIG}
+    
+    dpi = choose_render_dpi(*page_size) if page_size else OCR_DPI
+    
+    psm = choose_ocr_psm(text)
+    return {
+        "dpi": dpi,
+        "lang": detect_ocr_lang(text, quality.get("special_ratio", 0.0)),
+        "config": f"--oem 3 --psm {psm}"
+    }
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Otsu's threshold for a 256-bin grayscale histogram."""
+    total = sum(histogram)
+    sum_all = sum(i * h for i, h in enumerate(histogram))
+    sum_bg = 0.0
+    weight_bg = 0
+    best_threshold, best_variance = 127, 0.0
+    for i, h in enumerate(histogram):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = i, variance
+    return best_threshold
+
+
+def preprocess_ocr_image(image: Image.Image, mode: str = None) -> Image.Image:
+    """Convert a page image to grayscale or binary before OCR (settings.OCR_PREPROCESS)."""
+    mode = mode or settings.OCR_PREPROCESS
+    if mode == "none":
+        return image
+    gray = image.convert("L")
+    if mode == "binary":
+        threshold = _otsu_threshold(gray.histogram())
+        return gray.point(lambda p: 255 if p > threshold else 0, mode="1")
+    return gray
+
+
+def _ocr_image_file(image_path: str, page_num: int, lang: str = OCR_LANG, config: str = OCR_CONFIG,
+                    timeout: float = 0) -> str:
+    """OCR a rendered page image from disk.
+    Runs inside an OCR worker process.
+    """
+    with Image.open(image_path) as image:
+        return ocr_page_image(preprocess_ocr_image(image), page_num, lang, config, timeout)
+
+
+def _group_page_runs(page_nums: List[int], max_run: int, keys: dict = None) -> List[Tuple[int, int]]:
+    """Group sorted page numbers into contiguous (first, last) runs of at most max_run pages.
+    When keys is given, a run only spans pages with the same key (e.g. render DPI).
+    """
+    runs = []
+    for page_num in page_nums:
+        if (runs and page_num == runs[-1][1] + 1 and page_num - runs[-1][0] < max_run
+                and (keys is None or keys[page_num] == keys[runs[-1][0]])):
+            runs[-1] = (runs[-1][0], page_num)
+        else:
+            runs.append((page_num, page_num))
+    return runs
+
+
+def render_pdf_pages(file_path: str, first_page: int, last_page: int, output_folder: str, dpi: int = OCR_DPI,
+                     timeout: Optional[float] = None) -> List[str]:
+    """Rasterize a contiguous page range with a single poppler call.
+    Pages are written to output_folder; returns their paths in page order.
+    Raises PDFPopplerTimeoutError if poppler runs longer than timeout seconds.
+    """
+    return convert_from_path(
+        file_path,
+        dpi=dpi,
+        timeout=timeout or None,
+        first_page=first_page,
+        last_page=last_page,
+        output_folder=output_folder,
+        fmt="png",
+        paths_only=True,
+        grayscale=settings.OCR_PREPROCESS != "none",
+        thread_count=settings.OCR_RENDER_THREADS,
+        poppler_path=settings.POPPLER_PATH or None
+    )
+
+
+class PdfTextBackend:
+    """Extracts the text layer of a PDF, one page at a time.
+    
+    Subclasses wrap a specific library. Use as a context manager:
+    
+        with get_pdf_backend()(file_path) as doc:
+            for page_num, text, page_size in doc.iter_pages():
+                ...
+    
+    page_size is (width, height) in PDF points, or None if unknown.
+    A page that fails to extract yields empty text instead of raising, so it
+    falls through to OCR. Backends that honour page_timeout yield empty text
+    for pages that overrun it and add their numbers to timed_out_pages.
+    kills_on_timeout says whether an overrunning page is actually stopped
+    (a subprocess) or only abandoned (a thread).
+    """
+    name = "base"
+    kills_on_timeout = False
+    
+    def __init__(self, file_path: str, page_timeout: float = 0):
+        self.file_path = file_path
+        self.page_timeout = page_timeout
+        self.timed_out_pages = set()
+    
+    @classmethod
+    def available(cls) -> bool:
+        return True
+    
+    def iter_pages(self) -> Iterator[Tuple[int, str, Optional[Tuple[float, float]]]]:
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PyPDF2Backend(PdfTextBackend):
+    """Default backend: PyPDF2 `page.extract_text()`. Honours page_timeout
+    by running pages on one worker thread; an overrunning page is abandoned,
+    not stopped (see _TimeoutWorker).
+    """
+    name = "pypdf2"
+    
+    def __init__(self, file_path: str, page_timeout: float = 0):
+        super().__init__(file_path, page_timeout)
+        self._worker = None
+        self._open()
+    
+    def _open(self):
+        self._file = open(self.file_path, 'rb')
+        self.reader = PyPDF2.PdfReader(self._file)
+    
+    def iter_pages(self):
+        total_pages = len(self.reader.pages)
+        for page_num in range(1, total_pages + 1):
+            page = self.reader.pages[page_num - 1]
+            try:
+                page_size = (float(page.mediabox.width), float(page.mediabox.height))
+            except Exception:
+                page_size = None
+            try:
+                if self.page_timeout:
+                    if self._worker is None:
+                        self._worker = _TimeoutWorker()
+                    finished, text = self._worker.call(page.extract_text, self.page_timeout)
+                    if not finished:
+                        logger.warning(f"Page {page_num}: PyPDF2 exceeded {self.page_timeout}s, skipping text layer")
+                        self.timed_out_pages.add(page_num)
+                        # The abandoned call still holds the old reader; use a fresh one
+                        self._worker = None
+                        self._open()
+                        text = ""
+                else:
+                    text = page.extract_text()
+                text = text or ""
+            except Exception as e:
+                logger.error(f"Page {page_num}: PyPDF2 extraction failed: {e}")
+                text = ""
+            yield page_num, text, page_size
+    
+    def close(self):
+        if self._worker is not None:
+            self._worker.stop()
+        self._file.close()
+
+
+class PyMuPDFBackend(PdfTextBackend):
+    """PyMuPDF (`pip install pymupdf`): much faster on large text-layer PDFs."""
+    name = "pymupdf"
+    
+    @classmethod
+    def available(cls) -> bool:
+        return importlib.util.find_spec("fitz") is not None
+    
+    def __init__(self, file_path: str, page_timeout: float = 0):
+        super().__init__(file_path, page_timeout)
+        import fitz
+        self.doc = fitz.open(file_path)
+    
+    def iter_pages(self):
+        for index in range(self.doc.page_count):
+            page_num = index + 1
+            try:
+                page = self.doc.load_page(index)
+                text = page.get_text("text", sort=True) or ""
+                page_size = (float(page.rect.width), float(page.rect.height))
+            except Exception as e:
+                logger.error(f"Page {page_num}: PyMuPDF extraction failed: {e}")
+                text, page_size = "", None
+            yield page_num, text, page_size
+    
+    def close(self):
+        self.doc.close()
+
+
+class PdfminerBackend(PdfTextBackend):
+    """pdfminer.six (`pip install pdfminer.six`): slower, but layout-aware and
+    more faithful word spacing on complex pages."""
+    name = "pdfminer"
+    
+    @classmethod
+    def available(cls) -> bool:
+        return importlib.util.find_spec("pdfminer") is not None
+    
+    def iter_pages(self):
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+        
+        page_num = 0
+        pages = extract_pages(self.file_path)
+        while True:
+            try:
+                layout = next(pages)
+            except StopIteration:
+                return
+            except Exception as e:
+                # pdfminer cannot continue after a parse error mid-document
+                logger.error(f"Page {page_num + 1}: pdfminer extraction failed: {e}")
+                return
+            page_num += 1
+            text = "".join(el.get_text() for el in layout if isinstance(el, LTTextContainer))
+            yield page_num, text, (float(layout.width), float(layout.height))
+
+
+class PdftotextBackend(PdfTextBackend):
+    """poppler's `pdftotext` CLI (ships with the poppler install OCR already needs).
+    Runs once per document; pages are split on form feeds. If that run fails
+    or times out, the pages it did not finish are extracted one `pdftotext`
+    call each, so one bad page only loses its own text layer (and goes to
+    OCR). Page timeouts kill the subprocess.
+    """
+    name = "pdftotext"
+    kills_on_timeout = True
+    
+    def _command(self) -> str:
+        exe = "pdftotext.exe" if os.name == "nt" else "pdftotext"
+        return os.path.join(settings.POPPLER_PATH, exe) if settings.POPPLER_PATH else exe
+    
+    @classmethod
+    def available(cls) -> bool:
+        return bool(settings.POPPLER_PATH) or shutil.which("pdftotext") is not None
+    
+    def _run(self, timeout: Optional[float], page_num: Optional[int] = None) -> bytes:
+        pages = ["-f", str(page_num), "-l", str(page_num)] if page_num else []
+        result = subprocess.run(
+            [self._command(), "-layout", "-enc", "UTF-8", *pages, self.file_path, "-"],
+            capture_output=True,
+            check=True,
+            timeout=timeout
+        )
+        return result.stdout
+    
+    def iter_pages(self):
+        try:
+            output = self._run(settings.EXTRACT_DOC_TIMEOUT or None)
+            failed = False
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"pdftotext failed on the whole document ({e}); extracting page by page")
+            output = e.stdout or b""
+            failed = True
+        
+        # pdftotext terminates every page with a form feed, so the last piece is
+        # empty after a clean run and the unfinished page after a failed one
+        pages = output.decode("utf-8", errors="replace").split("\f")
+        pages.pop()
+        for page_num, text in enumerate(pages, start=1):
+            yield page_num, text, None
+        if not failed:
+            return
+        
+        total_pages = len(PyPDF2.PdfReader(self.file_path).pages)
+        for page_num in range(len(pages) + 1, total_pages + 1):
+            try:
+                text = self._run(self.page_timeout or None, page_num).decode("utf-8", errors="replace").split("\f")[0]
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Page {page_num}: pdftotext exceeded {self.page_timeout}s, skipping text layer")
+                self.timed_out_pages.add(page_num)
+                text = ""
+            except subprocess.CalledProcessError as e:
+                logger.error(f"Page {page_num}: pdftotext failed: {e.stderr.decode('utf-8', errors='replace').strip()}")
+                text = ""
+            yield page_num, text, None
+
+
+PDF_TEXT_BACKENDS = {
+    backend.name: backend
+    for backend in (PyPDF2Backend, PyMuPDFBackend, PdfminerBackend, PdftotextBackend)
+}
+
+
+def get_pdf_backend(name: str = None) -> type:
+    """Resolve a PDF text backend by name (default: settings.PDF_TEXT_BACKEND).
+    Falls back to PyPDF2 if the configured backend is not installed.
+    """
+    name = (name or settings.PDF_TEXT_BACKEND).lower()
+    if name not in PDF_TEXT_BACKENDS:
+        raise ValueError(f"Unknown PDF text backend: {name}. Choose from {sorted(PDF_TEXT_BACKENDS)}")
+    
+    backend = PDF_TEXT_BACKENDS[name]
+    if not backend.available():
+        logger.error(f"PDF text backend '{name}' is not installed; falling back to pypdf2")
+        return PyPDF2Backend
+    return backend
+
+
+def extract_text_from_pdf(file_path: str, use_ocr: bool = True,
+                          completed_pages: Optional[Dict[int, str]] = None,
+                          on_page: Optional[PageCallback] = None,
+                          page_timeout: Optional[float] = None,
+                          doc_timeout: Optional[float] = None) -> List[Tuple[int, str]]:
     """Extract text from PDF with intelligent OCR fallback.
     Detects PDF type (text-based, scanned, mixed) and applies appropriate extraction.
     
+    The text layer is read for every page first with the configured backend
+    (settings.PDF_TEXT_BACKEND, see PDF_TEXT_BACKENDS); pages whose text is
+    too poor are then rasterized in contiguous runs (one poppler call per run,
+    written to a temp directory) and OCR'd in parallel across a process pool.
+    With OCR_ADAPTIVE, render DPI, preprocessing and language packs are chosen
+    per page (see plan_page_ocr).
+    
+    Time budgets degrade instead of blocking: a page whose OCR overruns
+    page_timeout is retried at OCR_FALLBACK_DPI, then kept as text layer
+    only; once doc_timeout is spent, remaining pages skip OCR. A text layer
+    that overruns its timeout (page_timeout for backends that kill the call,
+    EXTRACT_TEXT_LAYER_TIMEOUT otherwise) is left empty and goes to OCR.
+    Every fallback is listed in the page's meta["fallbacks"].
+    
     Args:
         file_path: Path to PDF file
         use_ocr: Enable OCR for scanned/low-quality pages
+        completed_pages: {page_num: text} from an earlier, interrupted run;
+            these pages are taken as-is and never re-OCR'd
+        on_page: Called as on_page(page_num, text, meta) once each page's
+            text is final (in completion order, not page order)
+        page_timeout: Seconds per page (default settings.EXTRACT_PAGE_TIMEOUT, 0 = none)
+        doc_timeout: Seconds per document (default settings.EXTRACT_DOC_TIMEOUT, 0 = none)
     
     Returns: List of (page_number, text) tuples
     """
-    pages = []
+    completed_pages = completed_pages or {}
+    page_timeout = settings.EXTRACT_PAGE_TIMEOUT if page_timeout is None else page_timeout
+    doc_timeout = settings.EXTRACT_DOC_TIMEOUT if doc_timeout is None else doc_timeout
+    deadline = time.monotonic() + doc_timeout if doc_timeout else None
+    page_meta = {}
+    
+    def finish_page(page_num: int):
+        if on_page:
+            on_page(page_num, page_texts[page_num], page_meta[page_num])
+    
+    def degrade(page_num: int, fallback: str, reason: str):
+        meta = page_meta[page_num]
+        meta.setdefault("fallbacks", []).append(fallback)
+        meta["fallback_reason"] = reason
+        logger.warning(f"Page {page_num}: degraded to '{fallback}' ({reason})")
     
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            total_pages = len(pdf_reader.pages)
-            
-            logger.info(f"Processing PDF '{os.path.basename(file_path)}' with {total_pages} pages")
-            
-            # First pass: extract text with PyPDF2
-            for page_num in range(total_pages):
-                page = pdf_reader.pages[page_num]
+        backend = get_pdf_backend()
+        logger.info(f"Processing PDF '{os.path.basename(file_path)}' with {backend.name} backend")
+        
+        # First pass: extract the text layer
+        page_texts = {}
+        ocr_pages = []
+        ocr_plans = {}
+        # An overrunning thread cannot be stopped, so text layer timeouts are
+        # opt-in (EXTRACT_TEXT_LAYER_TIMEOUT) unless the backend kills the call
+        text_layer_timeout = page_timeout if backend.kills_on_timeout else settings.EXTRACT_TEXT_LAYER_TIMEOUT
+        with backend(file_path, page_timeout=text_layer_timeout) as doc:
+            for page_num, text, page_size in doc.iter_pages():
+                if page_num in completed_pages:
+                    page_texts[page_num] = completed_pages[page_num]
+                    continue
                 
-                try:
-                    text = page.extract_text()
-                except Exception as extract_err:
-                    logger.error(f"Page {page_num + 1}: PyPDF2 extraction failed: {extract_err}")
-                    text = ""
+                page_texts[page_num] = text
                 
                 # Assess text quality
                 quality = assess_text_quality(text)
+                page_meta[page_num] = {
+                    "quality": quality["quality"],
+                    "char_count": quality["char_count"],
+                    "ocr": False
+                }
+                if page_num in doc.timed_out_pages:
+                    degrade(page_num, "text_layer_timeout", f"text layer exceeded {text_layer_timeout}s")
                 
                 if use_ocr and quality["needs_ocr"]:
-                    logger.info(f"Page {page_num + 1}: Low quality text detected (quality={quality['quality']}, chars={quality['char_count']}). Applying OCR...")
-                    
-                    # Convert this page to image and OCR
-                    try:
-                        images = convert_from_path(
-                            file_path,
-                            first_page=page_num + 1,
-                            last_page=page_num + 1,
-                            dpi=300
-                        )
-                        
-                        if images:
-                            ocr_text = ocr_page_image(images[0], page_num + 1)
-                            
-                            # Combine parsed + OCR text
-                            combined_text = text + "\n" + ocr_text if text.strip() else ocr_text
-                            pages.append((page_num + 1, combined_text))
-                            logger.info(f"Page {page_num + 1}: Combined text (parsed + OCR) = {len(combined_text)} chars")
-                        else:
-                            logger.warning(f"Page {page_num + 1}: No images generated from PDF page")
-                            pages.append((page_num + 1, text))
-                    except Exception as e:
-                        logger.error(f"OCR failed for page {page_num + 1}: {e}. Using parsed text.")
-                        pages.append((page_num + 1, text))
+                    time_left = _time_left(deadline)
+                    if time_left is not None and time_left <= 0:
+                        degrade(page_num, "doc_budget", "document time budget spent before OCR")
+                        finish_page(page_num)
+                        continue
+                    ocr_plans[page_num] = plan_page_ocr(text, quality, page_size)
+                    logger.info(f"Page {page_num}: Low quality text detected (quality={quality['quality']}, chars={quality['char_count']}). Queued for OCR {ocr_plans[page_num]}")
+                    ocr_pages.append(page_num)
                 else:
-                    pages.append((page_num + 1, text))
-                    logger.info(f"Page {page_num + 1}: Good quality text ({quality['char_count']} chars)")
-            
-            # Check if any page has content
-            total_chars = sum(len(text) for _, text in pages)
-            logger.info(f"PDF extraction complete: {len(pages)} pages processed, {total_chars} total chars")
+                    logger.info(f"Page {page_num}: Good quality text ({quality['char_count']} chars)")
+                    finish_page(page_num)
+        
+        total_pages = len(page_texts)
+        logger.info(f"Text layer read for {total_pages} pages, {len(completed_pages)} already done, {len(ocr_pages)} need OCR")
+        
+        # Second pass: render + OCR low-quality pages in parallel
+        if ocr_pages:
+            logger.info(f"Running OCR on {len(ocr_pages)} pages")
             
-            if total_chars == 0:
-                logger.error(f"WARNING: PDF '{os.path.basename(file_path)}' extracted 0 characters across all pages!")
+            render_dpis = {page_num: plan["dpi"] for page_num, plan in ocr_plans.items()}
+            runs = _group_page_runs(ocr_pages, settings.OCR_RENDER_BATCH, render_dpis)
             
-            return pages
+            with tempfile.TemporaryDirectory(prefix="ocr_") as render_dir:
+                futures = {}
+                
+                def submit_ocr(page_num: int, image_path: str):
+                    plan = ocr_plans[page_num]
+                    future = executors.submit_ocr(_ocr_image_file, image_path, page_num,
+                                                  plan["lang"], plan["config"], page_timeout)
+                    futures[future] = (page_num, image_path)
+                    return future
+                
+                def render_run(first_page: int, last_page: int, dpi: int) -> List[str]:
+                    timeout = page_timeout * (last_page - first_page + 1) if page_timeout else None
+                    return render_pdf_pages(file_path, first_page, last_page, render_dir, dpi, timeout)
+                
+                # Render each run with one poppler call; its pages are OCR'd
+                # while the next run is being rendered
+                for first_page, last_page in runs:
+                    time_left = _time_left(deadline)
+                    if time_left is not None and time_left <= 0:
+                        for page_num in range(first_page, last_page + 1):
+                            degrade(page_num, "doc_budget", "document time budget spent before OCR")
+                            finish_page(page_num)
+                        continue
+                    
+                    dpi = render_dpis[first_page]
+                    try:
+                        try:
+                            image_paths = render_run(first_page, last_page, dpi)
+                        except PDFPopplerTimeoutError:
+                            if dpi <= settings.OCR_FALLBACK_DPI:
+                                raise
+                            for page_num in range(first_page, last_page + 1):
+                                degrade(page_num, "low_dpi", f"rendering at {dpi} DPI exceeded budget")
+                                ocr_plans[page_num]["dpi"] = settings.OCR_FALLBACK_DPI
+                            image_paths = render_run(first_page, last_page, settings.OCR_FALLBACK_DPI)
+                    except Exception as e:
+                        logger.error(f"Rendering pages {first_page}-{last_page} failed: {e}. Using parsed text.")
+                        for page_num in range(first_page, last_page + 1):
+                            if isinstance(e, PDFPopplerTimeoutError):
+                                degrade(page_num, "text_only", "rendering exceeded budget")
+                            page_meta[page_num]["ocr_error"] = f"render failed: {e}"
+                            finish_page(page_num)
+                        continue
+                    
+                    if len(image_paths) != last_page - first_page + 1:
+                        logger.warning(f"Pages {first_page}-{last_page}: expected {last_page - first_page + 1} images, got {len(image_paths)}")
+                    
+                    for page_num, image_path in zip(range(first_page, last_page + 1), image_paths):
+                        submit_ocr(page_num, image_path)
+                
+                pending = set(futures)
+                while pending:
+                    time_left = _time_left(deadline)
+                    if time_left is not None and time_left <= 0:
+                        break
+                    done, pending = wait(pending, timeout=time_left, return_when=FIRST_COMPLETED)
+                    
+                    for future in done:
+                        page_num, image_path = futures[future]
+                        text = page_texts[page_num]
+                        plan = ocr_plans[page_num]
+                        try:
+                            ocr_text = future.result()
+                        except OCRTimeoutError as e:
+                            reason = str(e)
+                            # Retry once at a lower DPI, then settle for the text layer
+                            if plan["dpi"] > settings.OCR_FALLBACK_DPI:
+                                degrade(page_num, "low_dpi", reason)
+                                plan["dpi"] = settings.OCR_FALLBACK_DPI
+                                try:
+                                    retry_path = render_run(page_num, page_num, plan["dpi"])[0]
+                                    pending.add(submit_ocr(page_num, retry_path))
+                                    continue
+                                except Exception as render_err:
+                                    reason = f"low DPI render failed: {render_err}"
+                            degrade(page_num, "text_only", reason)
+                            page_meta[page_num]["ocr_error"] = reason
+                            finish_page(page_num)
+                            continue
+                        except Exception as e:
+                            # A failing page keeps its parsed text; other pages are unaffected
+                            logger.error(f"OCR failed for page {page_num}: {e}. Using parsed text.")
+                            page_meta[page_num]["ocr_error"] = str(e)
+                            finish_page(page_num)
+                            continue
+                        finally:
+                            # Free disk space as soon as the page is done
+                            if os.path.exists(image_path):
+                                os.unlink(image_path)
+                        
+                        # Combine parsed + OCR text
+                        combined_text = text + "\n" + ocr_text if text.strip() else ocr_text
+                        page_texts[page_num] = combined_text
+                        page_meta[page_num].update({
+                            "ocr": True,
+                            "ocr_chars": len(ocr_text),
+                            "ocr_lang": plan["lang"],
+                            "ocr_config": plan["config"],
+                            "dpi": plan["dpi"]
+                        })
+                        finish_page(page_num)
+                        logger.info(f"Page {page_num}: Combined text (parsed + OCR) = {len(combined_text)} chars")
+                
+                # Document budget spent: drop queued OCR, keep parsed text
+                if pending:
+                    logger.warning(f"Document time budget of {doc_timeout}s spent with {len(pending)} OCR pages pending")
+                    for future in pending:
+                        future.cancel()
+                        page_num, _ = futures[future]
+                        degrade(page_num, "doc_budget", "document time budget spent before OCR finished")
+                        finish_page(page_num)
+        
+        pages = [(page_num, page_texts[page_num]) for page_num in sorted(page_texts)]
+        
+        # Check if any page has content
+        total_chars = sum(len(text) for _, text in pages)
+        logger.info(f"PDF extraction complete: {len(pages)} pages processed, {total_chars} total chars")
+        
+        if total_chars == 0:
+            logger.error(f"WARNING: PDF '{os.path.basename(file_path)}' extracted 0 characters across all pages!")
+        
+        return pages
             
     except Exception as e:
         logger.error(f"Error extracting text from PDF '{os.path.basename(file_path)}': {e}")
         raise
 
 
-def extract_text_from_txt(file_path: str) -> List[Tuple[int, str]]:
-    """Extract text from TXT file. Returns as single page."""
+def iter_txt_pages(file_path: str, page_chars: int = None) -> Iterator[Tuple[int, str]]:
+    """Stream a TXT file as virtual pages of roughly page_chars characters.
+    
+    Form feeds are honoured as real page breaks. Otherwise a page ends at the
+    first blank line (paragraph boundary) after the budget is reached, or at a
+    line boundary once it reaches twice the budget. Lines are read with a size
+    limit, so memory stays bounded even for files without newlines.
+    """
+    page_chars = page_chars or settings.VIRTUAL_PAGE_CHARS
+    page_num = 1
+    lines = []
+    size = 0
+    
     with open(file_path, 'r', encoding='utf-8') as file:
-        text = file.read()
-    return [(1, text)]
+        for line in iter(lambda: file.readline(page_chars), ''):
+            # Form feed = explicit page break
+            while '\f' in line:
+                before, line = line.split('\f', 1)
+                lines.append(before)
+                text = "".join(lines)
+                if text.strip():
+                    yield page_num, text
+                page_num += 1
+                lines, size = [], 0
+            
+            lines.append(line)
+            size += len(line)
+            at_paragraph_end = not line.strip()
+            if size >= page_chars and (at_paragraph_end or size >= 2 * page_chars):
+                text = "".join(lines)
+                if text.strip():
+                    yield page_num, text
+                    page_num += 1
+                lines, size = [], 0
+    
+    text = "".join(lines)
+    if text.strip():
+        yield page_num, text
 
 
-def extract_text_from_docx(file_path: str) -> List[Tuple[int, str]]:
-    """Extract text from DOCX file. Returns as single page."""
+def extract_text_from_txt(file_path: str) -> List[Tuple[int, str]]:
+    """Extract text from TXT file as virtual pages (see iter_txt_pages)."""
+    return list(iter_txt_pages(file_path))
+
+
+_W_T = qn('w:t')
+_W_TAB = qn('w:tab')
+_W_BR = qn('w:br')
+_W_CR = qn('w:cr')
+_W_TYPE = qn('w:type')
+_W_RENDERED_BREAK = qn('w:lastRenderedPageBreak')
+_W_SECT_PR = qn('w:sectPr')
+
+
+def _docx_paragraph_pieces(p_elem, rendered_breaks: bool) -> Iterator[Optional[str]]:
+    """Yield the text of a DOCX paragraph in document order, with None at each page break.
+    With rendered_breaks, Word's lastRenderedPageBreak markers are the page
+    boundaries; otherwise hard page breaks are.
+    """
+    for elem in p_elem.iter():
+        if elem.tag == _W_T:
+            if elem.text:
+                yield elem.text
+        elif elem.tag == _W_TAB:
+            yield "\t"
+        elif elem.tag == _W_BR:
+            if elem.get(_W_TYPE) == "page":
+                if not rendered_breaks:
+                    yield None
+            else:
+                yield "\n"
+        elif elem.tag == _W_CR:
+            yield "\n"
+        elif elem.tag == _W_RENDERED_BREAK and rendered_breaks:
+            yield None
+
+
+def iter_docx_pages(file_path: str, page_chars: int = None) -> Iterator[Tuple[int, str]]:
+    """Stream a DOCX file as pages, paragraph by paragraph.
+    
+    If the document was last saved by Word it carries rendered page break
+    markers, and pages then match Word's page numbers. Otherwise pages end at
+    hard page breaks and section breaks, and are cut at a paragraph boundary
+    once they reach page_chars characters.
+    """
+    page_chars = page_chars or settings.VIRTUAL_PAGE_CHARS
     doc = docx.Document(file_path)
-    text = "\n".join([para.text for para in doc.paragraphs])
-    return [(1, text)]
+    rendered_breaks = next(doc.element.body.iter(_W_RENDERED_BREAK), None) is not None
+    
+    page_num = 1
+    paragraphs = []
+    size = 0
+    
+    for para in doc.paragraphs:
+        parts = []
+        for piece in _docx_paragraph_pieces(para._p, rendered_breaks):
+            if piece is not None:
+                parts.append(piece)
+                continue
+            # Page break inside the paragraph: text before it ends the page
+            if parts:
+                paragraphs.append("".join(parts))
+                parts = []
+            text = "\n".join(paragraphs)
+            if text.strip():
+                yield page_num, text
+            page_num += 1
+            paragraphs, size = [], 0
+        
+        text = "".join(parts)
+        paragraphs.append(text)
+        size += len(text) + 1
+        
+        if rendered_breaks:
+            continue
+        p_pr = para._p.pPr
+        section_break = p_pr is not None and p_pr.find(_W_SECT_PR) is not None
+        if section_break or size >= page_chars:
+            text = "\n".join(paragraphs)
+            if text.strip():
+                yield page_num, text
+                page_num += 1
+            paragraphs, size = [], 0
+    
+    text = "\n".join(paragraphs)
+    if text.strip():
+        yield page_num, text
+
+
+def extract_text_from_docx(file_path: str) -> List[Tuple[int, str]]:
+    """Extract text from DOCX file as pages (see iter_docx_pages)."""
+    return list(iter_docx_pages(file_path))
+
+
+def normalize_image_resolution(image: Image.Image) -> Image.Image:
+    """Downscale an image to OCR_DPI when it was scanned at a higher resolution.
+    Images without DPI info are only capped in width (OCR_TARGET_PIXELS);
+    tall images are handled by tiling instead.
+    """
+    dpi = image.info.get("dpi")
+    try:
+        source_dpi = float(dpi[0]) if dpi else 0.0
+    except (TypeError, ValueError, IndexError):
+        source_dpi = 0.0
+    
+    if source_dpi > OCR_DPI:
+        scale = OCR_DPI / source_dpi
+    elif image.width > settings.OCR_TARGET_PIXELS:
+        scale = settings.OCR_TARGET_PIXELS / image.width
+    else:
+        return image
+    
+    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+    return image.resize(size, Image.LANCZOS)
 
 
-def extract_text_from_image(file_path: str) -> List[Tuple[int, str]]:
+def _find_tile_cut(image: Image.Image, target_row: int, window: int = 200) -> int:
+    """Pick the brightest (emptiest) row near target_row so tiles don't cut through text lines."""
+    top = max(1, target_row - window)
+    bottom = min(image.height - 1, target_row + window)
+    if bottom <= top:
+        return target_row
+    band = image.crop((0, top, image.width, bottom)).convert("L")
+    # Width-1 box resize = mean brightness of each row
+    row_means = list(band.resize((1, band.height), Image.BOX).getdata())
+    best = max(range(len(row_means)), key=lambda i: (row_means[i], -abs(top + i - target_row)))
+    return top + best
+
+
+def split_image_tiles(image: Image.Image, max_height: int = None) -> List[Image.Image]:
+    """Split a very tall page into horizontal strips of at most ~max_height pixels."""
+    max_height = max_height or settings.OCR_TILE_PIXELS
+    if image.height <= max_height:
+        return [image]
+    
+    tiles = []
+    top = 0
+    while image.height - top > max_height:
+        cut = _find_tile_cut(image, top + max_height)
+        if cut <= top:
+            cut = top + max_height
+        tiles.append(image.crop((0, top, image.width, cut)))
+        top = cut
+    tiles.append(image.crop((0, top, image.width, image.height)))
+    return tiles
+
+
+def extract_text_from_image(file_path: str,
+                            completed_pages: Optional[Dict[int, str]] = None,
+                            on_page: Optional[PageCallback] = None,
+                            page_timeout: Optional[float] = None,
+                            doc_timeout: Optional[float] = None) -> List[Tuple[int, str]]:
     """Extract text from image file using OCR.
-    Returns: List with single (page_number, text) tuple
+    
+    Every frame of a multi-page image (e.g. TIFF scans) becomes a page. Each
+    page is downscaled to OCR_DPI if needed and split into tiles when it is
+    taller than OCR_TILE_PIXELS. Tiles are written to a temp directory and
+    OCR'd in parallel across the OCR process pool.
+    
+    A tile whose OCR overruns page_timeout is left empty; once doc_timeout is
+    spent, pages still waiting for OCR are finished with the tiles done so far.
+    Both are recorded in the page's meta["fallbacks"].
+    
+    Returns: List of (page_number, text) tuples, one per frame
     """
+    completed_pages = completed_pages or {}
+    page_timeout = settings.EXTRACT_PAGE_TIMEOUT if page_timeout is None else page_timeout
+    doc_timeout = settings.EXTRACT_DOC_TIMEOUT if doc_timeout is None else doc_timeout
+    deadline = time.monotonic() + doc_timeout if doc_timeout else None
     try:
-        image = Image.open(file_path)
-        text = ocr_page_image(image, 1)
-        return [(1, text)]
+        page_texts = dict(completed_pages)
+        page_tiles = {}  # page_num -> number of tiles
+        tile_texts = {}  # (page_num, tile_index) -> text
+        page_fallbacks = {}  # page_num -> list of fallbacks
+        
+        def finish_page(page_num: int):
+            n_tiles = page_tiles[page_num]
+            text = "\n".join(tile_texts.get((page_num, i), "") for i in range(n_tiles))
+            page_texts[page_num] = text
+            meta = {"ocr": True, "char_count": len(text.strip()), "tiles": n_tiles}
+            if page_num in page_fallbacks:
+                meta["fallbacks"] = page_fallbacks[page_num]
+                logger.warning(f"Page {page_num}: degraded ({', '.join(page_fallbacks[page_num])})")
+            if on_page:
+                on_page(page_num, text, meta)
+        
+        with tempfile.TemporaryDirectory(prefix="ocr_img_") as render_dir:
+            # Expand frames to tile files one frame at a time to keep memory bounded
+            tile_jobs = []
+            with Image.open(file_path) as image:
+                for index, frame in enumerate(ImageSequence.Iterator(image)):
+                    page_num = index + 1
+                    if page_num in completed_pages:
+                        continue
+                    
+                    page_image = normalize_image_resolution(frame.convert("RGB"))
+                    tiles = split_image_tiles(page_image)
+                    page_tiles[page_num] = len(tiles)
+                    for tile_index, tile in enumerate(tiles):
+                        tile_path = os.path.join(render_dir, f"page{page_num:05d}-{tile_index:03d}.png")
+                        tile.save(tile_path)
+                        tile_jobs.append((page_num, tile_index, tile_path))
+            
+            logger.info(f"Image '{os.path.basename(file_path)}': {len(page_tiles)} pages to OCR as {len(tile_jobs)} tiles")
+            
+            if tile_jobs:
+                futures = {
+                    executors.submit_ocr(_ocr_image_file, tile_path, page_num, OCR_LANG, OCR_CONFIG, page_timeout): (page_num, tile_index)
+                    for page_num, tile_index, tile_path in tile_jobs
+                }
+                pending = set(futures)
+                while pending:
+                    time_left = _time_left(deadline)
+                    if time_left is not None and time_left <= 0:
+                        break
+                    done, pending = wait(pending, timeout=time_left, return_when=FIRST_COMPLETED)
+                    
+                    for future in done:
+                        page_num, tile_index = futures[future]
+                        try:
+                            tile_texts[(page_num, tile_index)] = future.result()
+                        except OCRTimeoutError as e:
+                            logger.warning(f"Page {page_num} tile {tile_index}: {e}")
+                            page_fallbacks.setdefault(page_num, []).append("tile_skipped")
+                            tile_texts[(page_num, tile_index)] = ""
+                        except Exception as e:
+                            logger.error(f"OCR failed for page {page_num} tile {tile_index}: {e}")
+                            tile_texts[(page_num, tile_index)] = ""
+                        
+                        # Page is final once all of its tiles are done
+                        if all((page_num, i) in tile_texts for i in range(page_tiles[page_num])):
+                            finish_page(page_num)
+                
+                # Document budget spent: finish pages with whatever tiles are done
+                if pending:
+                    logger.warning(f"Document time budget of {doc_timeout}s spent with {len(pending)} tiles pending")
+                    unfinished = set()
+                    for future in pending:
+                        future.cancel()
+                        unfinished.add(futures[future][0])
+                    for page_num in sorted(unfinished):
+                        page_fallbacks.setdefault(page_num, []).append("doc_budget")
+                        finish_page(page_num)
+        
+        return [(page_num, page_texts[page_num]) for page_num in sorted(page_texts)]
     except Exception as e:
         logger.error(f"Error extracting text from image: {e}")
         raise
 
 
-def extract_text(file_path: str, file_type: str, enable_ocr: bool = True) -> List[Tuple[int, str]]:
+def count_pages(file_path: str, file_type: str) -> Optional[int]:
+    """Cheap page count for progress reporting; None when unknown (TXT/DOCX
+    pages are only known once paged) or when the file cannot be read.
+    """
+    try:
+        file_type_lower = file_type.lower()
+        if file_type_lower == "pdf":
+            return len(PyPDF2.PdfReader(file_path).pages)
+        if file_type_lower in ["jpg", "jpeg", "png", "bmp", "tiff", "tif"]:
+            with Image.open(file_path) as image:
+                return getattr(image, "n_frames", 1)
+    except Exception as e:
+        logger.warning(f"Could not count pages of {os.path.basename(file_path)}: {e}")
+    return None
+
+
+def _checkpoint_pages(pages: Iterable[Tuple[int, str]], meta: dict,
+                      completed_pages: Optional[Dict[int, str]],
+                      on_page: Optional[PageCallback]) -> Iterator[Tuple[int, str]]:
+    """Pass pages through, calling on_page for each one not in completed_pages."""
+    for page_num, text in pages:
+        if on_page and (not completed_pages or page_num not in completed_pages):
+            on_page(page_num, text, dict(meta, char_count=len(text.strip())))
+        yield page_num, text
+
+
+def extract_text(file_path: str, file_type: str, enable_ocr: bool = True,
+                 completed_pages: Optional[Dict[int, str]] = None,
+                 on_page: Optional[PageCallback] = None,
+                 page_timeout: Optional[float] = None,
+                 doc_timeout: Optional[float] = None) -> Iterable[Tuple[int, str]]:
     """Main extraction function with OCR support.
     
     Args:
         file_path: Path to file
         file_type: File extension (pdf, txt, docx, jpg, png)
         enable_ocr: Enable OCR for PDF and images
+        completed_pages: {page_num: text} already extracted by an earlier run
+        on_page: Checkpoint callback on_page(page_num, text, meta), called as
+            each page not in completed_pages is finished
+        page_timeout: Per-page time budget in seconds for PDF/image extraction
+            (default settings.EXTRACT_PAGE_TIMEOUT)
+        doc_timeout: Per-document time budget in seconds (default
+            settings.EXTRACT_DOC_TIMEOUT). Pages degraded by either budget carry
+            meta["fallbacks"].
     
-    Returns: List of (page_num, text) tuples
+    Returns: (page_num, text) tuples. TXT and DOCX pages are a lazy iterator:
+        each page is read, passed to on_page and yielded only as it is
+        consumed, so a large file is never held as a whole page list. PDF and
+        image pages are a list.
     """
     file_type_lower = file_type.lower()
     
     if file_type_lower == "pdf":
-        return extract_text_from_pdf(file_path, use_ocr=enable_ocr)
+        return extract_text_from_pdf(file_path, use_ocr=enable_ocr,
+                                     completed_pages=completed_pages, on_page=on_page,
+                                     page_timeout=page_timeout, doc_timeout=doc_timeout)
     elif file_type_lower == "txt":
-        return extract_text_from_txt(file_path)
+        return _checkpoint_pages(iter_txt_pages(file_path), {"ocr": False}, completed_pages, on_page)
     elif file_type_lower in ["docx", "doc"]:
-        return extract_text_from_docx(file_path)
-    elif file_type_lower in ["jpg", "jpeg", "png", "bmp", "tiff"]:
+        return _checkpoint_pages(iter_docx_pages(file_path), {"ocr": False}, completed_pages, on_page)
+    elif file_type_lower in ["jpg", "jpeg", "png", "bmp", "tiff", "tif"]:
         if enable_ocr:
-            return extract_text_from_image(file_path)
+            return extract_text_from_image(file_path, completed_pages=completed_pages, on_page=on_page,
+                                           page_timeout=page_timeout, doc_timeout=doc_timeout)
         else:
             raise ValueError(f"OCR is disabled but image file provided: {file_type}")
     else:
@@ -0,0 +1,62 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from fastapi import UploadFile
+
+from app.config import settings
+from app.services.executors import run_io
+
+logger = logging.getLogger(__name__)
+
+
+class UploadStream:
+    """Sink for an incoming upload: chunks go to a local temp file while the
+    SHA-256 and size are computed as they pass. Memory per upload is bounded
+    by the chunk size, not by the file size. The S3 copy is made from the temp
+    file afterwards (see ingestion.upload_s3_leg), off the ingestion path.
+    """
+
+    def __init__(self, suffix: str):
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        self.temp_path = self.temp_file.name
+
+    def write(self, chunk: bytes):
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+        self.temp_file.write(chunk)
+
+    def close(self) -> dict:
+        """Finish the temp file. Returns temp_path, size and content_hash."""
+        self.temp_file.close()
+        return {
+            "temp_path": self.temp_path,
+            "size": self.size,
+            "content_hash": self.hasher.hexdigest()
+        }
+
+    def abort(self):
+        """Drop the temp file after a failed upload."""
+        self.temp_file.close()
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+
+
+async def receive_upload(file: UploadFile, suffix: str) -> dict:
+    """Stream an UploadFile to a temp file in UPLOAD_CHUNK_SIZE pieces,
+    with file writes on the I/O executor.
+    """
+    stream = await run_io(UploadStream, suffix)
+    try:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await run_io(stream.write, chunk)
+        return await run_io(stream.close)
+    except BaseException:
+        await run_io(stream.abort)
+        raise
@@ -0,0 +1,12 @@
+"""
+Shared pytest setup. Services build their MongoDB clients at import time;
+the clients connect lazily, so a placeholder URL lets unit tests import
+them without a server. Real values from the environment take precedence.
+"""
+import os
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("api_key", "test")
+
+# Manual scripts that talk to real S3/MongoDB/poppler as soon as they are imported
+collect_ignore = ["test_poppler.py", "test_upload.py", "testmongoDB.py"]
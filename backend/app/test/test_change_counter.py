@@ -0,0 +1,38 @@
+"""
+Tests for reading change counters in app.services.change_counter.
+
+Run from backend/:  python -m pytest app/test/test_change_counter.py
+"""
+from datetime import datetime
+
+from app.services import change_counter as change_counter_module
+from app.services.change_counter import ChangeCounter
+
+
+class FakeCounters:
+    def __init__(self, docs=None):
+        self.docs = docs or {}
+        self.writes = 0
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        self.writes += 1
+        return self.docs.setdefault(query["_id"], dict(update["$setOnInsert"]))
+
+
+def test_existing_counter_is_read_without_writing(monkeypatch):
+    updated_at = datetime(2024, 1, 1)
+    counters = FakeCounters({"files": {"version": 7, "updated_at": updated_at}})
+    monkeypatch.setattr(change_counter_module, "get_db", lambda: {ChangeCounter.COLLECTION: counters})
+    assert ChangeCounter().get("files") == (7, updated_at)
+    assert counters.writes == 0
+
+
+def test_missing_counter_is_created_once(monkeypatch):
+    counters = FakeCounters()
+    monkeypatch.setattr(change_counter_module, "get_db", lambda: {ChangeCounter.COLLECTION: counters})
+    assert ChangeCounter().get("files")[0] == 0
+    assert ChangeCounter().get("files")[0] == 0
+    assert counters.writes == 1
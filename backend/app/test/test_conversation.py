@@ -0,0 +1,186 @@
+"""
+Tests for spilling old conversation messages into buckets in app.services.conversation.
+
+Run from backend/:  python -m pytest app/test/test_conversation.py
+
+The fake collections below implement just the queries, projections and
+pipeline updates ConversationService issues.
+"""
+import asyncio
+import copy
+from datetime import datetime
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.config import settings
+from app.models.pydantic_models import MessageModel
+from app.services.conversation import ConversationService
+
+
+def evaluate(expr, doc):
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:])
+    if isinstance(expr, list):
+        return [evaluate(item, doc) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    (op, args), = expr.items()
+    if op == "$size":
+        return len(evaluate(args, doc))
+    if op == "$ifNull":
+        value = evaluate(args[0], doc)
+        return value if value is not None else evaluate(args[1], doc)
+    if op == "$max":
+        return max(evaluate(args, doc))
+    if op == "$slice":
+        array, position, n = evaluate(args, doc)
+        return array[position:position + n]
+    raise NotImplementedError(op)
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        value = doc.get(key)
+        if isinstance(condition, dict) and "$exists" in condition:
+            if (key in doc) != condition["$exists"]:
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    included = [key for key, value in projection.items() if value == 1]
+    result = {key: doc[key] for key in (included or doc) if key in doc and projection.get(key) != 0}
+    for key, value in projection.items():
+        if isinstance(value, dict) and key in doc:
+            n = value["$slice"]
+            result[key] = doc[key][n:] if n < 0 else doc[key][:n]
+    return copy.deepcopy(result)
+
+
+class FakeCursor:
+    def __init__(self, docs, projection):
+        self.docs = docs
+        self.projection = projection
+
+    def sort(self, key, direction):
+        self.docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def __aiter__(self):
+        self._iter = (project(doc, self.projection) for doc in self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, unique=None):
+        self.docs = []
+        self.unique = unique
+
+    async def insert_one(self, doc):
+        if self.unique and any(all(d[k] == doc[k] for k in self.unique) for d in self.docs):
+            raise DuplicateKeyError("duplicate key")
+        self.docs.append(copy.deepcopy(doc))
+
+    async def find_one(self, query, projection=None):
+        doc = next((d for d in self.docs if matches(d, query)), None)
+        return project(doc, projection) if doc is not None else None
+
+    def find(self, query, projection=None):
+        return FakeCursor([d for d in self.docs if matches(d, query)], projection)
+
+    async def update_one(self, query, pipeline):
+        doc = next((d for d in self.docs if matches(d, query)), None)
+        if doc is not None:
+            for stage in pipeline:
+                doc.update({key: evaluate(expr, doc) for key, expr in stage["$set"].items()})
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        doc = next((d for d in self.docs if matches(d, query)), None)
+        if doc is None:
+            doc = dict(query, **update.get("$setOnInsert", {}))
+            self.docs.append(doc)
+        for key, value in update.get("$push", {}).items():
+            doc.setdefault(key, []).append(value)
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+        doc.update(update.get("$set", {}))
+        return project(doc, projection)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATION_INLINE_MESSAGES", 4)
+    monkeypatch.setattr(settings, "CONVERSATION_BUCKET_SIZE", 3)
+    service = ConversationService()
+    service.conversations = FakeCollection()
+    service.buckets = FakeCollection(unique=("conversation_id", "bucket"))
+    return service
+
+
+def message(n: int) -> MessageModel:
+    return MessageModel(role="user", content=f"m{n}", created_at=datetime(2024, 1, 1, 0, 0, n))
+
+
+def add_messages(service, numbers, conversation_id="c"):
+    async def add():
+        for n in numbers:
+            await service.add_message(conversation_id, message(n))
+    asyncio.run(add())
+
+
+def contents(messages):
+    return [m.content if isinstance(m, MessageModel) else m["content"] for m in messages]
+
+
+def test_oldest_messages_spill_into_buckets(service):
+    add_messages(service, range(1, 11))
+    conversation = service.conversations.docs[0]
+    assert contents(conversation["messages"]) == ["m7", "m8", "m9", "m10"]
+    assert conversation["message_count"] == 10
+    assert conversation["inline_count"] == 4 and conversation["bucket_count"] == 2
+    assert [(b["bucket"], contents(b["messages"])) for b in service.buckets.docs] == [
+        (0, ["m1", "m2", "m3"]), (1, ["m4", "m5", "m6"])
+    ]
+
+
+def test_history_and_conversation_read_across_buckets(service):
+    add_messages(service, range(1, 11))
+    assert contents(asyncio.run(service.get_history("c", limit=3))) == ["m8", "m9", "m10"]
+    assert contents(asyncio.run(service.get_history("c", limit=6))) == ["m5", "m6", "m7", "m8", "m9", "m10"]
+    assert contents(asyncio.run(service.get_history("c"))) == [f"m{n}" for n in range(1, 11)]
+    conversation = asyncio.run(service.get_conversation("c"))
+    assert contents(conversation.messages) == [f"m{n}" for n in range(1, 11)]
+
+
+def test_conversation_without_counts_is_backfilled_before_spilling(service):
+    legacy = [message(n).dict() for n in range(1, 5)]
+    service.conversations.docs.append({"conversation_id": "c", "messages": legacy, "created_at": datetime(2024, 1, 1)})
+    add_messages(service, [5])
+    conversation = service.conversations.docs[0]
+    assert conversation["message_count"] == 5
+    assert conversation["inline_count"] == 2 and conversation["bucket_count"] == 1
+    assert contents(service.buckets.docs[0]["messages"]) == ["m1", "m2", "m3"]
+
+
+def test_spill_interrupted_before_the_trim_is_finished_once(service):
+    add_messages(service, range(1, 5))
+    # An earlier spill wrote the bucket, then died before trimming the conversation
+    asyncio.run(service.buckets.insert_one({"conversation_id": "c", "bucket": 0, "messages": []}))
+    add_messages(service, [5])
+    assert len(service.buckets.docs) == 1
+    assert contents(service.conversations.docs[0]["messages"]) == ["m4", "m5"]
+    assert service.conversations.docs[0]["bucket_count"] == 1
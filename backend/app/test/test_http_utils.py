@@ -0,0 +1,60 @@
+"""
+Tests for the listing cursors and conditional GET checks in app.api.http_utils.
+
+Run from backend/:  python -m pytest app/test/test_http_utils.py
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.api.http_utils import decode_cursor, encode_cursor, not_modified
+
+
+def make_request(**headers) -> Request:
+    raw = [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = encode_cursor({"created_at": created_at, "file_id": "abc|def"})
+    assert decode_cursor(cursor) == (created_at, "abc|def")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm9waXBl", ""])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
+
+
+ETAG = 'W/"files-7"'
+UPDATED_AT = datetime(2024, 5, 1, 12, 30, 15, 500000)
+
+
+def test_matching_etag_is_not_modified():
+    assert not_modified(make_request(if_none_match=ETAG), ETAG)
+    assert not_modified(make_request(if_none_match=f'W/"files-6", {ETAG}'), ETAG)
+    assert not_modified(make_request(if_none_match="*"), ETAG)
+
+
+def test_other_etag_is_modified():
+    assert not not_modified(make_request(if_none_match='W/"files-6"'), ETAG)
+    assert not not_modified(make_request(), ETAG, UPDATED_AT)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    request = make_request(if_none_match='W/"files-6"', if_modified_since="Wed, 01 May 2024 12:30:15 GMT")
+    assert not not_modified(request, ETAG, UPDATED_AT)
+
+
+def test_if_modified_since_compares_whole_seconds():
+    assert not_modified(make_request(if_modified_since="Wed, 01 May 2024 12:30:15 GMT"), ETAG, UPDATED_AT)
+    assert not not_modified(make_request(if_modified_since="Wed, 01 May 2024 12:30:14 GMT"), ETAG, UPDATED_AT)
+
+
+def test_if_modified_since_needs_a_valid_date_and_last_modified():
+    assert not not_modified(make_request(if_modified_since="yesterday"), ETAG, UPDATED_AT)
+    assert not not_modified(make_request(if_modified_since="Wed, 01 May 2024 12:30:15 GMT"), ETAG)
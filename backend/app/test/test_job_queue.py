@@ -0,0 +1,138 @@
+"""
+Tests for the SQLite job queue in app.services.job_queue.
+
+Run from backend/:  python -m pytest app/test/test_job_queue.py
+"""
+import pytest
+
+from app.config import settings
+from app.services import job_queue as job_queue_module
+from app.services.job_queue import LEASE_EXHAUSTED_ERROR, SQLiteJobQueue, backoff_seconds
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue_module.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return SQLiteJobQueue(str(tmp_path / "jobs" / "jobs.db"))
+
+
+def test_claim_takes_the_oldest_queued_job_once(queue, clock):
+    first = queue.enqueue("ingest", {"n": 1}, file_id="f1")
+    clock.now += 1
+    queue.enqueue("ingest", {"n": 2}, file_id="f2")
+
+    job = queue.claim("w1")
+    assert job["job_id"] == first
+    assert job["status"] == "running" and job["attempts"] == 1 and job["worker_id"] == "w1"
+    assert job["payload"] == {"n": 1}
+    assert job["lease_until"] == clock.now + settings.JOB_LEASE_SECONDS
+
+    assert queue.claim("w2")["payload"] == {"n": 2}
+    assert queue.claim("w3") is None
+    assert queue.count_active() == {"queued": 0, "running": 2}
+
+
+def test_only_the_lease_holder_extends_or_completes(queue, clock):
+    job_id = queue.enqueue("ingest", {}, file_id="f1")
+    queue.claim("w1")
+    assert queue.extend_lease(job_id, "w1")
+    assert not queue.extend_lease(job_id, "w2")
+
+    queue.complete(job_id, "w2")
+    assert queue.has_active_job("f1")
+    queue.complete(job_id, "w1")
+    assert not queue.has_active_job("f1")
+    assert not queue.extend_lease(job_id, "w1")
+
+
+def test_expired_lease_is_claimed_again(queue, clock):
+    job_id = queue.enqueue("ingest", {}, file_id="f1")
+    queue.claim("w1")
+    clock.now += settings.JOB_LEASE_SECONDS - 1
+    assert queue.claim("w2") is None
+
+    clock.now += 2
+    job = queue.claim("w2")
+    assert job["job_id"] == job_id and job["worker_id"] == "w2" and job["attempts"] == 2
+    # The first worker lost the job
+    assert not queue.extend_lease(job_id, "w1")
+
+
+def test_failed_job_is_retried_after_a_backoff(queue, clock):
+    job_id = queue.enqueue("ingest", {}, file_id="f1")
+    job = queue.claim("w1")
+    assert queue.fail(job, "w1", "boom")
+
+    assert queue.claim("w1") is None
+    assert queue.queue_position("f1") == 1
+    clock.now += backoff_seconds(1)
+    job = queue.claim("w1")
+    assert job["job_id"] == job_id and job["attempts"] == 2 and job["error"] == "boom"
+
+
+def test_job_fails_for_good_after_max_attempts(queue, clock):
+    queue.enqueue("ingest", {}, file_id="f1", max_attempts=2)
+    for attempt in range(2):
+        job = queue.claim("w1")
+        assert job["attempts"] == attempt + 1
+        retried = queue.fail(job, "w1", "boom")
+        clock.now += backoff_seconds(job["attempts"])
+    assert not retried
+    assert queue.claim("w1") is None
+    assert not queue.has_active_job("f1")
+
+
+def test_lease_lost_on_the_final_attempt_marks_the_job_failed(queue, clock):
+    job_id = queue.enqueue("ingest", {}, file_id="f1", max_attempts=1)
+    queue.claim("w1")
+    clock.now += settings.JOB_LEASE_SECONDS + 1
+
+    job = queue.claim("w2")
+    assert job["job_id"] == job_id
+    assert job["status"] == "failed" and job["error"] == LEASE_EXHAUSTED_ERROR
+    assert queue.claim("w2") is None
+
+
+def test_slots_are_limited_and_expire(queue, clock):
+    first = queue.acquire_slot("ocr", 2, "h1", ttl=60)
+    second = queue.acquire_slot("ocr", 2, "h2", ttl=60)
+    assert {first, second} == {"ocr:0", "ocr:1"}
+    assert queue.acquire_slot("ocr", 2, "h3", ttl=60) is None
+
+    queue.release_slot(first, "h3")  # not the holder: no effect
+    assert queue.acquire_slot("ocr", 2, "h3", ttl=60) is None
+    queue.release_slot(first, "h1")
+    assert queue.acquire_slot("ocr", 2, "h3", ttl=60) == first
+
+    clock.now += 30
+    assert queue.renew_slot(second, "h2", ttl=60)
+    clock.now += 61
+    assert not queue.renew_slot(first, "h1", ttl=60)
+    assert queue.acquire_slot("ocr", 2, "h4", ttl=60) == first
+
+
+def test_files_with_active_jobs(queue, clock):
+    running = queue.enqueue("ingest", {}, file_id="running")
+    clock.now += 1
+    done = queue.enqueue("ingest", {}, file_id="done")
+    clock.now += 1
+    queue.enqueue("ingest", {}, file_id="queued")
+    assert queue.claim("w1")["job_id"] == running
+    assert queue.claim("w1")["job_id"] == done
+    queue.complete(done, "w1")
+    assert queue.files_with_active_jobs(["running", "done", "queued", "none"]) == {"running", "queued"}
+    assert queue.files_with_active_jobs([]) == set()
@@ -0,0 +1,63 @@
+"""
+Tests for ProgressPublisher throttling in app.services.progress.
+
+Run from backend/:  python -m pytest app/test/test_progress.py
+"""
+import pytest
+
+from app.config import settings
+from app.services.progress import ProgressPublisher
+
+
+class FakeEvents:
+    def __init__(self):
+        self.inserted = []
+
+    def insert_one(self, event):
+        self.inserted.append(event)
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    monkeypatch.setattr(settings, "PROGRESS_MIN_INTERVAL", 60.0)
+    publisher = ProgressPublisher()
+    publisher.events = FakeEvents()
+    publisher._collection_ready = True
+    return publisher
+
+
+def sent(publisher):
+    return [(e["stage"], e.get("done")) for e in publisher.events.inserted]
+
+
+def test_updates_within_the_interval_are_held_back(publisher):
+    for done in range(1, 5):
+        publisher.publish("f", "ocr", done)
+    assert sent(publisher) == [("ocr", 1)]
+
+
+def test_end_stage_sends_the_held_back_update_and_forgets_the_stage(publisher):
+    for done in range(1, 5):
+        publisher.publish("f", "ocr", done)
+    publisher.end_stage("f", "ocr")
+    assert sent(publisher) == [("ocr", 1), ("ocr", 4)]
+    assert not publisher._stage_starts and not publisher._last_sent and not publisher._pending
+    publisher.end_stage("f", "ocr")  # nothing held back: nothing sent
+    assert len(publisher.events.inserted) == 2
+
+
+def test_final_update_of_a_stage_with_total_always_goes_out(publisher):
+    publisher.publish("f", "embed", 1, 3)
+    publisher.publish("f", "embed", 2, 3)
+    publisher.publish("f", "embed", 3, 3)
+    assert sent(publisher) == [("embed", 1), ("embed", 3)]
+    assert ("f", "embed") not in publisher._stage_starts
+
+
+def test_finish_flushes_open_stages_before_the_terminal_event(publisher):
+    publisher.publish("f", "extract", 1)
+    publisher.publish("f", "extract", 2)
+    publisher.publish("g", "extract", 1)
+    publisher.finish("f", "indexed")
+    assert sent(publisher) == [("extract", 1), ("extract", 1), ("extract", 2), ("done", None)]
+    assert list(publisher._stage_starts) == [("g", "extract")]
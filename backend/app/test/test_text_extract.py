@@ -0,0 +1,202 @@
+"""
+Tests for the page extractors in app.services.text_extract.
+
+Run from backend/:  python -m pytest app/test/test_text_extract.py
+"""
+import subprocess
+import threading
+
+import docx
+import PyPDF2
+import pytest
+from docx.enum.text import WD_BREAK
+from PIL import Image
+
+from app.services.text_extract import (
+    PdftotextBackend, _TimeoutWorker, _group_page_runs, _otsu_threshold, extract_text,
+    iter_docx_pages, iter_txt_pages, preprocess_ocr_image
+)
+
+
+def write_txt(tmp_path, text: str) -> str:
+    path = tmp_path / "doc.txt"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_txt_form_feed_is_a_page_break(tmp_path):
+    path = write_txt(tmp_path, "first page\n\fsecond page\n")
+    assert list(iter_txt_pages(path)) == [(1, "first page\n"), (2, "second page\n")]
+
+
+def test_txt_empty_pages_keep_their_numbers(tmp_path):
+    path = write_txt(tmp_path, "one\n\f\f  \fthree\n")
+    assert [page_num for page_num, _ in iter_txt_pages(path)] == [1, 4]
+
+
+def test_txt_page_ends_at_paragraph_after_budget(tmp_path):
+    path = write_txt(tmp_path, "aaaa\nbbbb\n\ncccc\n")
+    assert list(iter_txt_pages(path, page_chars=8)) == [(1, "aaaa\nbbbb\n\n"), (2, "cccc\n")]
+
+
+def test_txt_page_cut_at_twice_the_budget_without_blank_line(tmp_path):
+    path = write_txt(tmp_path, "aaaa\nbbbb\ncccc\ndddd\n")
+    pages = list(iter_txt_pages(path, page_chars=5))
+    assert pages == [(1, "aaaa\nbbbb\n"), (2, "cccc\ndddd\n")]
+
+
+def test_txt_line_without_newline_is_read_in_bounded_pieces(tmp_path):
+    path = write_txt(tmp_path, "x" * 100)
+    pages = list(iter_txt_pages(path, page_chars=10))
+    assert "".join(text for _, text in pages) == "x" * 100
+    assert all(len(text) <= 20 for _, text in pages)
+
+
+def test_txt_pages_stream_through_extract_text(tmp_path):
+    path = write_txt(tmp_path, "one\n\ftwo\n\fthree\n")
+    seen = []
+    pages = extract_text(path, "txt", completed_pages={2: "two\n"},
+                         on_page=lambda page_num, text, meta: seen.append((page_num, meta)))
+    assert seen == []  # nothing is read before the pages are consumed
+    assert next(iter(pages)) == (1, "one\n")
+    assert seen == [(1, {"ocr": False, "char_count": 3})]
+    assert [page_num for page_num, _ in pages] == [2, 3]
+    assert [page_num for page_num, _ in seen] == [1, 3]  # completed pages are not checkpointed again
+
+
+def write_docx(tmp_path, build) -> str:
+    document = docx.Document()
+    build(document)
+    path = tmp_path / "doc.docx"
+    document.save(str(path))
+    return str(path)
+
+
+def test_docx_hard_page_breaks(tmp_path):
+    def build(document):
+        document.add_paragraph("page one")
+        paragraph = document.add_paragraph("end of one")
+        paragraph.add_run().add_break(WD_BREAK.PAGE)
+        paragraph.add_run("start of two")
+        document.add_paragraph("page two")
+    path = write_docx(tmp_path, build)
+    assert list(iter_docx_pages(path)) == [
+        (1, "page one\nend of one"),
+        (2, "start of two\npage two"),
+    ]
+
+
+def test_docx_virtual_pages_cut_at_paragraphs(tmp_path):
+    def build(document):
+        for text in ["aaaa", "bbbb", "cccc"]:
+            document.add_paragraph(text)
+    path = write_docx(tmp_path, build)
+    assert list(iter_docx_pages(path, page_chars=8)) == [(1, "aaaa\nbbbb"), (2, "cccc")]
+
+
+def test_docx_line_breaks_and_tabs(tmp_path):
+    def build(document):
+        paragraph = document.add_paragraph("a")
+        paragraph.add_run().add_break()
+        paragraph.add_run("b\tc")
+    path = write_docx(tmp_path, build)
+    assert list(iter_docx_pages(path)) == [(1, "a\nb\tc")]
+
+
+def test_extract_text_rejects_unknown_types(tmp_path):
+    with pytest.raises(ValueError):
+        extract_text(write_txt(tmp_path, "x"), "xyz")
+
+
+def write_blank_pdf(tmp_path, pages: int) -> str:
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    path = tmp_path / "doc.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_pdftotext_falls_back_per_page_after_a_failed_run(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_run(self, timeout, page_num=None):
+        calls.append(page_num)
+        if page_num is None:
+            # Died on page 2, after finishing page 1
+            raise subprocess.CalledProcessError(1, "pdftotext", output=b"page one\f", stderr=b"bad page")
+        if page_num == 2:
+            raise subprocess.TimeoutExpired("pdftotext", timeout)
+        return f"page {page_num}\f".encode()
+
+    monkeypatch.setattr(PdftotextBackend, "_run", fake_run)
+    with PdftotextBackend(write_blank_pdf(tmp_path, 3), page_timeout=5) as doc:
+        pages = [(page_num, text) for page_num, text, _ in doc.iter_pages()]
+        assert doc.timed_out_pages == {2}
+    assert pages == [(1, "page one"), (2, ""), (3, "page 3")]
+    assert calls == [None, 2, 3]
+
+
+def test_pdftotext_single_run_when_it_succeeds(tmp_path, monkeypatch):
+    monkeypatch.setattr(PdftotextBackend, "_run", lambda self, timeout, page_num=None: b"a\fb\f")
+    with PdftotextBackend(write_blank_pdf(tmp_path, 2)) as doc:
+        assert [(n, text) for n, text, _ in doc.iter_pages()] == [(1, "a"), (2, "b")]
+
+
+def test_timeout_worker_reuses_one_thread_and_gives_up_on_overruns():
+    worker = _TimeoutWorker()
+    threads = {worker.call(threading.get_ident, 5)[1] for _ in range(3)}
+    assert len(threads) == 1
+    release = threading.Event()
+    assert worker.call(lambda: release.wait(5), 0.05) == (False, None)
+    release.set()
+    with pytest.raises(ZeroDivisionError):
+        _TimeoutWorker().call(lambda: 1 / 0, 5)
+
+
+def test_page_runs_are_contiguous():
+    assert _group_page_runs([1, 2, 3, 5, 6, 9], max_run=10) == [(1, 3), (5, 6), (9, 9)]
+
+
+def test_page_runs_are_capped_at_max_run():
+    assert _group_page_runs(list(range(1, 8)), max_run=3) == [(1, 3), (4, 6), (7, 7)]
+
+
+def test_page_runs_split_where_the_key_changes():
+    keys = {1: 200, 2: 200, 3: 300, 4: 300, 5: 200}
+    assert _group_page_runs([1, 2, 3, 4, 5], max_run=10, keys=keys) == [(1, 2), (3, 4), (5, 5)]
+
+
+def test_page_runs_of_no_pages():
+    assert _group_page_runs([], max_run=4) == []
+
+
+def histogram(counts: dict) -> list:
+    bins = [0] * 256
+    for level, count in counts.items():
+        bins[level] = count
+    return bins
+
+
+def test_otsu_threshold_separates_two_peaks():
+    threshold = _otsu_threshold(histogram({30: 500, 35: 300, 200: 800, 210: 400}))
+    assert 35 <= threshold < 200
+
+
+def test_otsu_threshold_follows_the_peaks():
+    assert _otsu_threshold(histogram({10: 100, 100: 100})) == 10
+    assert _otsu_threshold(histogram({100: 100, 240: 100})) == 100
+
+
+def test_otsu_threshold_of_a_flat_image_keeps_the_default():
+    assert _otsu_threshold(histogram({128: 1000})) == 127
+    assert _otsu_threshold([0] * 256) == 127
+
+
+def test_binary_preprocessing_splits_dark_from_light():
+    image = Image.new("L", (4, 1))
+    image.putdata([20, 40, 180, 220])
+    binary = preprocess_ocr_image(image.convert("RGB"), mode="binary")
+    assert binary.mode == "1"
+    assert [binary.getpixel((x, 0)) for x in range(4)] == [0, 0, 255, 255]
@@ -0,0 +1,98 @@
+"""
+Benchmark fixed vs adaptive OCR on a fixture set.
+
+Each fixture is a PDF with a ground-truth text file next to it
+(`<name>.pdf` + `<name>.txt`, pages separated by form feed, as written by
+`pdftotext`). Every page is rendered and OCR'd once per mode with the OCR
+cache disabled; the report shows pages per second and character accuracy.
+
+Usage:
+    python -m app.tools.bench_ocr <fixtures_dir> [--max-pages N]
+"""
+import argparse
+import difflib
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.services import text_extract
+from app.services.ocr_cache import ocr_cache
+
+
+def char_accuracy(ocr_text: str, truth: str) -> float:
+    """Similarity of whitespace-normalized OCR text to the ground truth (0..1)."""
+    a = " ".join(ocr_text.split())
+    b = " ".join(truth.split())
+    if not b:
+        return 1.0 if not a else 0.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def bench_fixture(pdf_path: Path, truth_pages: List[str], adaptive: bool, max_pages: int) -> Dict:
+    with text_extract.PyPDF2Backend(str(pdf_path)) as doc:
+        text_layer = list(doc.iter_pages())
+    n_pages = min(len(text_layer), len(truth_pages), max_pages or len(text_layer))
+
+    elapsed = 0.0
+    accuracies = []
+    with tempfile.TemporaryDirectory(prefix="bench_ocr_") as render_dir:
+        for page_num, text, page_size in text_layer[:n_pages]:
+            quality = text_extract.assess_text_quality(text)
+            plan = text_extract.plan_page_ocr(text, quality, page_size, adaptive=adaptive)
+
+            start = time.perf_counter()
+            image_path = text_extract.render_pdf_pages(str(pdf_path), page_num, page_num, render_dir, plan["dpi"])[0]
+            ocr_text = text_extract._ocr_image_file(image_path, page_num, plan["lang"], plan["config"])
+            elapsed += time.perf_counter() - start
+
+            accuracies.append(char_accuracy(ocr_text, truth_pages[page_num - 1]))
+            os.unlink(image_path)
+
+    return {"pages": n_pages, "seconds": elapsed, "accuracies": accuracies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures_dir")
+    parser.add_argument("--max-pages", type=int, default=0, help="Pages per fixture (0 = all)")
+    args = parser.parse_args()
+
+    # Every run must hit Tesseract
+    ocr_cache.enabled = False
+
+    fixtures = sorted(p for p in Path(args.fixtures_dir).glob("*.pdf") if p.with_suffix(".txt").exists())
+    if not fixtures:
+        print(f"No <name>.pdf + <name>.txt fixtures found in {args.fixtures_dir}")
+        return
+
+    preprocess = text_extract.settings.OCR_PREPROCESS
+    print(f"{'fixture':<32} {'mode':<9} {'pages':>5} {'pages/s':>8} {'accuracy':>9}")
+    totals = {}
+    for pdf_path in fixtures:
+        truth_pages = pdf_path.with_suffix(".txt").read_text(encoding="utf-8").split("\f")
+        for mode in ("fixed", "adaptive"):
+            # The fixed baseline renders in color, as before adaptive OCR
+            text_extract.settings.OCR_PREPROCESS = preprocess if mode == "adaptive" else "none"
+            result = bench_fixture(pdf_path, truth_pages, mode == "adaptive", args.max_pages)
+            text_extract.settings.OCR_PREPROCESS = preprocess
+
+            acc = sum(result["accuracies"]) / len(result["accuracies"]) if result["accuracies"] else 0.0
+            pps = result["pages"] / result["seconds"] if result["seconds"] else 0.0
+            print(f"{pdf_path.name[:32]:<32} {mode:<9} {result['pages']:>5} {pps:>8.2f} {acc:>9.3f}")
+
+            total = totals.setdefault(mode, {"pages": 0, "seconds": 0.0, "accuracies": []})
+            total["pages"] += result["pages"]
+            total["seconds"] += result["seconds"]
+            total["accuracies"].extend(result["accuracies"])
+
+    print("-" * 66)
+    for mode, total in totals.items():
+        acc = sum(total["accuracies"]) / len(total["accuracies"]) if total["accuracies"] else 0.0
+        pps = total["pages"] / total["seconds"] if total["seconds"] else 0.0
+        print(f"{'TOTAL':<32} {mode:<9} {total['pages']:>5} {pps:>8.2f} {acc:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark PDF text-layer backends on the same corpus.
+
+For every PDF in the corpus and every installed backend, the text layer is
+extracted in a fresh worker process and the report shows pages per second,
+peak memory, and how many pages each backend would send to OCR (pages
+that fail assess_text_quality).
+
+Usage:
+    python -m app.tools.bench_pdf_backends <corpus_dir> [--backends pypdf2,pymupdf]
+"""
+import argparse
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict
+
+from app.services.text_extract import PDF_TEXT_BACKENDS, assess_text_quality
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(backend_name: str, pdf_path: str) -> Dict:
+    """Extract one PDF with one backend. Runs in its own process so peak RSS is isolated."""
+    backend = PDF_TEXT_BACKENDS[backend_name]
+    pages = 0
+    needs_ocr = 0
+    chars = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with backend(pdf_path) as doc:
+        for _, text, _ in doc.iter_pages():
+            pages += 1
+            chars += len(text)
+            if assess_text_quality(text)["needs_ocr"]:
+                needs_ocr += 1
+    seconds = time.perf_counter() - start
+    _, peak_py = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "pages": pages,
+        "needs_ocr": needs_ocr,
+        "chars": chars,
+        "seconds": seconds,
+        "peak_py_mb": peak_py / (1024 * 1024),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--backends", default=",".join(PDF_TEXT_BACKENDS), help="Comma-separated backend names")
+    args = parser.parse_args()
+
+    pdfs = sorted(Path(args.corpus_dir).rglob("*.pdf"))
+    if not pdfs:
+        print(f"No PDFs found in {args.corpus_dir}")
+        return
+
+    backends = []
+    for name in args.backends.split(","):
+        name = name.strip()
+        if name not in PDF_TEXT_BACKENDS:
+            print(f"Skipping unknown backend: {name}")
+        elif not PDF_TEXT_BACKENDS[name].available():
+            print(f"Skipping {name}: not installed")
+        else:
+            backends.append(name)
+
+    print(f"Corpus: {len(pdfs)} PDFs from {args.corpus_dir}")
+    print(f"{'backend':<10} {'pages':>7} {'pages/s':>9} {'to OCR':>7} {'OCR %':>6} {'chars':>10} {'py MB':>7} {'rss MB':>7} {'errors':>6}")
+
+    for name in backends:
+        total = {"pages": 0, "needs_ocr": 0, "chars": 0, "seconds": 0.0, "peak_py_mb": 0.0, "peak_rss_mb": 0.0}
+        errors = 0
+        for pdf_path in pdfs:
+            # Fresh process per run: memory peaks and library caches don't leak between runs
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                try:
+                    result = pool.submit(run_backend, name, str(pdf_path)).result()
+                except Exception as e:
+                    print(f"  {name}: {pdf_path.name} failed: {e}")
+                    errors += 1
+                    continue
+            for key in ("pages", "needs_ocr", "chars", "seconds"):
+                total[key] += result[key]
+            for key in ("peak_py_mb", "peak_rss_mb"):
+                total[key] = max(total[key], result[key])
+
+        pps = total["pages"] / total["seconds"] if total["seconds"] else 0.0
+        ocr_pct = 100 * total["needs_ocr"] / total["pages"] if total["pages"] else 0.0
+        print(
+            f"{name:<10} {total['pages']:>7} {pps:>9.1f} {total['needs_ocr']:>7} {ocr_pct:>5.1f}% "
+            f"{total['chars']:>10} {total['peak_py_mb']:>7.1f} {total['peak_rss_mb']:>7.1f} {errors:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
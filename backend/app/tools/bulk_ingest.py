@@ -0,0 +1,305 @@
+"""
+Bulk-load a directory of documents straight into the index, without the API.
+
+For initial loads and disaster recovery. Stages run as a pipeline:
+extraction and chunking in a process pool across all cores, embedding in a
+thread pool with batches shared across files, chunk documents written to
+MongoDB in large unordered bulk inserts, and the FAISS index saved once at
+the end. Files are marked indexed only after that save.
+
+Resuming: files whose content is already indexed are skipped; files left in
+`processing` by an interrupted run of this loader (tagged source="bulk", and
+left alone by the workers' stuck-file recovery) are re-chunked and
+re-embedded, with extraction resuming from the page text already stored.
+Files the API or a worker is ingesting are skipped. The API and workers
+can keep running: the final save merges into the shared index file and they
+reload it on the next version bump.
+
+Usage:
+    python -m app.tools.bulk_ingest <dir> [--workers N] [--embed-workers N]
+"""
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.models.pydantic_models import ChunkModel, FileModel
+from app.services.archive_ingestion import MEMBER_FILE_TYPES
+from app.services.embedding import embedding_service
+from app.services.executors import init_worker_process, ocr_pool_share
+from app.services.faiss_service import faiss_service
+from app.services.ingestion import (
+    files_col, chunks_col, chunk_content_hash, copy_to_s3, remove_chunks, mark_failed
+)
+from app.services.job_queue import job_queue
+from app.services.page_extraction import extract_and_chunk
+from app.services.s3_service import s3_service
+
+STAGES = ("extract", "chunk", "embed", "index", "write")
+
+# FileModel.source of the files this loader creates
+BULK_SOURCE = "bulk"
+
+
+def file_hash(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def embed_batch(texts: List[str]) -> Tuple[List[List[float]], float]:
+    start = time.perf_counter()
+    embeddings = embedding_service.embed_texts(texts)
+    return embeddings, time.perf_counter() - start
+
+
+class BulkIngest:
+    def __init__(self, args):
+        self.args = args
+        # Each extraction worker has its own OCR pool; they split the host's OCR workers
+        self.extract_pool = ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker_process, initargs=(ocr_pool_share() * args.workers,)
+        )
+        self.embed_pool = ThreadPoolExecutor(max_workers=args.embed_workers, thread_name_prefix="embed")
+        self.s3_pool = ThreadPoolExecutor(max_workers=settings.S3_UPLOAD_WORKERS, thread_name_prefix="s3")
+
+        self.extracting: deque = deque()  # (file, Future)
+        self.embedding: deque = deque()  # (batch, Future)
+        self.batch: List[Tuple[str, tuple]] = []  # (file_id, chunk) awaiting embedding
+        self.to_write: List[dict] = []  # chunk documents awaiting insert
+        self.files: Dict[str, dict] = {}  # file_id -> state, until marked indexed
+        self.s3_futures: List[Future] = []
+        self.seen_hashes = set()
+
+        self.counts = {"files": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        self.stage_items = {stage: 0 for stage in STAGES}
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        self.started = time.perf_counter()
+
+    def run(self, paths: List[Path]):
+        try:
+            for i, path in enumerate(paths, 1):
+                self._add_file(path)
+                while len(self.extracting) >= self.args.workers * 2:
+                    self._collect_extract(*self.extracting.popleft())
+                if i % 100 == 0:
+                    self._print_progress(i, len(paths))
+            while self.extracting:
+                self._collect_extract(*self.extracting.popleft())
+            self._submit_embed()
+            while self.embedding:
+                self._collect_embed(*self.embedding.popleft())
+            self._write(force=True)
+        finally:
+            self.extract_pool.shutdown(cancel_futures=True)
+            self.embed_pool.shutdown(cancel_futures=True)
+
+        start = time.perf_counter()
+        faiss_service.save()
+        save_seconds = time.perf_counter() - start
+        self._mark_indexed()
+        print("Waiting for S3 copies...")
+        self.s3_pool.shutdown(wait=True)
+        self._print_report(save_seconds)
+
+    def _add_file(self, path: Path):
+        content_hash = file_hash(path)
+        if content_hash in self.seen_hashes or files_col.count_documents(
+                {"content_hash": content_hash, "status": "indexed"}, limit=1):
+            self.counts["skipped"] += 1
+            return
+        self.seen_hashes.add(content_hash)
+
+        file_type = path.suffix[1:].lower()
+        size = path.stat().st_size
+        existing = files_col.find_one({"content_hash": content_hash, "status": {"$in": ["queued", "processing"]}})
+        if existing and (existing.get("source") != BULK_SOURCE or job_queue.has_active_job(existing["file_id"])):
+            # Being ingested by the API or a worker: leave it to them
+            print(f"  {path.name}: already being ingested as {existing['file_id']}, skipping")
+            self.counts["skipped"] += 1
+            return
+        if existing:
+            # Interrupted run of this loader: its chunks may point at vectors that were never saved
+            file_id = existing["file_id"]
+            remove_chunks(file_id)
+            s3_path = existing["s3_path"]
+            needs_s3 = existing.get("s3_status") != "uploaded"
+        else:
+            file_id = str(uuid.uuid4())
+            s3_path = s3_service.path_for(f"uploads/{file_id}/{path.name}")
+            needs_s3 = True
+            files_col.insert_one(FileModel(
+                file_id=file_id,
+                filename=path.name,
+                file_type=file_type,
+                s3_path=s3_path,
+                size=size,
+                content_hash=content_hash,
+                status="processing",
+                s3_status="pending",
+                source=BULK_SOURCE,
+                created_at=datetime.utcnow(),
+                total_page=0
+            ).dict())
+        files_col.update_one({"file_id": file_id}, {"$set": {"processing_at": datetime.utcnow()}})
+
+        if needs_s3:
+            self.s3_futures.append(
+                self.s3_pool.submit(copy_to_s3, file_id, str(path), s3_service.key_from_path(s3_path))
+            )
+        self.counts["bytes"] += size
+        file = {"file_id": file_id, "filename": path.name, "pending_chunks": 0}
+        future = self.extract_pool.submit(
+            extract_and_chunk, file_id, str(path), file_type, self.args.chunk_size, self.args.chunk_overlap
+        )
+        self.extracting.append((file, future))
+
+    def _collect_extract(self, file: dict, future: Future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"  {file['filename']}: extraction failed: {e}")
+            mark_failed(file["file_id"], str(e))
+            self.counts["failed"] += 1
+            return
+        self.stage_items["extract"] += result["pages"]
+        self.stage_seconds["extract"] += result["extract_seconds"]
+        self.stage_items["chunk"] += len(result["chunks"])
+        self.stage_seconds["chunk"] += result["chunk_seconds"]
+        if not result["chunks"]:
+            mark_failed(file["file_id"], "No text content extracted. File may be empty or corrupted.")
+            self.counts["failed"] += 1
+            return
+
+        file.update(pages=result["pages"], chunks=len(result["chunks"]), pending_chunks=len(result["chunks"]))
+        self.files[file["file_id"]] = file
+        for chunk in result["chunks"]:
+            self.batch.append((file["file_id"], chunk))
+            if len(self.batch) >= self.args.embed_batch:
+                self._submit_embed()
+
+    def _submit_embed(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        self.embedding.append((batch, self.embed_pool.submit(embed_batch, [chunk[0] for _, chunk in batch])))
+        while len(self.embedding) >= self.args.embed_workers * 2:
+            self._collect_embed(*self.embedding.popleft())
+
+    def _collect_embed(self, batch: List[Tuple[str, tuple]], future: Future):
+        embeddings, seconds = future.result()
+        self.stage_items["embed"] += len(batch)
+        self.stage_seconds["embed"] += seconds
+
+        start = time.perf_counter()
+        faiss_ids = faiss_service.add_vectors(embeddings)
+        now = datetime.utcnow()
+        for (file_id, (content, title, page_start, page_end)), faiss_id in zip(batch, faiss_ids):
+            self.to_write.append(ChunkModel(
+                chunk_id=str(uuid.uuid4()),
+                file_id=file_id,
+                title=title,
+                content=content,
+                page_start=page_start,
+                page_end=page_end,
+                faiss_index_id=faiss_id,
+                embedding_dim=settings.EMBEDDING_DIM,
+                content_hash=chunk_content_hash(content),
+                created_at=now
+            ).dict())
+            self.files[file_id]["pending_chunks"] -= 1
+        self.stage_items["index"] += len(batch)
+        self.stage_seconds["index"] += time.perf_counter() - start
+        self._write()
+
+    def _write(self, force: bool = False):
+        if not self.to_write or (not force and len(self.to_write) < self.args.insert_batch):
+            return
+        docs, self.to_write = self.to_write, []
+        start = time.perf_counter()
+        chunks_col.insert_many(docs, ordered=False)
+        self.stage_items["write"] += len(docs)
+        self.stage_seconds["write"] += time.perf_counter() - start
+
+    def _mark_indexed(self):
+        fields = {}
+        if self.args.chunk_size:
+            fields["chunk_size"] = self.args.chunk_size
+        if self.args.chunk_overlap:
+            fields["chunk_overlap"] = self.args.chunk_overlap
+        updates = [
+            UpdateOne({"file_id": file_id}, {"$set": {
+                "status": "indexed", "chunks_count": file["chunks"], "total_page": file["pages"], **fields
+            }})
+            for file_id, file in self.files.items()
+            if file["pending_chunks"] == 0
+        ]
+        for i in range(0, len(updates), self.args.insert_batch):
+            files_col.bulk_write(updates[i:i + self.args.insert_batch], ordered=False)
+        self.counts["files"] = len(updates)
+
+    def _print_progress(self, done: int, total: int):
+        elapsed = time.perf_counter() - self.started
+        print(f"  {done}/{total} files queued, {self.stage_items['extract']} pages extracted, "
+              f"{self.stage_items['embed']} chunks embedded, {elapsed:.0f}s")
+
+    def _print_report(self, save_seconds: float):
+        elapsed = time.perf_counter() - self.started
+        print(f"Indexed {self.counts['files']} files ({self.counts['skipped']} skipped, "
+              f"{self.counts['failed']} failed, {self.counts['bytes'] / (1024 * 1024):.1f} MB) in {elapsed:.1f}s")
+        print(f"{'stage':<8} {'items':>9} {'busy s':>9} {'items/s':>9} {'wall/s':>9}")
+        for stage in STAGES:
+            items, seconds = self.stage_items[stage], self.stage_seconds[stage]
+            # busy rate is per worker; wall rate is what the pipeline sustained overall
+            rate = items / seconds if seconds else 0.0
+            print(f"{stage:<8} {items:>9} {seconds:>9.1f} {rate:>9.1f} {items / elapsed:>9.1f}")
+        print(f"FAISS saved once in {save_seconds:.1f}s ({faiss_service.index.ntotal} vectors)")
+        failed_s3 = sum(1 for future in self.s3_futures if not future.result())
+        if failed_s3:
+            print(f"{failed_s3} S3 copies failed; see s3_status on the file documents")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="extraction/chunking processes (default: all cores)")
+    parser.add_argument("--embed-workers", type=int, default=4, help="concurrent embedding requests")
+    parser.add_argument("--embed-batch", type=int, default=512, help="chunks per embedding batch, across files")
+    parser.add_argument("--insert-batch", type=int, default=5000, help="chunk documents per bulk insert")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--chunk-overlap", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="log every service call")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(processName)s %(name)s: %(message)s")
+
+    paths = sorted(
+        path for path in Path(args.directory).rglob("*")
+        if path.is_file() and not path.name.startswith(".") and path.suffix[1:].lower() in MEMBER_FILE_TYPES
+    )
+    if not paths:
+        print(f"No supported documents found in {args.directory}")
+        return
+
+    print(f"Loading {len(paths)} files from {args.directory} with {args.workers} extraction workers")
+    BulkIngest(args).run(paths)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Create and verify the MongoDB indexes, then explain the hot queries.
+
+Prints each hot query's winning plan and exits non-zero if an index is
+missing or any plan is a COLLSCAN. Meant for deploy checks and for
+confirming an index change before it ships.
+
+Usage:
+    python -m app.tools.check_indexes [--no-create]
+"""
+import argparse
+import json
+import sys
+
+from app.services.indexes import ensure_indexes, explain_hot_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-create", action="store_true", help="only verify and explain; do not create missing indexes")
+    args = parser.parse_args()
+
+    problems = ensure_indexes(create=not args.no_create)
+    for problem in problems:
+        print(f"INDEX  {problem}")
+
+    results = explain_hot_queries()
+    for result in results:
+        status = "SCAN " if result["collscan"] else "ok   "
+        sort = f" sort={result['sort']}" if result["sort"] else ""
+        print(f"{status}  {result['collection']:<14} {json.dumps(result['query'], default=str)}{sort}")
+        print(f"       {' <- '.join(result['stages'])}")
+
+    scans = sum(1 for result in results if result["collscan"])
+    if problems or scans:
+        print(f"{len(problems)} index problem(s), {scans} COLLSCAN plan(s)")
+        sys.exit(1)
+    print(f"All {len(results)} hot queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
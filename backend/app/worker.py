@@ -0,0 +1,253 @@
+"""
+Ingestion worker: claims jobs from the durable job queue and runs them.
+
+Usage:
+    python -m app.worker [--processes N]
+
+Run as many workers (on as many hosts) as needed; they coordinate through the
+job queue and share the FAISS index through S3 (FAISS_S3_KEY; with it empty,
+every worker must see the API's FAISS_INDEX_PATH directory). Each job is held under a lease that the worker keeps extending, so
+the jobs of a crashed worker are picked up again once their lease expires.
+Files left in `processing` or `queued` with no queued or running job (e.g.
+the API process died mid-ingestion, or its enqueue failed) are re-enqueued
+automatically.
+"""
+from datetime import datetime, timedelta
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+
+from app.config import settings
+from app.services.s3_service import s3_service
+from app.services.ingestion import db, files_col, LEG_KEYS, ingest_file, rechunk_file, finish_leg, mark_failed
+from app.services.archive_ingestion import ingest_archive, mark_archive_failed
+from app.services.job_queue import job_queue, keepalive, make_worker_id, global_slot
+from app.services.indexes import require_indexes
+from app.services.executors import OCR_POOL_SHARE_ENV, ocr_pool_share
+
+logger = logging.getLogger(__name__)
+
+RECOVER_INTERVAL = 60  # seconds between scans for stuck files
+
+
+def _local_copy(payload: dict, collection: str = "files") -> str:
+    """Path of the uploaded file on this host, downloading it from S3 if the
+    API's temp file is not here (other host, restart, or an earlier attempt)."""
+    temp_path = payload.get("temp_path")
+    if temp_path and os.path.exists(temp_path):
+        return temp_path
+
+    # A fresh upload's S3 copy may still be in flight on the API host
+    id_key = LEG_KEYS[collection]
+    doc = db[collection].find_one({id_key: payload[id_key]}, {"s3_status": 1})
+    s3_status = (doc or {}).get("s3_status", "uploaded")
+    if s3_status != "uploaded":
+        raise RuntimeError(f"Upload is not on this host and its S3 copy is {s3_status}")
+
+    suffix = payload.get("suffix") or f".{payload['file_type']}"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        temp_path = temp_file.name
+    logger.info(f"Downloading {payload['s3_path']} for {payload[id_key]}")
+    s3_service.download_file(s3_service.key_from_path(payload['s3_path']), temp_path)
+    return temp_path
+
+
+def handle_ingest(job: dict, final_attempt: bool):
+    payload = job["payload"]
+    temp_path = _local_copy(payload)
+    succeeded = False
+    try:
+        ingest_file(payload["file_id"], temp_path, payload["filename"], payload["file_type"],
+                    on_stage=lambda stage: job_queue.set_stage(job["job_id"], stage))
+        succeeded = True
+    finally:
+        # Copies downloaded here are always dropped. The API's temp file is kept
+        # for a retry, and otherwise released once the S3 leg is done too.
+        if temp_path != payload.get("temp_path") and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        if succeeded or final_attempt:
+            finish_leg(payload["file_id"], "index", payload.get("temp_path"))
+
+
+def handle_rechunk(job: dict, final_attempt: bool):
+    payload = job["payload"]
+    job_queue.set_stage(job["job_id"], "index")
+    rechunk_file(payload["file_id"], payload.get("chunk_size"), payload.get("chunk_overlap"))
+
+
+def handle_archive(job: dict, final_attempt: bool):
+    payload = job["payload"]
+    temp_path = _local_copy(payload, "archives")
+    succeeded = False
+    try:
+        job_queue.set_stage(job["job_id"], "index")
+        ingest_archive(payload["archive_id"], temp_path)
+        succeeded = True
+    finally:
+        if temp_path != payload.get("temp_path") and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        if succeeded or final_attempt:
+            finish_leg(payload["archive_id"], "index", payload.get("temp_path"), "archives")
+
+
+JOB_HANDLERS = {
+    "ingest": handle_ingest,
+    "rechunk": handle_rechunk,
+    "archive": handle_archive,
+}
+
+# Records a job's final failure on the document it was for
+FAILURE_HANDLERS = {
+    "archive": mark_archive_failed,
+}
+
+
+def run_job(job: dict, worker_id: str):
+    job_id = job["job_id"]
+    if job["status"] == "failed":
+        # Its final attempt lost the lease; claim() only marked it failed
+        logger.error(f"Job {job_id} failed: {job['error']}")
+        if job.get("file_id"):
+            FAILURE_HANDLERS.get(job["type"], mark_failed)(job["file_id"], job["error"])
+        return
+    final_attempt = job["attempts"] >= job["max_attempts"]
+    logger.info(f"Running {job['type']} job {job_id} (attempt {job['attempts']}/{job['max_attempts']})")
+
+    def renew():
+        if not job_queue.extend_lease(job_id, worker_id):
+            logger.warning(f"Lost the lease on job {job_id}")
+
+    try:
+        handler = JOB_HANDLERS[job["type"]]
+        with keepalive(renew, settings.JOB_LEASE_SECONDS / 3):
+            handler(job, final_attempt)
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+        if job_queue.fail(job, worker_id, str(e)):
+            logger.info(f"Job {job_id} will be retried")
+        elif job.get("file_id"):
+            FAILURE_HANDLERS.get(job["type"], mark_failed)(job["file_id"], str(e))
+        return
+
+    job_queue.complete(job_id, worker_id)
+    logger.info(f"Job {job_id} done")
+
+
+def recover_stuck_files():
+    """Re-enqueue files with no active job that sat in `processing` (their
+    ingestion died; running ones keep refreshing processing_at) or in
+    `queued` (their enqueue failed) for JOB_STUCK_AFTER seconds. Files of
+    app.tools.bulk_ingest are resumed by running the loader again instead.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=settings.JOB_STUCK_AFTER)
+    stale = {"processing": "processing_at", "queued": "queued_at"}
+    stuck = files_col.find(
+        {"$or": [
+            {"status": status, "$or": [
+                {stamp: {"$lt": cutoff}},
+                {stamp: {"$exists": False}, "created_at": {"$lt": cutoff}}
+            ]}
+            for status, stamp in stale.items()
+        ], "source": {"$ne": "bulk"}},
+        {"_id": 0, "file_id": 1, "filename": 1, "file_type": 1, "s3_path": 1, "size": 1, "archive_id": 1,
+         "status": 1}
+    )
+    for file_doc in stuck:
+        file_id = file_doc["file_id"]
+        if job_queue.has_active_job(file_id):
+            continue
+        # Archive members are retried by their archive's job while it is active
+        if file_doc.get("archive_id") and job_queue.has_active_job(file_doc["archive_id"]):
+            continue
+        # Touch the file first so concurrent workers do not enqueue it twice
+        stamp = stale[file_doc["status"]]
+        result = files_col.update_one(
+            {"file_id": file_id, "status": file_doc["status"], "$or": [
+                {stamp: {"$lt": cutoff}}, {stamp: {"$exists": False}}
+            ]},
+            {"$set": {stamp: now}}
+        )
+        if result.modified_count != 1:
+            continue
+        logger.warning(f"File {file_id} was stuck in {file_doc['status']}; re-enqueueing")
+        job_queue.enqueue("ingest", {
+            "file_id": file_id,
+            "temp_path": None,
+            "filename": file_doc["filename"],
+            "file_type": file_doc["file_type"],
+            "s3_path": file_doc["s3_path"],
+            "size": file_doc["size"]
+        }, file_id=file_id)
+
+
+def run_worker():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(name)s: %(message)s")
+    worker_id = make_worker_id()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    logger.info(f"Worker {worker_id} started")
+
+    last_recover = 0.0
+    while not stop.is_set():
+        if time.monotonic() - last_recover >= RECOVER_INTERVAL:
+            try:
+                recover_stuck_files()
+            except Exception as e:
+                logger.error(f"Recovering stuck files failed: {e}")
+            last_recover = time.monotonic()
+
+        job = None
+        try:
+            # JOB_MAX_RUNNING caps running jobs across all workers, however many there are
+            with global_slot("jobs", settings.JOB_MAX_RUNNING):
+                job = job_queue.claim(worker_id)
+                if job is not None:
+                    run_job(job, worker_id)
+        except Exception as e:
+            logger.error(f"Claiming a job failed: {e}")
+
+        if job is None:
+            stop.wait(settings.JOB_POLL_INTERVAL)
+
+    logger.info(f"Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ingestion workers")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of worker processes to run on this host")
+    args = parser.parse_args()
+
+    if settings.MONGO_ENSURE_INDEXES:
+        require_indexes()
+
+    if args.processes <= 1:
+        run_worker()
+        return
+
+    # Spawned, not forked, so each worker opens its own database connections.
+    # They inherit the environment: the OCR workers of this host are split between them
+    os.environ[OCR_POOL_SHARE_ENV] = str(ocr_pool_share() * args.processes)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ from ws_client import WebSocketClient
 
 # Config
 API_URL = "http://localhost:8000"
+WS_URL = "ws://localhost:8000"
+PROGRESS_RETRY_SECONDS = 5  # wait before reconnecting when /ws/progress is unavailable
 
 # Initialize session state
 if "conversation_id" not in st.session_state:
@@ -27,6 +29,18 @@ if "deleting_files" not in st.session_state:
 if "uploader_key" not in st.session_state:
     st.session_state.uploader_key = 0
 
+# Identifies this browser session to the backend's per-client upload quotas
+if "client_id" not in st.session_state:
+    st.session_state.client_id = str(uuid.uuid4())
+
+# Cited chunk text by chunk_id, fetched once from /chunks
+if "chunk_cache" not in st.session_state:
+    st.session_state.chunk_cache = {}
+
+# Last progress bar state (value, text) by file_id, carried across reruns
+if "progress_state" not in st.session_state:
+    st.session_state.progress_state = {}
+
 # Page config
 st.set_page_config(
     page_title="NotebookLM-like Demo",
@@ -158,33 +172,126 @@ st.title("📚 NotebookLM-like Demo")
 st.markdown("Upload tài liệu và hỏi đáp với AI - Powered by RAG + OCR")
 
 # Helper functions
-def upload_file_parallel(file, file_key):
+def upload_file_parallel(file, file_key, client_id):
     """Upload a single file - runs in thread worker."""
     try:
         files = [("files", (file.name, file.getvalue(), file.type))]
-        response = requests.post(f"{API_URL}/upload/batch", files=files, timeout=60)
+        response = requests.post(f"{API_URL}/upload/batch", files=files,
+                                 headers={"X-Client-Id": client_id}, timeout=60)
         
         if response.status_code == 200:
             return {"status": "success", "file_key": file_key, "data": response.json()}
+        elif response.status_code == 429:
+            retry_after = response.headers.get("Retry-After", "?")
+            return {"status": "error", "file_key": file_key,
+                    "message": f"Hàng đợi đầy, thử lại sau {retry_after}s"}
         else:
             return {"status": "error", "file_key": file_key, "message": response.text[:100]}
     except Exception as e:
         return {"status": "error", "file_key": file_key, "message": str(e)[:100]}
 
+# Only the fields the sidebar shows
+FILE_LIST_FIELDS = "file_id,filename,status,chunks_count,total_page,error"
+
 def get_files():
-    """Fetch files from backend."""
+    """Fetch files from backend, page by page.
+    The listing is revalidated with its ETag: unchanged files come back as 304
+    and the cached list is reused.
+    """
+    cached = st.session_state.get("files_cache")
     try:
-        response = requests.get(f"{API_URL}/files", timeout=5)
-        if response.status_code == 200:
-            return response.json().get("files", [])
+        params = {"fields": FILE_LIST_FIELDS, "limit": 1000}
+        headers = {"If-None-Match": cached["etag"]} if cached and cached["etag"] else {}
+        response = requests.get(f"{API_URL}/files", params=params, headers=headers, timeout=5)
+        if response.status_code == 304:
+            return cached["files"]
+        if response.status_code != 200:
+            return cached["files"] if cached else []
+        
+        data = response.json()
+        files = data.get("files", [])
+        while data.get("next_cursor"):
+            data = requests.get(f"{API_URL}/files", params={**params, "cursor": data["next_cursor"]},
+                                timeout=5).json()
+            files.extend(data.get("files", []))
+        st.session_state.files_cache = {"etag": response.headers.get("ETag"), "files": files}
+        if cached:
+            # A file was updated, renamed or deleted: cited chunks may have changed too
+            st.session_state.chunk_cache = {}
+        return files
     except:
+        return cached["files"] if cached else []
+
+# Share of the progress bar covered by each ingestion stage
+STAGE_SPAN = {"extract": (0.0, 0.6), "embed": (0.6, 0.95), "index": (0.95, 1.0)}
+STAGE_LABEL = {"extract": "Trích xuất trang", "ocr": "OCR", "embed": "Embedding", "index": "Đánh chỉ mục"}
+
+def watch_progress(pending_files, bars):
+    """Follow ingestion progress over one /ws/progress connection until a pending file finishes.
+    pending_files: {file_id: filename}; bars: {file_id: st.progress}
+    Runs last on the page. While idle it re-renders a bar: Streamlit stops the
+    script at such calls when the user interacts, so the page stays responsive.
+    Returns once a file is indexed or failed (the caller reruns to refresh the
+    file list), or PROGRESS_RETRY_SECONDS after the connection failed.
+    """
+    states = st.session_state.progress_state
+    first = next(iter(pending_files))
+
+    def keep_responsive():
+        bars[first].progress(*states.get(first, (0.0, pending_files[first])))
+
+    ws_client = WebSocketClient(f"{WS_URL}/ws/progress?file_ids={','.join(pending_files)}")
+    try:
+        ws_client.connect(timeout=0.5)
+        for message in ws_client.receive_events(on_idle=keep_responsive):
+            if message.get("type") == "snapshot":
+                if any(file_doc.get("status") in ("indexed", "failed") for file_doc in message["content"]):
+                    return
+            elif message.get("type") == "progress":
+                event = message["content"]
+                file_id = event.get("file_id")
+                stage = event.get("stage")
+                if stage in ("done", "failed") and file_id in pending_files:
+                    return
+                if file_id in bars:
+                    done, total = event.get("done"), event.get("total")
+                    start, end = STAGE_SPAN.get(stage, (0.0, 0.6))
+                    fraction = start + (end - start) * (done / total) if done and total else start
+                    text = f"{pending_files[file_id]} · {STAGE_LABEL.get(stage, stage)} {done or 0}"
+                    if total:
+                        text += f"/{total}"
+                    if event.get("eta_seconds"):
+                        text += f" · còn ~{int(event['eta_seconds'])}s"
+                    states[file_id] = (min(fraction, 1.0), text)
+                    bars[file_id].progress(*states[file_id])
+    except Exception:
+        # Progress is best effort; retry below
         pass
-    return []
+    finally:
+        ws_client.close()
+    # Connection failed or dropped: wait before reconnecting, staying responsive
+    deadline = time.time() + PROGRESS_RETRY_SECONDS
+    while time.time() < deadline:
+        time.sleep(0.5)
+        keep_responsive()
+
+def hydrate_sources(sources):
+    """Sources arrive as chunk references; add filename, title and text for the tooltips."""
+    cache = st.session_state.chunk_cache
+    missing = [s["chunk_id"] for s in sources if s["chunk_id"] not in cache]
+    if missing:
+        try:
+            response = requests.get(f"{API_URL}/chunks", params={"ids": ",".join(dict.fromkeys(missing))}, timeout=5)
+            if response.status_code == 200:
+                cache.update(response.json().get("chunks", {}))
+        except:
+            pass
+    return [{**cache.get(s["chunk_id"], {}), **s} for s in sources]
 
 def render_answer_with_citations(answer_text, sources):
     """Render answer with citation references and hover tooltips."""
     if sources:
-        answer_html = make_answer_html(answer_text, sources)
+        answer_html = make_answer_html(answer_text, hydrate_sources(sources))
         components.html(build_answer_html(answer_html), height=600, scrolling=False)
     else:
         st.markdown(answer_text)
@@ -319,12 +426,11 @@ with st.sidebar:
         files_to_delete = list(st.session_state.deleting_files.copy())
         
         def cleanup_deleted_files(file_ids):
-            for file_id in file_ids:
-                try:
-                    # Fire and forget - no timeout wait
-                    requests.delete(f"{API_URL}/files/{file_id}", timeout=0.5)
-                except:
-                    pass  # Ignore all errors
+            try:
+                # One batch request: the backend saves the FAISS index once for all files
+                requests.post(f"{API_URL}/files/delete", json={"file_ids": file_ids}, timeout=0.5)
+            except:
+                pass  # Ignore all errors
         
         # Start cleanup thread immediately, don't wait
         cleanup_thread = threading.Thread(target=cleanup_deleted_files, args=(files_to_delete,), daemon=True)
@@ -346,7 +452,8 @@ with st.sidebar:
         
         with st.spinner(f"⏳ Đang upload {len(uploaded_files)} file..."):
             with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                futures = {executor.submit(upload_file_parallel, file, f"{file.name}_{file.size}"): file 
+                futures = {executor.submit(upload_file_parallel, file, f"{file.name}_{file.size}",
+                                           st.session_state.client_id): file 
                           for file in uploaded_files}
                 
                 success_count = 0
@@ -368,9 +475,8 @@ with st.sidebar:
         if error_count > 0:
             st.error(f"❌ Upload thất bại: {error_count} file")
         
-        # Reset file uploader and refresh file list
+        # Reset file uploader and refresh file list (progress is pushed over WebSocket)
         st.session_state.uploader_key += 1
-        time.sleep(0.5)  # Wait for backend to process
         st.rerun()
     
     st.divider()
@@ -393,11 +499,17 @@ with st.sidebar:
     # Filter out files being deleted (optimistic UI - hide immediately)
     files = [f for f in files if f.get("file_id") not in st.session_state.deleting_files]
     
+    # Files whose progress is watched at the end of the page
+    pending_files = {
+        f["file_id"]: f.get("filename", "Unknown")
+        for f in files if f.get("status") in ("uploaded", "queued", "processing")
+    }
+    
     if files:
         st.markdown("**Chọn file làm nguồn:**")
         
         # Sort: indexed first
-        status_order = {"indexed": 0, "processing": 1, "uploaded": 2, "failed": 3}
+        status_order = {"indexed": 0, "processing": 1, "queued": 2, "uploaded": 3, "failed": 4}
         files_sorted = sorted(files, key=lambda x: status_order.get(x.get("status", ""), 99))
         
         for file in files_sorted:
@@ -408,6 +520,7 @@ with st.sidebar:
             status_emoji = {
                 "indexed": "✅",
                 "processing": "⏳",
+                "queued": "🕒",
                 "uploaded": "📤",
                 "failed": "❌"
             }.get(status, "❓")
@@ -432,13 +545,17 @@ with st.sidebar:
                     st.text(f"{status_emoji} {filename}")
                     if status == "processing":
                         st.caption("⏳ Đang xử lý...")
+                    elif status == "queued":
+                        st.caption("🕒 Đang xếp hàng chờ xử lý...")
                     elif status == "uploaded":
                         st.caption("📤 Đang chờ xử lý...")
                     elif status == "failed":
                         st.caption(f"❌ {file.get('error', '')[:30]}...")
             
             with col_b:
-                if st.button("×", key=f"del_{file_id}", help="Xóa file", type="secondary"):
+                # The backend refuses to delete files that are still being processed
+                if st.button("×", key=f"del_{file_id}", help="Xóa file", type="secondary",
+                             disabled=status in ("queued", "processing")):
                     # ONLY mark for deletion - NO API call here
                     st.session_state.deleting_files.add(file_id)
                     if file_id in st.session_state.selected_files:
@@ -522,7 +639,7 @@ if prompt := st.chat_input("Đặt câu hỏi về tài liệu..."):
                         msg_placeholder.empty()
                         if sources:
                             components.html(
-                                build_answer_html(make_answer_html(full_answer, sources)), 
+                                build_answer_html(make_answer_html(full_answer, hydrate_sources(sources))), 
                                 height=600, 
                                 scrolling=False
                             )
@@ -557,3 +674,18 @@ with col3:
         st.session_state.conversation_id = str(uuid.uuid4())
         st.session_state.messages = []
         st.rerun()
+
+# Live ingestion progress: follow pushed events on one connection, and rerun
+# only when a file finishes, to refresh the file list
+if pending_files:
+    states = st.session_state.progress_state
+    for file_id in [file_id for file_id in states if file_id not in pending_files]:
+        del states[file_id]
+    with st.sidebar:
+        st.caption("⏳ Tiến độ xử lý")
+        progress_bars = {
+            file_id: st.progress(*states.get(file_id, (0.0, name)))
+            for file_id, name in pending_files.items()
+        }
+    watch_progress(pending_files, progress_bars)
+    st.rerun()
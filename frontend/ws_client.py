@@ -1,5 +1,6 @@
 import websocket
 import json
+import time
 from typing import Generator
 
 
@@ -8,11 +9,11 @@ class WebSocketClient:
         self.url = url
         self.ws = None
     
-    def connect(self):
-        """Connect to WebSocket."""
+    def connect(self, timeout: float = 5):
+        """Connect to WebSocket. timeout bounds each receive."""
         # Set very short timeout for real-time streaming
         self.ws = websocket.WebSocket()
-        self.ws.settimeout(5)  # Shorter timeout for faster updates
+        self.ws.settimeout(timeout)  # Shorter timeout for faster updates
         self.ws.connect(self.url)
     
     def send(self, message: str):
@@ -60,6 +61,26 @@ class WebSocketClient:
                 yield {"type": "error", "content": str(e)}
                 break
     
+    def receive_events(self, until: float = None, on_idle=None) -> Generator[dict, None, None]:
+        """Yield each JSON message until the connection closes (for push feeds like /ws/progress),
+        or until the time.time() deadline `until` (checked at each receive timeout).
+        on_idle is called at each receive timeout.
+        """
+        while True:
+            try:
+                raw_data = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                if until is not None and time.time() >= until:
+                    break
+                if on_idle:
+                    on_idle()
+                continue
+            except Exception:
+                break
+            if not raw_data:
+                break
+            yield json.loads(raw_data)
+    
     def close(self):
         """Close WebSocket connection."""
         if self.ws:
@@ -1,23 +1,26 @@
 @echo off
 echo ========================================
-echo Starting BOTH Backend and Frontend
+echo Starting Backend, Worker and Frontend
 echo ========================================
 echo.
-echo This will open 2 terminal windows:
+echo This will open 3 terminal windows:
 echo 1. Backend (FastAPI) on port 8000
-echo 2. Frontend (Streamlit) on port 8501
+echo 2. Ingestion worker (processes uploaded files)
+echo 3. Frontend (Streamlit) on port 8501
 echo.
 pause
 
 start cmd /k "cd /d D:\Dự án TT\notebooklm\backend && venv\Scripts\activate.bat && python -m app.main"
 
+start cmd /k "cd /d D:\Dự án TT\notebooklm\backend && venv\Scripts\activate.bat && python -m app.worker"
+
 timeout /t 5
 
 start cmd /k "cd /d D:\Dự án TT\notebooklm\frontend && venv\Scripts\activate.bat && streamlit run app.py"
 
 echo.
 echo ========================================
-echo Both servers are starting...
+echo Backend, worker and frontend are starting...
 echo Backend: http://localhost:8000
 echo Frontend: http://localhost:8501
 echo ========================================
@@ -0,0 +1,13 @@
+@echo off
+echo ========================================
+echo Starting Ingestion Worker
+echo ========================================
+cd /d "D:\Dự án TT\notebooklm\backend"
+
+echo Activating virtual environment...
+call venv\Scripts\activate.bat
+
+echo Starting worker...
+python -m app.worker
+
+pause